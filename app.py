@@ -1,9 +1,14 @@
 from PySide6.QtWidgets import QWidget, QFrame, QVBoxLayout, QHBoxLayout, QTabWidget, QLabel, QPushButton, QFileDialog, QSizePolicy, QMessageBox
+from PySide6.QtCore import QTimer
 from records import Database, emptyDB
-from utils import newHLine
+from utils import newHLine, startfile
 
+import importlib
 import os
 
+# how often to check whether the journal should be folded into the file
+COMPACT_INTERVAL = 60 * 1000
+
 def createTab():
     tab = QWidget()
     label = QLabel("TODO")
@@ -12,9 +17,44 @@ def createTab():
     tab.setLayout(layout)
     return tab
 
+# Holds the place of a tab in the QTabWidget until it is first shown, so
+# a tab only builds its table once someone looks at it.  Refreshing a tab
+# that was never built does nothing: building it reads the database as it
+# is then.
+class LazyTab(QWidget):
+    def __init__(self, mainApp, module, name) -> None:
+        super().__init__()
+        self.mainApp = mainApp
+        self.module = module
+        self.name = name
+        self.tab = None
+        layout = QVBoxLayout(self)
+        layout.setContentsMargins(0, 0, 0, 0)
+        self.setLayout(layout)
+
+    def build(self):
+        if self.tab == None:
+            self.tab = getattr(importlib.import_module(self.module), self.name)(self.mainApp)
+            self.layout().addWidget(self.tab)
+        return self.tab
+
+    def refreshTable(self):
+        if not self.tab == None:
+            self.tab.refreshTable()
+
+    def refreshTab(self):
+        if not self.tab == None:
+            self.tab.refreshTab()
+
+    def onChange(self, event):
+        if not self.tab == None:
+            self.tab.onChange(event)
+
 class MainWindow(QWidget):
     def __init__(self, db: Database = None):
         super().__init__()
+        # called once the window has first been painted (see main.py)
+        self.firstPaint = None
         self.setWindowTitle("Algorithmic Nexus for Information and Knowledge Analysis")
         if db == None:
             self.db = emptyDB()
@@ -23,92 +63,240 @@ class MainWindow(QWidget):
         
         from file_manager import FileManager
         self.fileManager = FileManager(self)
+        self.worker = None
 
         self.resize(1280, 720)
 
         # Create a QTabWidget
         self.tab_widget = QTabWidget()
 
-        # Add tabs to the QTabWidget
-        from parts_tab import PartsTab
-        self.partsTab = PartsTab(self)
+        # Add tabs to the QTabWidget; each is built on first activation
+        self.partsTab = LazyTab(self, "parts_tab", "PartsTab")
         self.tab_widget.addTab(self.partsTab, "Parts")
-        from mixtures_tab import MixturesTab
-        self.mixturesTab = MixturesTab(self)
+        self.mixturesTab = LazyTab(self, "mixtures_tab", "MixturesTab")
         self.tab_widget.addTab(self.mixturesTab, "Mixtures")
-        from materials_tab import MaterialsTab
-        self.materialsTab = MaterialsTab(self)
+        self.materialsTab = LazyTab(self, "materials_tab", "MaterialsTab")
         self.tab_widget.addTab(self.materialsTab, "Materials")
-        from packaging_tab import PackagingTab
-        self.packagingTab = PackagingTab(self)
+        self.packagingTab = LazyTab(self, "packaging_tab", "PackagingTab")
         self.tab_widget.addTab(self.packagingTab, "Packaging")
-        from globals_tab import GlobalsTab
-        self.globalsTab = GlobalsTab(self)
+        self.globalsTab = LazyTab(self, "globals_tab", "GlobalsTab")
         self.tab_widget.addTab(self.globalsTab, "Globals")
+        # the tab in view is built once the window has been painted
+        self.painted = False
+        self.tab_widget.currentChanged.connect(lambda index: self.buildTab(index) if self.painted else None)
+        # the tabs follow every change to the database (see changes.py)
+        self.watched: Database = None
+        self.watchDatabase()
 
         self.openButton = QPushButton("Open Database")
         self.openButton.clicked.connect(self.open)
         self.saveButton = QPushButton("Save Database")
         self.saveButton.setEnabled(not self.fileManager.filePath == None)
-        self.saveButton.clicked.connect(self.save)
+        self.saveButton.clicked.connect(lambda: self.save())
         self.saveAsButton = QPushButton("Save Database As")
         self.saveAsButton.clicked.connect(self.saveAs)
+        self.exportButton = QPushButton("Export to Excel")
+        self.exportButton.clicked.connect(self.exportExcel)
         
         hlayout = QHBoxLayout()
         hlayout.addWidget(self.openButton)
         hlayout.addWidget(self.saveButton)
         hlayout.addWidget(self.saveAsButton)
+        hlayout.addWidget(self.exportButton)
 
         hline = newHLine(1)
 
         self.dbFileLabel = QLabel()
         self.setFileLabel()
 
+        from report_worker import ReportQueue
+        self.reports = ReportQueue(self)
+        self.reports.changed.connect(self.showReports)
+        self.reports.finished.connect(self.reportDone)
+        self.reportLabel = QLabel()
+        self.cancelReportButton = QPushButton("Cancel Report")
+        self.cancelReportButton.clicked.connect(self.reports.cancel)
+        self.cancelAllButton = QPushButton("Cancel All Reports")
+        self.cancelAllButton.clicked.connect(self.reports.cancelAll)
+        self.reportLayout = QHBoxLayout()
+        self.reportLayout.addWidget(self.reportLabel)
+        self.reportLayout.addWidget(self.cancelReportButton)
+        self.reportLayout.addWidget(self.cancelAllButton)
+        self.showReports()
+
         # Create a layout for the main window
         layout = QVBoxLayout(self)
         layout.addWidget(self.tab_widget)
         layout.addWidget(hline)
         layout.addLayout(hlayout)
         layout.addWidget(self.dbFileLabel)
+        layout.addLayout(self.reportLayout)
 
         # Set the layout for the main window
         self.setLayout(layout)
+
+        self.compactTimer = QTimer(self)
+        self.compactTimer.timeout.connect(self.compact)
+        self.compactTimer.start(COMPACT_INTERVAL)
     
+    def paintEvent(self, event):
+        super().paintEvent(event)
+        if not self.painted:
+            self.painted = True
+            QTimer.singleShot(0, lambda: self.buildTab(self.tab_widget.currentIndex()))
+        if not self.firstPaint == None:
+            firstPaint, self.firstPaint = self.firstPaint, None
+            firstPaint()
+
+    def buildTab(self, index):
+        if index >= 0:
+            self.tab_widget.widget(index).build()
+
     def setFileLabel(self):
         self.dbFileLabel.setText(f"File: {self.fileManager.filePath}")
 
+    def setBusy(self, busy):
+        self.openButton.setEnabled(not busy)
+        self.saveButton.setEnabled(not busy and not self.fileManager.filePath == None)
+        self.saveAsButton.setEnabled(not busy)
+        self.exportButton.setEnabled(not busy)
+
+    def showProgress(self, table, done, total):
+        self.dbFileLabel.setText(f"File: {self.fileManager.filePath} ({table}: {done} / {total})")
+
+    # Loads and saves run on a FileWorker thread; its done signal comes back
+    # to loadDone / saveDone on the GUI thread.
+    def startWorker(self, mode, snap = None, notify = True):
+        from file_worker import FileWorker
+        self.worker = FileWorker(self.fileManager, mode, snap)
+        self.worker.progress.connect(self.showProgress)
+        if mode == "load":
+            self.worker.done.connect(self.loadDone)
+        else:
+            self.worker.done.connect(lambda success, result: self.saveDone(snap, success, notify))
+        self.setBusy(True)
+        self.worker.start()
+
+    def endWorker(self):
+        self.worker.wait()
+        self.worker = None
+        self.setFileLabel()
+        self.setBusy(False)
+
+    # Folds a long journal into the file with a quiet save.  The saved file
+    # then holds what replaying the journal would have produced anyway.
+    def compact(self):
+        if self.worker == None and self.fileManager.needsCompaction():
+            self.save(False)
+
+    # don't let a save be cut off by closing the window
+    def closeEvent(self, event):
+        if not self.worker == None:
+            self.worker.wait()
+        self.reports.stop()
+        super().closeEvent(event)
+
     def open(self):
-        self.openButton.setEnabled(False)
-        self.saveButton.setEnabled(False)
-        self.saveAsButton.setEnabled(False)
+        self.setBusy(True)
         dbFile  = QFileDialog.getOpenFileName(self, "Open Database", os.path.expanduser("~"), "Database (*.db)")
-        if not dbFile[0] == "":
-            if self.fileManager.setFile(dbFile[0]):
-                self.fileManager.loadFile()
-        self.setFileLabel()
-        self.openButton.setEnabled(True)
-        self.saveButton.setEnabled(not self.fileManager.filePath == None)
-        self.saveAsButton.setEnabled(True)
+        if not dbFile[0] == "" and self.fileManager.setFile(dbFile[0]):
+            if self.fileManager.isLarge():
+                self.fileManager.loadLazy()
+                self.setFileLabel()
+                self.setBusy(False)
+                self.refreshTabs()
+                self.showRecovered()
+            else:
+                # the tabs still show the old database until the load is done
+                self.tab_widget.setEnabled(False)
+                self.startWorker("load")
+        else:
+            self.setFileLabel()
+            self.setBusy(False)
+
+    def loadDone(self, success, db):
+        self.endWorker()
+        self.tab_widget.setEnabled(True)
+        if not success:
+            # open() already moved the file manager to the new file, so a
+            # save would write the old database over it; start over with an
+            # empty one instead.  Unsaved changes of the old database are
+            # still in its own file's journal.
+            self.fileManager.forget()
+            self.db = emptyDB()
+            self.refreshTabs()
+            self.setFileLabel()
+            self.setBusy(False)
+            QMessageBox.critical(self, "Error!", "Load failed!")
+            return
+        self.fileManager.finishLoad(db)
+        self.refreshTabs()
+        self.showRecovered()
+
+    def showRecovered(self):
+        if self.fileManager.recovered > 0:
+            QMessageBox.information(self, "Recovered", f"Recovered {self.fileManager.recovered} unsaved changes.")
+
+    def watchDatabase(self):
+        if not self.watched is self.db:
+            if not self.watched == None:
+                self.watched.changes.unsubscribe(self.onChange)
+            self.db.changes.subscribe(self.onChange)
+            self.watched = self.db
+
+    def onChange(self, event):
+        for index in range(self.tab_widget.count()):
+            self.tab_widget.widget(index).onChange(event)
+
+    def refreshTabs(self):
+        self.watchDatabase()
         self.materialsTab.refreshTable()
         self.mixturesTab.refreshTable()
         self.packagingTab.refreshTable()
         self.partsTab.refreshTable()
         self.globalsTab.refreshTab()
     
-    def save(self):
+    def save(self, notify = True):
         assert(not self.fileManager.filePath == None)
-        self.fileManager.saveFile()
-        QMessageBox.information(self, "Success", "Save successful!")
+        self.startWorker("save", self.fileManager.snapshot(), notify)
+
+    def saveDone(self, snap, success, notify):
+        self.endWorker()
+        self.fileManager.finishSave(snap, success)
+        if not success:
+            QMessageBox.critical(self, "Error!", "Save failed!")
+        elif notify:
+            QMessageBox.information(self, "Success", "Save successful!")
 
     def saveAs(self):
-        self.openButton.setEnabled(False)
-        self.saveButton.setEnabled(False)
-        self.saveAsButton.setEnabled(False)
+        self.setBusy(True)
         dbFile  = QFileDialog.getSaveFileName(self, "Save Database As", os.path.expanduser("~"), "Database (*.db)")
-        if not dbFile[0] == "":
-            if self.fileManager.setFile(dbFile[0]):
-                self.fileManager.saveFile()
-        self.setFileLabel()
-        self.openButton.setEnabled(True)
-        self.saveButton.setEnabled(not self.fileManager.filePath == None)
-        self.saveAsButton.setEnabled(True)
+        if not dbFile[0] == "" and self.fileManager.setFile(dbFile[0], True):
+            self.save(False)
+        else:
+            self.setFileLabel()
+            self.setBusy(False)
+
+    def exportExcel(self):
+        exportFile = QFileDialog.getSaveFileName(self, "Export to Excel", os.path.expanduser("~"), "Excel Workbook (*.xlsx)")
+        if not exportFile[0] == "":
+            from excel_export import ExcelExport
+            try:
+                ExcelExport(self.db, exportFile[0]).write()
+            except Exception as e:
+                print(f"Export error: {repr(e)}")
+                QMessageBox.critical(self, "Error!", "Export failed!")
+
+    # Reports run in the background (see report_worker.py), one at a time.
+    def showReports(self):
+        busy = self.reports.busy()
+        self.reportLabel.setText(self.reports.status())
+        self.reportLabel.setVisible(busy)
+        self.cancelReportButton.setVisible(busy)
+        self.cancelAllButton.setVisible(busy and len(self.reports.pending) > 0)
+
+    def reportDone(self, path, result):
+        if result == "done":
+            startfile(path)
+        elif result == "failed":
+            QMessageBox.critical(self, "Error!", f"Report {path} failed!")
@@ -0,0 +1,63 @@
+import functools
+
+# Memoization with dependency tracking.  Inputs are (record, field) tokens;
+# a cached value remembers every token and every other cached value it read
+# while being computed, and is evicted as soon as any of them changes.
+class Cache:
+    def __init__(self) -> None:
+        self.values = {}
+        self.dependents: dict[object, set] = {}
+        self.active = []
+
+    def read(self, token):
+        if len(self.active) > 0:
+            self.dependents.setdefault(token, set()).add(self.active[-1])
+
+    def get(self, key, compute):
+        self.read(key)
+        if key in self.values:
+            return self.values[key]
+        self.active.append(key)
+        try:
+            val = compute()
+        finally:
+            self.active.pop()
+        self.values[key] = val
+        return val
+
+    def invalidate(self, token):
+        pending = [token]
+        while len(pending) > 0:
+            key = pending.pop()
+            self.values.pop(key, None)
+            pending.extend(self.dependents.pop(key, ()))
+
+    # Drops dependents that no longer have a cached value, so records that
+    # went out of use are not kept alive by the dependency sets.
+    def prune(self):
+        for token in list(self.dependents):
+            keys = {key for key in self.dependents[token] if key in self.values}
+            if len(keys) > 0:
+                self.dependents[token] = keys
+            else:
+                del self.dependents[token]
+
+    def clear(self):
+        self.values.clear()
+        self.dependents.clear()
+
+def cached(*fields, globals: list[str] = []):
+    def decorator(method):
+        name = method.__name__
+
+        @functools.wraps(method)
+        def wrapper(self, *args):
+            if self.db == None:
+                return method(self, *args)
+            def compute():
+                self.use(*fields)
+                self.db.globals.use(*globals)
+                return method(self, *args)
+            return self.db.cache.get((self, name) + args, compute)
+        return wrapper
+    return decorator
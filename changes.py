@@ -0,0 +1,68 @@
+from contextlib import contextmanager
+
+# order in which a batch sends its events
+ACTIONS = ["added", "changed", "removed"]
+
+# Records of one table that were "added", "changed" or "removed".  kind is
+# a Database table, or "globals" with the names of the globals as both ids
+# and names.  names[i] is the name of the record with ids[i] as of the
+# change; fields are the changed fields, empty for adds and removes.
+class ChangeEvent:
+    def __init__(self, kind, action, ids, names, fields) -> None:
+        self.kind = kind
+        self.action = action
+        self.ids = ids
+        self.names = names
+        self.fields = fields
+
+    def __str__(self) -> str:
+        return "({} {} | {} | {})".format(self.kind, self.action, ", ".join(str(name) for name in self.names), ", ".join(self.fields))
+
+# Tells every subscriber about every change made to a Database.  Changes
+# made inside batch() are merged per table and action, and sent once the
+# outermost batch ends (adds first, removes last), so an edit that sets
+# many fields of a new record arrives as one "added" and one "changed"
+# event for the finished record.  A subscriber that fails is reported and
+# does not stop the change.
+class ChangeBus:
+    def __init__(self) -> None:
+        self.subscribers = []
+        self.depth = 0
+        # (kind, action) -> (id -> name, fields), in the order first seen
+        self.pending: dict[tuple, tuple[dict, dict]] = {}
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def unsubscribe(self, callback):
+        if callback in self.subscribers:
+            self.subscribers.remove(callback)
+
+    def emit(self, kind, action, id, name, fields = ()):
+        if len(self.subscribers) == 0:
+            return
+        if self.depth > 0:
+            names, changed = self.pending.setdefault((kind, action), ({}, {}))
+            names[id] = name
+            changed.update(dict.fromkeys(fields))
+        else:
+            self.send(ChangeEvent(kind, action, [id], [name], list(fields)))
+
+    @contextmanager
+    def batch(self):
+        self.depth += 1
+        try:
+            yield
+        finally:
+            self.depth -= 1
+            if self.depth == 0:
+                pending, self.pending = self.pending, {}
+                for (kind, action), (names, fields) in sorted(pending.items(), key = lambda item: ACTIONS.index(item[0][1])):
+                    self.send(ChangeEvent(kind, action, list(names), list(names.values()), list(fields)))
+
+    def send(self, event: ChangeEvent):
+        for callback in list(self.subscribers):
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Change error: {event} {repr(e)}")
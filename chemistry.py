@@ -0,0 +1,79 @@
+import numpy as np
+
+from records import Database
+
+# Chemistry and sizing of every mixture from one mixture x material weight
+# matrix and one material x property matrix.  Missing material values make
+# the mixture value missing (None) for that property only.
+class MixtureAnalysis:
+    chemistry = ["SiO2", "Al2O3", "Fe2O3", "TiO2", "Li2O", "P2O5", "Na2O", "CaO", "K2O", "MgO"]
+    sizing = ["Plus50", "Sub50Plus100", "Sub100Plus200", "Sub200Plus325", "Sub325"]
+    props = chemistry + ["LOI"] + sizing
+
+    def __init__(self, db: Database, names: list[str] = None) -> None:
+        self.db = db
+        self.names = list(db.mixtures.keys() if names == None else names)
+        self.index = {name: i for i, name in enumerate(self.names)}
+        self.propIndex = {prop: i for i, prop in enumerate(self.props)}
+        self.compute()
+
+    def compute(self):
+        db = self.db
+        matIds = list(dict.fromkeys(mat for name in self.names for mat in db.mixtures[name].materialIds))
+        matIndex = {mat: i for i, mat in enumerate(matIds)}
+
+        weights = np.zeros((len(self.names), len(matIds)))
+        for row, name in enumerate(self.names):
+            mix = db.mixtures[name]
+            for i in range(len(mix.materialIds)):
+                weights[row, matIndex[mix.materialIds[i]]] += mix.weights[i]
+        self.batchWeights = weights.sum(axis=1)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            weights /= self.batchWeights[:, None]
+
+        # materials the importer could not resolve, or since deleted, have
+        # every value missing, like their cost in CostTable
+        materials = [db.byId["materials"].get(mat) for mat in matIds]
+        values = np.array([[np.nan if material == None or getattr(material, prop) == None else getattr(material, prop) for prop in self.props] for material in materials], dtype=float).reshape(len(materials), len(self.props))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            corrected = values / (1 - values[:, [self.propIndex["LOI"]]] / 100)
+
+        used = weights > 0
+        self.raw = self.propagate(weights, used, values)
+        self.corrected = self.propagate(weights, used, corrected)
+
+    def propagate(self, weights, used, values):
+        missing = np.isnan(values)
+        res = weights @ np.where(missing, 0, values)
+        res[(used.astype(float) @ missing.astype(float)) > 0] = np.nan
+        return res
+
+    # Recomputes the named mixtures, adding the ones not analysed yet.
+    def update(self, names):
+        if len(names) == 0:
+            return
+        fresh = MixtureAnalysis(self.db, names)
+        added = [name for name in dict.fromkeys(names) if not name in self.index]
+        for name in added:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        if len(added) > 0:
+            self.batchWeights = np.append(self.batchWeights, np.full(len(added), np.nan))
+            self.raw = np.vstack([self.raw, np.full((len(added), len(self.props)), np.nan)])
+            self.corrected = np.vstack([self.corrected, np.full((len(added), len(self.props)), np.nan)])
+        rows = [self.index[name] for name in names]
+        self.batchWeights[rows] = fresh.batchWeights
+        self.raw[rows] = fresh.raw
+        self.corrected[rows] = fresh.corrected
+
+    def getProp(self, name, prop, LOI = True):
+        table = self.corrected if LOI else self.raw
+        val = table[self.index[name], self.propIndex[prop]]
+        return None if np.isnan(val) else float(val)
+
+    def getBatchWeight(self, name):
+        return float(self.batchWeights[self.index[name]])
+
+    def format(self, name, prop, LOI = True, spec = "{:.2f}%"):
+        val = self.getProp(name, prop, LOI)
+        return spec.format(val) if not val == None else "N/A"
@@ -0,0 +1,102 @@
+import argparse
+import csv
+import json
+import math
+import os
+import sys
+
+from file_manager import FileManager
+from cost_table import CostTable, costChunks
+
+# Batch costing without the GUI: opens every database file given, costs
+# every part and writes the results next to each other in the output
+# directory.  Nothing imported from here pulls in Qt.
+
+# Stands in for the MainWindow as the owner of a FileManager.
+class Headless:
+    def __init__(self) -> None:
+        self.db = None
+
+# Opens path read only, replaying its journal as the GUI would but leaving
+# the file, its schema and its journal as they are; the database is
+# fileManager.mainApp.db until fileManager.close().
+def openDatabase(path):
+    fileManager = FileManager(Headless())
+    if not os.path.isfile(path) or not fileManager.openReadOnly(path):
+        return None
+    try:
+        if fileManager.isLarge():
+            fileManager.loadLazy()
+        else:
+            fileManager.loadFile()
+    except Exception:
+        fileManager.close()
+        raise
+    return fileManager
+
+# NaN and the infinities have no JSON spelling
+def number(val):
+    return val if math.isfinite(val) else None
+
+# [name, mix, CostTable columns...] for every part
+def partRows(db):
+    for parts, costs in costChunks(db):
+        columns = [costs[column].tolist() for column in CostTable.columns]
+        for i, part in enumerate(parts):
+            yield [part.name, part.mix] + [number(values[i]) for values in columns]
+
+def writeCSV(db, path):
+    with open(path, "w", newline = "") as file:
+        writer = csv.writer(file)
+        writer.writerow(["part", "mix"] + CostTable.columns)
+        writer.writerows(partRows(db))
+
+def writeJSON(db, path):
+    keys = ["part", "mix"] + CostTable.columns
+    with open(path, "w") as file:
+        json.dump({
+            "globals": {name: getattr(db.globals, name) for name in db.globals.getGlobals()},
+            "parts": [dict(zip(keys, row)) for row in partRows(db)]
+        }, file, indent = 1)
+
+def writePDF(db, path):
+    from report import PDFReport
+    from report_cache import ReportCache
+    PDFReport(db, path).run("salesReport", cache = ReportCache())
+
+WRITERS = {"csv": writeCSV, "json": writeJSON, "pdf": writePDF}
+
+def main(args = None):
+    parser = argparse.ArgumentParser(description = "Cost every part of one or more database files.")
+    parser.add_argument("files", nargs = "+", help = "database (.db) files")
+    parser.add_argument("-o", "--output", default = ".", help = "directory for the results (default: current)")
+    parser.add_argument("-f", "--format", action = "append", choices = list(WRITERS), help = "output format, may be repeated (default: csv)")
+    options = parser.parse_args(args)
+    formats = options.format or ["csv"]
+    os.makedirs(options.output, exist_ok = True)
+
+    failed = 0
+    # a file that fails is reported and the rest still run
+    for path in options.files:
+        fileManager = None
+        try:
+            fileManager = openDatabase(path)
+            if fileManager == None:
+                print(f"Could not open {path}", file = sys.stderr)
+                failed += 1
+                continue
+            stem = os.path.splitext(os.path.basename(path))[0]
+            for kind in dict.fromkeys(formats):
+                out = os.path.join(options.output, f"{stem}.{kind}")
+                WRITERS[kind](fileManager.mainApp.db, out)
+                print(f"Wrote {out}")
+        except Exception as e:
+            print(f"Failed on {path}: {repr(e)}", file = sys.stderr)
+            failed += 1
+        finally:
+            if not fileManager == None:
+                fileManager.close()
+    return 1 if failed > 0 else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
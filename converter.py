@@ -1,7 +1,102 @@
-import openpyxl
+from concurrent.futures import ProcessPoolExecutor
+import hashlib
+import os
+import pickle
 import re
+import zipfile
 
 from records import Material, ImportedPart, Part, Package, Mixture, Globals, Database
+from reconcile import Reconciliation
+
+CHEMISTRY_BOOK = "Chemistry and Sizing Worksheet.xlsx"
+COSTING_BOOK = "Product Costing 2024A.xlsx"
+IMPORT_CACHE = ".import_cache.pickle"
+# bumped whenever a pickled Database changes shape
+CACHE_VERSION = 2
+# zip parts besides its own XML that a sheet's values depend on
+SHARED_PARTS = ["xl/sharedStrings.xml", "xl/styles.xml"]
+# "Product Costing 2024A.xlsx" -> "2024A"
+VERSION_PATTERN = re.compile(r"(\d{4}[A-Za-z]?)\.xlsx$")
+
+# 0-based index of an Excel column: A is 0, AA is 26
+def columnIndex(col):
+    index = 0
+    for letter in col.upper():
+        index = index * 26 + ord(letter) - ord("A") + 1
+    return index - 1
+
+# A worksheet pulled into memory in one pass over its rows.  Cells are read
+# as ws.value(col, row) with the same column letters and row numbers as in
+# Excel.
+class Sheet:
+    def __init__(self, rows) -> None:
+        self.rows = [()] + list(rows)
+        self.columns: dict[str, int] = {}
+
+    def value(self, col, row):
+        index = self.columns.get(col)
+        if index == None:
+            index = columnIndex(col)
+            self.columns[col] = index
+        if row >= len(self.rows) or index >= len(self.rows[row]):
+            return None
+        return self.rows[row][index]
+
+# Opens a workbook once, read only, and reads the named sheets (None for the
+# active one).  formulas gives formula strings instead of cached values.
+# Given the cached sheets and the workbook's part hashes (see fingerprint),
+# sheets whose XML parts are unchanged come from the cache instead.
+def readSheets(path, names, formulas = False, cache: dict = None, parts: dict = None):
+    # openpyxl is only needed once a workbook has to be opened
+    import openpyxl
+    book = openpyxl.load_workbook(path, read_only = True, data_only = not formulas)
+    res = {}
+    for name in names:
+        ws = book.active if name == None else book[name]
+        key = None if parts == None else tuple(parts.get(part) for part in [ws._worksheet_path] + SHARED_PARTS)
+        entry = None if cache == None else cache.get((path, name, formulas))
+        if not key == None and not entry == None and entry[0] == key:
+            res[name] = Sheet(entry[1])
+        else:
+            print(f"Reading {ws.title} from {path}")
+            res[name] = Sheet(ws.iter_rows(values_only = True))
+            if not cache == None:
+                cache[(path, name, formulas)] = (key, res[name].rows[1:])
+    book.close()
+    return res
+
+# Size and mtime for a quick check, the content hash for when those moved
+# without the content changing, and a CRC per zip part to tell which sheets
+# changed.
+def fingerprint(path, old: dict = None):
+    stat = os.stat(path)
+    if not old == None and old["size"] == stat.st_size and old["mtime"] == stat.st_mtime_ns:
+        return old
+    with open(path, "rb") as file:
+        digest = hashlib.sha256(file.read()).hexdigest()
+    if not old == None and old["hash"] == digest:
+        return dict(old, mtime = stat.st_mtime_ns)
+    with zipfile.ZipFile(path) as book:
+        parts = {info.filename: (info.CRC, info.file_size) for info in book.infolist()}
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "hash": digest, "parts": parts}
+
+def emptyCache():
+    return {"version": CACHE_VERSION, "books": {}, "sheets": {}, "db": None}
+
+def loadCache():
+    try:
+        with open(IMPORT_CACHE, "rb") as file:
+            cache = pickle.load(file)
+        if cache["version"] == CACHE_VERSION:
+            return cache
+    except (OSError, pickle.UnpicklingError, EOFError, KeyError, ValueError):
+        pass
+    return emptyCache()
+
+def saveCache(cache):
+    with open(IMPORT_CACHE + ".tmp", "wb") as file:
+        pickle.dump(cache, file)
+    os.replace(IMPORT_CACHE + ".tmp", IMPORT_CACHE)
 
 def resplit(delimiters, string, maxsplit=0):
     regex_pattern = '|'.join(map(re.escape, delimiters))
@@ -12,24 +107,21 @@ def numlist(string):
     tokens = re.split(regex_pattern, string)
     return [int(num) for num in tokens if not num == ""]
 
-def getString(ws, col, row):
-    cell = ws[col + str(row)]
-    val = cell.value
+def getString(ws: Sheet, col, row):
+    val = ws.value(col, row)
     if val == None:
         val = ""
     assert(isinstance(val, str))
     return val
 
-def getStringForce(ws, col, row):
-    cell = ws[col + str(row)]
-    val = cell.value
+def getStringForce(ws: Sheet, col, row):
+    val = ws.value(col, row)
     if val == None:
         val = ""
     return str(val)
 
-def getNumber(ws, col, row):
-    cell = ws[col + str(row)]
-    val = cell.value
+def getNumber(ws: Sheet, col, row):
+    val = ws.value(col, row)
     if val == None:
         val = 0
     if not (isinstance(val, int) or isinstance(val, float)):
@@ -43,21 +135,18 @@ def getMaterial(mats, row):
     mat.setSizes(getNumber(mats, "R", row), getNumber(mats, "S", row), getNumber(mats, "T", row), getNumber(mats, "U", row), getNumber(mats, "V", row))
     return mat
 
-def importMaterials():
-    matb = openpyxl.load_workbook("Chemistry and Sizing Worksheet.xlsx", data_only=True)
-    mats = matb.active
+def importMaterials(mats: Sheet):
     res = {}
     for row in range(5, 84, 2):
         mat = getMaterial(mats, row)
         res[mat.name] = mat
-    matb.close()
     return res
 
 
 
 def getPackaging(packs, part, row):
     pads = resplit([", ", "/"], getString(packs, "J", row))
-    rawcounts = packs["K" + str(row)].value
+    rawcounts = packs.value("K", row)
     if isinstance(rawcounts, float):
         rawcounts = int(rawcounts)
     rawcounts = str(rawcounts)
@@ -71,26 +160,21 @@ def getPart(parts, parts_form, packs, row):
     part = ImportedPart(getString(parts, "A", row))
     try:
         part.setProduction(getNumber(parts, "B", row), int(getNumber(parts, "C", row)), getStringForce(parts, "D", row), getNumber(parts, "J", row), getNumber(parts, "L", row), getNumber(parts, "N", row), getNumber(parts, "P", row), getNumber(parts, "R", row), getNumber(parts, "V", row), getNumber(parts, "AF", row))
-    except:
+    except Exception:
         return None
     try:
         getPackaging(packs, part, int(getString(parts_form, "X", row)[12:]))
-    except:
+    except Exception:
         return None
     return part
 
 
-def importParts():
-    prodb = openpyxl.load_workbook("Product Costing 2024A.xlsx", data_only=True)
-    prodb_form = openpyxl.load_workbook("Product Costing 2024A.xlsx")
-    parts = prodb["Part Costs"]
-    parts_form = prodb_form["Part Costs"]
-    packs = prodb_form["Packaging"]
+def importParts(parts: Sheet, parts_form: Sheet, packs: Sheet):
     impRes = {}
     res = {}
     rows = {}
     for row in range(5, 94):
-        if not (parts["C" + str(row)].value == None or parts["L" + str(row)].value == None or parts["L" + str(row)].value == 0 or parts["R" + str(row)].value == None):
+        if not (parts.value("C", row) == None or parts.value("L", row) == None or parts.value("L", row) == 0 or parts.value("R", row) == None):
             part = getPart(parts, parts_form, packs, row)
             if not part == None:
                 impRes[part.name] = part
@@ -98,15 +182,11 @@ def importParts():
                 rows[part.name] = row
             else:
                 print("Error with row {}".format(row))
-    prodb.close()
-    prodb_form.close()
     return res, impRes, rows
 
 
 
-def importPackaging():
-    prodb = openpyxl.load_workbook("Product Costing 2024A.xlsx", data_only=True)
-    packs = prodb["Packaging"]
+def importPackaging(packs: Sheet):
     res = {}
     for row in range(4, 44, 2):
         pack = Package(getString(packs, "A", row), "box", getNumber(packs, "B", row))
@@ -120,14 +200,11 @@ def importPackaging():
     for row in range(4, 22, 2):
         pack = Package(getString(packs, "J", row), "misc", getNumber(packs, "K", row))
         res[pack.name] = pack
-    prodb.close()
     return res
 
 
 
-def importMixes(materials):
-    prodb = openpyxl.load_workbook("Product Costing 2024A.xlsx", data_only=True)
-    mixs = prodb["Mix Cost"]
+def importMixes(mixs: Sheet, materials):
     res = {}
     row = 2
     while row > 0:
@@ -153,46 +230,86 @@ def importMixes(materials):
             if not getStringForce(mixs, "B", row) == "":
                 break
             row += 1
-    prodb.close()
     return res
 
-def check(name, db: Database, checkRows, parts):
-    part = db.parts[name]
-    row = checkRows[name]
-    err = 0
-    err += abs(part.getMatlCost() - getNumber(parts, "G", row))
-    err += abs(part.getBatchingTime() - getNumber(parts, "I", row))
-    err += abs(part.getPressingTime() - getNumber(parts, "K", row))
-    err += abs(part.getTurningTime() - getNumber(parts, "M", row))
-    err += abs(part.getLoadingTime() - getNumber(parts, "O", row))
-    err += abs(part.getUnloadingTime() - getNumber(parts, "Q", row))
-    err += abs(part.getInspectionTime() - getNumber(parts, "S", row))
-    err += abs(part.getLaborCost() - getNumber(parts, "U", row))
-    err += abs(part.getGrossMatlLaborCost() - getNumber(parts, "W", row))
-    err += abs(part.getPackagingCost() - getNumber(parts, "X", row))
-    err += abs(part.getManufacturingOverhead() - getNumber(parts, "Y", row))
-    err += abs(part.getManufacturingCost() - getNumber(parts, "AA", row))
-    err += abs(part.getSGA() - getNumber(parts, "AC", row))
-    err += abs(part.getTotalCost() - getNumber(parts, "AE", row))
-    err += abs(part.getGM() - getNumber(parts, "AG", row))
-    err += abs(part.getCM() - getNumber(parts, "AH", row))
-    err += abs(part.getVariableCost() - getNumber(parts, "AI", row))
-    err += abs(part.getProductivity() - getNumber(parts, "AK", row))
-    return err
-
-def importDatabase(checkF = False):
-    materials = importMaterials()
-    parts, importedParts, checkRows = importParts()
-    packaging = importPackaging()
-    mixes = importMixes(materials)
+# Each workbook is opened once per mode: cached values for everything, and
+# formulas for the cells that point at packaging rows.
+def readCosting(path, cache: dict = None, parts: dict = None):
+    values = readSheets(path, ["Part Costs", "Packaging", "Mix Cost"], False, cache, parts)
+    formulas = readSheets(path, ["Part Costs", "Packaging"], True, cache, parts)
+    return values, formulas
+
+def importRecords(chemistry: Sheet, values, formulas):
+    materials = importMaterials(chemistry)
+    parts, importedParts, checkRows = importParts(values["Part Costs"], formulas["Part Costs"], formulas["Packaging"])
+    packaging = importPackaging(values["Packaging"])
+    mixes = importMixes(values["Mix Cost"], materials)
+    return materials, mixes, packaging, parts, importedParts, checkRows
+
+# With useCache, an import of unchanged workbooks comes straight from
+# IMPORT_CACHE, and only the sheets that changed are read again otherwise.
+# checkF reconciles the imported parts with the workbook's own results (see
+# reconcile.py), and writes every term to checkPath as CSV if given.
+def importDatabase(checkF = False, useCache = True, checkPath = None):
+    cache = loadCache() if useCache else emptyCache()
+    books = {path: fingerprint(path, cache["books"].get(path)) for path in [CHEMISTRY_BOOK, COSTING_BOOK]}
+    unchanged = all(books[path]["hash"] == cache["books"].get(path, {}).get("hash") for path in books)
+    if unchanged and not cache["db"] == None and not checkF:
+        print("Workbooks unchanged, using the cached import")
+        return pickle.loads(cache["db"])
+
+    sheets = cache["sheets"]
+    chemistry = readSheets(CHEMISTRY_BOOK, [None], False, sheets, books[CHEMISTRY_BOOK]["parts"])
+    values, formulas = readCosting(COSTING_BOOK, sheets, books[COSTING_BOOK]["parts"])
+    materials, mixes, packaging, parts, importedParts, checkRows = importRecords(chemistry[None], values, formulas)
     db = Database(Globals(), materials, mixes, packaging, parts)
+    if useCache:
+        # fingerprints of the history workbooks stay for importHistory
+        cache["books"].update(books)
+        saveCache({"version": CACHE_VERSION, "books": cache["books"], "sheets": sheets, "db": pickle.dumps(db)})
     if checkF:
-        impDb = Database(Globals(), materials, mixes, packaging, importedParts)
-        prodb = openpyxl.load_workbook("Product Costing 2024A.xlsx", data_only=True)
-        parts = prodb["Part Costs"]
-        for entry in db.parts:
-            err = check(entry, db, checkRows, parts)
-            errImp = check(entry, impDb, checkRows, parts)
-            print("{} | {:.4f} {:.4f}".format(entry, abs(err - errImp), err))
-        prodb.close()
+        check = Reconciliation(db, importedParts, checkRows, values["Part Costs"])
+        check.printReport()
+        if not checkPath == None:
+            check.writeCSV(checkPath)
+    return db
+
+def bookVersion(path):
+    name = os.path.basename(path)
+    match = VERSION_PATTERN.search(name)
+    return os.path.splitext(name)[0] if match == None else match.group(1)
+
+# Runs in a worker process of importHistory.  sheets holds the cached sheets
+# of this workbook only; they come back along with any sheets read again.
+def importVersion(path, chemistryRows, sheets: dict, parts: dict):
+    values, formulas = readCosting(path, sheets, parts)
+    materials, mixes, packaging, partList, importedParts, checkRows = importRecords(Sheet(chemistryRows), values, formulas)
+    db = Database(Globals(), materials, mixes, packaging, partList)
+    db.recordVersion(bookVersion(path))
+    return db, sheets
+
+# Imports one costing workbook per year, each in its own process, against
+# the one chemistry workbook.  The newest version becomes the database and
+# every version, that one included, goes into its history.
+def importHistory(books: list[str], workers = None):
+    cache = loadCache()
+    books = sorted(books, key = bookVersion)
+    cache["books"][CHEMISTRY_BOOK] = fingerprint(CHEMISTRY_BOOK, cache["books"].get(CHEMISTRY_BOOK))
+    chemistry = readSheets(CHEMISTRY_BOOK, [None], False, cache["sheets"], cache["books"][CHEMISTRY_BOOK]["parts"])[None]
+    rows = chemistry.rows[1:]
+    jobs = []
+    with ProcessPoolExecutor(workers) as pool:
+        for path in books:
+            # kept so the next run can tell the workbook has not changed
+            cache["books"][path] = fingerprint(path, cache["books"].get(path))
+            parts = cache["books"][path]["parts"]
+            sheets = {key: entry for key, entry in cache["sheets"].items() if key[0] == path}
+            jobs.append(pool.submit(importVersion, path, rows, sheets, parts))
+        results = [job.result() for job in jobs]
+    history = {}
+    for db, sheets in results:
+        history.update(db.history)
+        cache["sheets"].update(sheets)
+    db.history = history
+    saveCache(cache)
     return db
@@ -0,0 +1,184 @@
+import numpy as np
+
+from records import Database
+
+# parts costed per CostTable when going through all of them
+COST_CHUNK = 2000
+
+def chunks(records, size = COST_CHUNK):
+    chunk = []
+    for record in records:
+        chunk.append(record)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if len(chunk) > 0:
+        yield chunk
+
+# (parts, CostTable) for every chunk of db's parts, so going through all of
+# them takes the same memory however many there are.
+def costChunks(db: Database, size = COST_CHUNK):
+    for parts in chunks(db.parts.values(), size):
+        yield parts, CostTable(db, [part.name for part in parts])
+
+# Column-wise version of the Part cost chain in records.py.  Every term is
+# computed once for every part; records.py stays the reference path.
+class CostTable:
+    columns = [
+        "weight",
+        "mixCost",
+        "gasCost",
+        "matlCost",
+        "batchingTime",
+        "pressingTime",
+        "turningTime",
+        "laborHours",
+        "laborCost",
+        "scrap",
+        "grossMatlLaborCost",
+        "packagingCost",
+        "variableCost",
+        "manufacturingOverhead",
+        "manufacturingCost",
+        "SGA",
+        "totalCost",
+        "price",
+        "GM",
+        "CM",
+        "productivity"
+    ]
+
+    def __init__(self, db: Database, names: list[str] = None) -> None:
+        self.db = db
+        self.names = []
+        self.data: dict[str, np.ndarray] = {}
+        if names == None:
+            # read a chunk of parts at a time, so a LazyDatabase never holds
+            # more of them than that for the table
+            self.compute(chunks(db.parts.values()))
+        else:
+            self.compute([[db.parts[name] for name in names]])
+        self.index = {name: i for i, name in enumerate(self.names)}
+
+    def materialCosts(self):
+        materials = list(self.db.materials.values())
+        matIndex = {material.id: i for i, material in enumerate(materials)}
+        costs = np.array([np.nan if cost == None else cost for cost in (material.getCostPerLb() for material in materials)], dtype=float)
+        return matIndex, costs
+
+    def mixtureCosts(self):
+        matIndex, matCosts = self.materialCosts()
+        # materials the importer could not resolve keep their name and cost NaN
+        matCosts = np.append(matCosts, np.nan)
+        mixtures = list(self.db.mixtures.values())
+        mixIndex = {mix.id: i for i, mix in enumerate(mixtures)}
+        mixRows = []
+        matCols = []
+        weights = []
+        for row, mix in enumerate(mixtures):
+            for i in range(len(mix.materialIds)):
+                mixRows.append(row)
+                matCols.append(matIndex.get(mix.materialIds[i], -1))
+                weights.append(mix.weights[i])
+        mixRows = np.array(mixRows, dtype=int)
+        matCols = np.array(matCols, dtype=int)
+        weights = np.array(weights, dtype=float)
+        batch = np.bincount(mixRows, weights=weights, minlength=len(mixIndex))
+        cost = np.bincount(mixRows, weights=weights * matCosts[matCols], minlength=len(mixIndex))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            return mixIndex, cost / batch
+
+    def packagingPrices(self):
+        packaging = list(self.db.packaging.values())
+        packIndex = {item.id: i for i, item in enumerate(packaging)}
+        # packaging a part names but the database does not have costs NaN
+        return packIndex, np.array([item.price for item in packaging] + [np.nan], dtype=float)
+
+    def packagingCosts(self, parts, packIndex, prices):
+        box = prices[[packIndex.get(part.boxId, -1) for part in parts]]
+        pallet = prices[[packIndex.get(part.palletId, -1) for part in parts]]
+
+        padRows = [i for i, part in enumerate(parts) for pad in part.padIds]
+        padCost = prices[[packIndex.get(pad, -1) for part in parts for pad in part.padIds]] * np.array([count for part in parts for count in part.padsPerBox], dtype=float)
+        pads = np.bincount(np.array(padRows, dtype=int), weights=padCost, minlength=len(parts))
+
+        miscRows = [i for i, part in enumerate(parts) for misc in part.miscIds]
+        miscCost = prices[[packIndex.get(misc, -1) for part in parts for misc in part.miscIds]]
+        miscs = np.bincount(np.array(miscRows, dtype=int), weights=miscCost, minlength=len(parts))
+
+        piecesPerBox = np.array([part.piecesPerBox for part in parts], dtype=float)
+        boxesPerPallet = np.array([part.boxesPerPallet for part in parts], dtype=float)
+        perPallet = (box + pads) * boxesPerPallet + pallet
+        return perPallet / (piecesPerBox * boxesPerPallet) + miscs
+
+    # Costs every chunk of parts, the mixture and packaging prices once for
+    # all of them.
+    def compute(self, partChunks):
+        mixIndex, mixCosts = self.mixtureCosts()
+        packIndex, prices = self.packagingPrices()
+        columns = {column: [] for column in self.columns}
+        for parts in partChunks:
+            self.names.extend(part.name for part in parts)
+            for column, values in self.partCosts(parts, mixIndex, mixCosts, packIndex, prices).items():
+                columns[column].append(values)
+        for column in self.columns:
+            self.data[column] = np.concatenate(columns[column]) if len(columns[column]) > 0 else np.zeros(0)
+
+    def partCosts(self, parts, mixIndex, mixCosts, packIndex, prices):
+        glob = self.db.globals
+        col = {}
+        weight = np.array([part.weight for part in parts], dtype=float)
+        pressing = np.array([part.pressing for part in parts], dtype=float)
+        turning = np.array([part.turning for part in parts], dtype=float)
+        fireScrap = np.array([part.fireScrap for part in parts], dtype=float)
+        price = np.array([part.price for part in parts], dtype=float)
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            col["weight"] = weight
+            col["mixCost"] = weight * np.append(mixCosts, np.nan)[[mixIndex.get(part.mixId, -1) for part in parts]]
+            col["gasCost"] = weight * glob.gasCost
+            col["matlCost"] = col["mixCost"] + col["gasCost"]
+            col["batchingTime"] = weight * glob.batchingFactor
+            col["pressingTime"] = 1 / pressing
+            col["turningTime"] = 1 / turning
+            col["laborHours"] = col["batchingTime"] + col["pressingTime"] + col["turningTime"]
+            col["laborCost"] = col["laborHours"] * glob.laborCost
+            col["scrap"] = (glob.greenScrap / 100) + fireScrap
+            col["grossMatlLaborCost"] = (col["matlCost"] + col["laborCost"]) / (1 - col["scrap"])
+            col["packagingCost"] = self.packagingCosts(parts, packIndex, prices)
+            col["variableCost"] = col["grossMatlLaborCost"] + col["packagingCost"] + glob.inspection + glob.loading
+            col["manufacturingOverhead"] = weight * glob.manufacturingOverhead
+            col["manufacturingCost"] = col["variableCost"] + col["manufacturingOverhead"]
+            col["SGA"] = weight * glob.SGA
+            col["totalCost"] = col["manufacturingCost"] + col["SGA"]
+            col["price"] = price
+            col["GM"] = (price - col["manufacturingCost"]) / price
+            col["CM"] = (price - col["variableCost"]) / price
+            col["productivity"] = weight * (1 - col["scrap"]) / col["laborHours"]
+        return col
+
+    # Recomputes the rows of the named parts, adding the ones not in the
+    # table yet.  Rows of parts that went away are left as they are.
+    def update(self, names):
+        if len(names) == 0:
+            return
+        fresh = CostTable(self.db, names)
+        added = [name for name in dict.fromkeys(names) if not name in self.index]
+        for name in added:
+            self.index[name] = len(self.names)
+            self.names.append(name)
+        rows = [self.index[name] for name in names]
+        for column in self.columns:
+            if len(added) > 0:
+                self.data[column] = np.append(self.data[column], np.full(len(added), np.nan))
+            self.data[column][rows] = fresh.data[column]
+
+    def __getitem__(self, column) -> np.ndarray:
+        return self.data[column]
+
+    def get(self, name, column):
+        return float(self.data[column][self.index[name]])
+
+    def row(self, name):
+        i = self.index[name]
+        return {column: float(self.data[column][i]) for column in self.columns}
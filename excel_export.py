@@ -0,0 +1,76 @@
+import math
+import openpyxl
+
+from records import Database, Material
+from cost_table import CostTable, chunks, costChunks
+from chemistry import MixtureAnalysis
+
+PART_HEADERS = {
+    "weight": "Weight (lb)",
+    "mixCost": "Mix",
+    "gasCost": "Gas",
+    "matlCost": "Material",
+    "batchingTime": "Batching (hr)",
+    "pressingTime": "Pressing (hr)",
+    "turningTime": "Turning (hr)",
+    "laborHours": "Labor (hr)",
+    "laborCost": "Labor",
+    "scrap": "Scrap",
+    "grossMatlLaborCost": "Gross Material + Labor",
+    "packagingCost": "Packaging",
+    "variableCost": "Variable",
+    "manufacturingOverhead": "Manufacturing Overhead",
+    "manufacturingCost": "Manufacturing",
+    "SGA": "SGA",
+    "totalCost": "Total",
+    "price": "Price",
+    "GM": "GM",
+    "CM": "CM",
+    "productivity": "Productivity (lb / hr)"
+}
+
+def cell(val):
+    if val == None or (isinstance(val, float) and math.isnan(val)):
+        return None
+    return val
+
+# Streams the cost breakdown of every part, the materials and the chemistry
+# of every mixture into a write-only workbook.  Rows go to disk as they are
+# appended; records are costed a chunk at a time.
+class ExcelExport:
+    def __init__(self, db: Database, path: str) -> None:
+        self.db = db
+        self.path = path
+        self.book = openpyxl.Workbook(write_only = True)
+
+    def partsSheet(self):
+        ws = self.book.create_sheet("Parts")
+        ws.append(["Part", "Mix"] + [PART_HEADERS[column] for column in CostTable.columns])
+        for parts, costs in costChunks(self.db):
+            columns = [costs[column].tolist() for column in CostTable.columns]
+            for i, part in enumerate(parts):
+                ws.append([part.name, part.mix] + [cell(values[i]) for values in columns])
+
+    def materialsSheet(self):
+        ws = self.book.create_sheet("Materials")
+        props = Material.columns[4:]
+        ws.append(["Material", "Price ($ / ton)", "Freight ($ / ton)", "Cost ($ / lb)"] + props)
+        for material in self.db.materials.values():
+            ws.append([material.name, material.price, material.freight, material.getCostPerLb()] + [getattr(material, prop) for prop in props])
+
+    def mixturesSheet(self):
+        ws = self.book.create_sheet("Mixtures")
+        ws.append(["Mixture", "Batch Weight"] + MixtureAnalysis.chemistry + MixtureAnalysis.sizing)
+        for mixtures in chunks(self.db.mixtures.values()):
+            analysis = MixtureAnalysis(self.db, [mix.name for mix in mixtures])
+            for mix in mixtures:
+                row = [mix.name, analysis.getBatchWeight(mix.name)]
+                row += [analysis.getProp(mix.name, prop) for prop in MixtureAnalysis.chemistry]
+                row += [analysis.getProp(mix.name, prop, False) for prop in MixtureAnalysis.sizing]
+                ws.append([cell(val) for val in row])
+
+    def write(self):
+        self.partsSheet()
+        self.materialsSheet()
+        self.mixturesSheet()
+        self.book.save(self.path)
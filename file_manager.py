@@ -1,181 +1,434 @@
+import base64
+import os
 import sqlite3
+from urllib.request import pathname2url
 
-from app import MainWindow
 from records import Material, Mixture, Package, Part
+from lazy import LazyDatabase
+from journal import Journal
 
+SCHEMA_VERSION = 3
+TABLES = ["globals", "materials", "mixtures", "mixture_components", "packaging", "parts", "part_packaging", "history"]
+V2_TABLES = ["globals", "materials", "mixtures", "mixture_components", "packaging", "parts", "part_packaging"]
+OLD_TABLES = ["globals", "materials", "mixtures", "packaging", "parts"]
+RECORD_TABLES = ["materials", "mixtures", "packaging", "parts"]
+# record table -> (child table, owner column)
+CHILD_TABLES = {cls.table: (cls.childTable, cls.childKey) for cls in [Mixture, Part]}
+# files with more records than this are read on demand
+LAZY_THRESHOLD = 100000
+# journal entries worth folding into the tables
+COMPACT_ENTRIES = 1000
+LOAD_CHUNK = 1000
+
+# list encoding of version 0 and 1 files
+def listToString(data, kind):
+    encodings = []
+    for val in data:
+        assert(isinstance(val, kind))
+        enc = base64.urlsafe_b64encode(str(val).encode("utf-8")).decode("utf-8")
+        encodings.append(enc)
+    return "#".join(encodings)
+
+def stringToList(string: str, kind):
+    data = []
+    if string == "":
+        return list()
+    encodings = string.split("#")
+    for enc in encodings:
+        val = kind(base64.urlsafe_b64decode(enc.encode("utf-8")).decode("utf-8"))
+        data.append(val)
+    return data
+
+# mainApp is the MainWindow, or anything else holding the open database as
+# mainApp.db (see cli.py); nothing here needs Qt.
 class FileManager:
-    def __init__(self, mainApp: MainWindow) -> None:
+    def __init__(self, mainApp) -> None:
         self.mainApp = mainApp
         self.filePath = None
         self.dbFile = None
+        self.synced = False
+        self.journal = None
+        self.recovered = 0
+        # opened with openReadOnly
+        self.readOnly = False
+
+    def createTables(self):
+        self.dbFile.execute("CREATE TABLE IF NOT EXISTS globals(name PRIMARY KEY, value)")
+        self.dbFile.execute("CREATE TABLE IF NOT EXISTS materials(id INTEGER PRIMARY KEY, name, cost, freight, SiO2, Al2O3, Fe2O3, TiO2, Li2O, P2O5, Na2O, CaO, K2O, MgO, LOI, Plus50, Sub50Plus100, Sub100Plus200, Sub200Plus325, Sub325)")
+        self.dbFile.execute("CREATE TABLE IF NOT EXISTS mixtures(id INTEGER PRIMARY KEY, name)")
+        self.dbFile.execute("CREATE TABLE IF NOT EXISTS mixture_components(mixture INTEGER, material INTEGER, weight, position INTEGER, PRIMARY KEY (mixture, position))")
+        self.dbFile.execute("CREATE TABLE IF NOT EXISTS packaging(id INTEGER PRIMARY KEY, name, kind, cost)")
+        self.dbFile.execute("CREATE TABLE IF NOT EXISTS parts(id INTEGER PRIMARY KEY, name, weight, mix, pressing, turning, loading, unloading, inspection, greenScrap, fireScrap, box, piecesPerBox, pallet, boxesPerPallet, price, sales)")
+        self.dbFile.execute("CREATE TABLE IF NOT EXISTS part_packaging(part INTEGER, item INTEGER, role, qty, position INTEGER, PRIMARY KEY (part, position))")
+        self.dbFile.execute("CREATE TABLE IF NOT EXISTS history(version, kind, name, field, value, PRIMARY KEY (kind, name, version, field))")
+        for table in RECORD_TABLES:
+            self.dbFile.execute(f"CREATE INDEX IF NOT EXISTS {table}_name ON {table}(name)")
+        self.dbFile.execute("CREATE INDEX IF NOT EXISTS mixture_components_material ON mixture_components(material)")
+        self.dbFile.execute("CREATE INDEX IF NOT EXISTS part_packaging_item ON part_packaging(item)")
+        self.dbFile.execute("CREATE INDEX IF NOT EXISTS parts_mix ON parts(mix)")
+        self.dbFile.execute("CREATE INDEX IF NOT EXISTS parts_box ON parts(box)")
+        self.dbFile.execute("CREATE INDEX IF NOT EXISTS parts_pallet ON parts(pallet)")
+
+    # Version 0 files key every table by name and store references as names.
+    # Their implicit rowids become the record ids.  A name with no record
+    # (the importer keeps unknown materials) stays a name, as Reference
+    # leaves it; the ones in lists are returned by (table, rowid, field,
+    # position) for migrateLists, since version 1 lists only hold ids.
+    def migrateNames(self):
+        print(f"Migrating {self.filePath} to schema version 1")
+        for table in ["materials", "mixtures", "packaging", "parts"]:
+            self.dbFile.execute(f"ALTER TABLE {table} RENAME TO old_{table}")
+        self.dbFile.execute("CREATE TABLE materials(id INTEGER PRIMARY KEY, name, cost, freight, SiO2, Al2O3, Fe2O3, TiO2, Li2O, P2O5, Na2O, CaO, K2O, MgO, LOI, Plus50, Sub50Plus100, Sub100Plus200, Sub200Plus325, Sub325)")
+        self.dbFile.execute("CREATE TABLE mixtures(id INTEGER PRIMARY KEY, name, materials, weights)")
+        self.dbFile.execute("CREATE TABLE packaging(id INTEGER PRIMARY KEY, name, kind, cost)")
+        self.dbFile.execute("CREATE TABLE parts(id INTEGER PRIMARY KEY, name, weight, mix, pressing, turning, loading, unloading, inspection, greenScrap, fireScrap, box, piecesPerBox, pallet, boxesPerPallet, pad, padsPerBox, misc, price, sales)")
+        ids = {}
+        for table in ["materials", "mixtures", "packaging"]:
+            res = self.dbFile.execute(f"SELECT name, rowid FROM old_{table}")
+            ids[table] = {name: rowid for name, rowid in res.fetchall()}
+
+        unresolved = {}
+
+        def toIds(table, string, key):
+            names = stringToList(string, str)
+            for i, name in enumerate(names):
+                if not name in ids[table]:
+                    unresolved[key + (i,)] = name
+            return listToString([ids[table].get(name, 0) for name in names], int)
+
+        self.dbFile.execute("INSERT INTO materials SELECT rowid, * FROM old_materials")
+        self.dbFile.execute("INSERT INTO packaging SELECT rowid, * FROM old_packaging")
+        res = self.dbFile.execute("SELECT rowid, * FROM old_mixtures")
+        for values in res.fetchall():
+            self.dbFile.execute("INSERT INTO mixtures VALUES (?, ?, ?, ?)", (values[0], values[1], toIds("materials", values[2], ("mixtures", values[0], "materials")), values[3]))
+        res = self.dbFile.execute("SELECT rowid, * FROM old_parts")
+        for values in res.fetchall():
+            values = list(values)
+            values[3] = ids["mixtures"].get(values[3], values[3])
+            values[11] = ids["packaging"].get(values[11], values[11])
+            values[13] = ids["packaging"].get(values[13], values[13])
+            values[15] = toIds("packaging", values[15], ("parts", values[0], "pad"))
+            values[17] = toIds("packaging", values[17], ("parts", values[0], "misc"))
+            self.dbFile.execute("INSERT INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", values)
+        for table in ["materials", "mixtures", "packaging", "parts"]:
+            self.dbFile.execute(f"DROP TABLE old_{table}")
+        self.dbFile.execute("PRAGMA user_version = 1")
+        return unresolved
+
+    # Version 1 files keep mixture components and part pads/misc items as
+    # encoded strings in the record rows.  Version 2 moves them into indexed
+    # child tables, one row per entry.  unresolved holds the names
+    # migrateNames could not turn into ids.
+    def migrateLists(self, unresolved = {}):
+        print(f"Migrating {self.filePath} to schema version 2")
+        self.dbFile.execute("ALTER TABLE mixtures RENAME TO old_mixtures")
+        self.dbFile.execute("ALTER TABLE parts RENAME TO old_parts")
+        self.createTables()
+
+        res = self.dbFile.execute("SELECT * FROM old_mixtures")
+        for values in res.fetchall():
+            mixture = Mixture.fromRow(values[:2])
+            materialIds = [unresolved.get(("mixtures", values[0], "materials", i), id) for i, id in enumerate(stringToList(values[2], int))]
+            mixture.__dict__.update(materialIds=materialIds, weights=stringToList(values[3], float))
+            self.dbFile.execute("INSERT INTO mixtures VALUES (?, ?)", mixture.getTuple())
+            self.dbFile.executemany("INSERT INTO mixture_components VALUES (?, ?, ?, ?)", mixture.getChildRows())
+
+        res = self.dbFile.execute("SELECT * FROM old_parts")
+        for values in res.fetchall():
+            part = Part.fromRow(values[:15] + values[18:])
+            padIds = [unresolved.get(("parts", values[0], "pad", i), id) for i, id in enumerate(stringToList(values[15], int))]
+            miscIds = [unresolved.get(("parts", values[0], "misc", i), id) for i, id in enumerate(stringToList(values[17], int))]
+            part.__dict__.update(padIds=padIds, padsPerBox=stringToList(values[16], int), miscIds=miscIds)
+            self.dbFile.execute(f"INSERT INTO parts VALUES ({", ".join(["?"] * len(Part.columns))})", part.getTuple())
+            self.dbFile.executemany("INSERT INTO part_packaging VALUES (?, ?, ?, ?, ?)", part.getChildRows())
+
+        self.dbFile.execute("DROP TABLE old_mixtures")
+        self.dbFile.execute("DROP TABLE old_parts")
+        self.dbFile.execute("PRAGMA user_version = 2")
+
+    # Version 3 adds the history table of values from older workbooks.
+    def migrateHistory(self):
+        print(f"Migrating {self.filePath} to schema version 3")
+        self.createTables()
+        self.dbFile.execute("PRAGMA user_version = 3")
+
+    def schema(self):
+        res = self.dbFile.execute("SELECT name FROM sqlite_master WHERE type='table'")
+        tables = [row[0] for row in res.fetchall()]
+        return tables, self.dbFile.execute("PRAGMA user_version").fetchone()[0]
+
+    def isOld(self, tables, version):
+        return (sorted(tables) == sorted(OLD_TABLES) and version in [0, 1]) or (sorted(tables) == sorted(V2_TABLES) and version == 2)
+
+    def migrate(self, version):
+        with self.dbFile:
+            self.dbFile.execute("BEGIN")
+            unresolved = {}
+            if version == 0:
+                unresolved = self.migrateNames()
+            if version < 2:
+                self.migrateLists(unresolved)
+            self.migrateHistory()
 
     def initFile(self):
         assert(not self.filePath == None)
+        self.dbFile = None
         try:
             self.dbFile = sqlite3.connect(self.filePath)
-            res = self.dbFile.execute("SELECT name FROM sqlite_master")
-            tables = [row[0] for row in res.fetchall()]
-            if len(tables) > 10:
-                print(f"Initialization error: too many tables in {self.filePath}.  Found:")
-                for tab in tables:
-                    print(f" * {tab}")
-                self.dbFile.close()
-                return False
-            elif len(tables) < 10 and len(tables) > 0:
-                print(f"Initialization error: too few tables in {self.filePath}.  Found:")
-                for tab in tables:
-                    print(f" * {tab}")
-                self.dbFile.close()
-                return False
-            
+            # lets a worker thread write while this connection reads
+            self.dbFile.execute("PRAGMA journal_mode=WAL")
+            tables, version = self.schema()
+
             if len(tables) == 0:
-                self.dbFile.execute("CREATE TABLE globals(name PRIMARY KEY, value)")
-                self.dbFile.execute("CREATE TABLE materials(name PRIMARY KEY, cost, freight, SiO2, Al2O3, Fe2O3, TiO2, Li2O, P2O5, Na2O, CaO, K2O, MgO, LOI, Plus50, Sub50Plus100, Sub100Plus200, Sub200Plus325, Sub325)")
-                self.dbFile.execute("CREATE TABLE mixtures(name PRIMARY KEY, materials, weights)")
-                self.dbFile.execute("CREATE TABLE packaging(name PRIMARY KEY, kind, cost)")
-                self.dbFile.execute("CREATE TABLE parts(name PRIMARY KEY, weight, mix, pressing, turning, loading, unloading, inspection, greenScrap, fireScrap, box, piecesPerBox, pallet, boxesPerPallet, pad, padsPerBox, misc, price, sales)")
+                self.createTables()
+                self.dbFile.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
                 self.dbFile.commit()
                 return True
-            elif len(tables) == 10 and "globals" in tables and "materials" in tables and "mixtures" in tables and "packaging" in tables and "parts" in tables:
+            elif self.isOld(tables, version):
+                self.migrate(version)
                 return True
+            elif sorted(tables) == sorted(TABLES) and version == SCHEMA_VERSION:
+                # adds any index missing from files written by older versions
+                with self.dbFile:
+                    self.createTables()
+                return True
+            elif sorted(tables) in [sorted(TABLES), sorted(V2_TABLES), sorted(OLD_TABLES)]:
+                print(f"Initialization error: unknown schema version {version} in {self.filePath}")
+                self.dbFile.close()
+                return False
             else:
-                print(f"Initialization error: wrong tables in {self.filePath}")
+                print(f"Initialization error: wrong tables in {self.filePath}.  Found:")
+                for tab in tables:
+                    print(f" * {tab}")
                 self.dbFile.close()
                 return False
         except Exception as e:
             print(f"Initialization error: {repr(e)}")
-            self.dbFile.close()
+            if not self.dbFile == None:
+                self.dbFile.close()
             return False
 
-    def saveFile(self):
-        assert((not self.filePath == None) and (not self.dbFile == None))
+    # Copies everything the next save writes out of the database: every
+    # record unless this file has not been synced with the database yet,
+    # otherwise only the records changed or deleted since the last save or
+    # load.  The database starts a new change set, so it can keep changing
+    # while the copy is written.
+    def snapshot(self):
         db = self.mainApp.db
-        print(f"Saving globals to {self.filePath}")
-        for name in db.globals.getGlobals():
-            try:
-                self.dbFile.execute("INSERT OR REPLACE INTO globals VALUES (?, ?)", (name, getattr(db.globals, name)))
-                print(f" * Saving {name} = {getattr(db.globals, name)}")
-            except Exception as e:
-                print(f" * Error saving {name} = {getattr(db.globals, name)}: {repr(e)}")
-        self.dbFile.commit()
-
-        def clearOld(dbName, currDict):
-            res = self.dbFile.execute(f"SELECT name FROM {dbName}")
-            deleted = [vals for vals in res.fetchall() if not vals[0] in currDict]
-            if len(deleted) > 0:
-                try:
-                    res.executemany(f"DELETE FROM {dbName} WHERE name=?", deleted)
-                    print(f" * Deleting old entries {", ".join([f"{name[0]}" for name in deleted])}")
-                except Exception as e:
-                    print(f" * Error deleting old entries {", ".join([f"{name[0]}" for name in deleted])}: {repr(e)}")
-            self.dbFile.commit()
-
-        print(f"Saving materials to {self.filePath}")
-        for name in db.materials:
-            vals = db.materials[name].getTuple()
-            try:
-                self.dbFile.execute("INSERT OR REPLACE INTO materials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", vals)
-                print(f" * Saving {vals}")
-            except Exception as e:
-                print(f" * Error saving {vals}: {repr(e)}")
-        self.dbFile.commit()
-        clearOld("materials", db.materials)
-
-        print(f"Saving mixtures to {self.filePath}")
-        for name in db.mixtures:
-            vals = db.mixtures[name].getTuple()
-            try:
-                self.dbFile.execute("INSERT OR REPLACE INTO mixtures VALUES (?, ?, ?)", vals)
-                print(f" * Saving {vals}")
-            except Exception as e:
-                print(f" * Error saving {vals}: {repr(e)}")
-        self.dbFile.commit()
-        clearOld("mixtures", db.mixtures)
-
-        print(f"Saving packaging to {self.filePath}")
-        for name in db.packaging:
-            vals = db.packaging[name].getTuple()
-            try:
-                self.dbFile.execute("INSERT OR REPLACE INTO packaging VALUES (?, ?, ?)", vals)
-                print(f" * Saving {vals}")
-            except Exception as e:
-                print(f" * Error saving {vals}: {repr(e)}")
-        self.dbFile.commit()
-        clearOld("packaging", db.packaging)
-
-        print(f"Saving parts to {self.filePath}")
-        for name in db.parts:
-            vals = db.parts[name].getTuple()
-            try:
-                self.dbFile.execute("INSERT OR REPLACE INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", vals)
-                print(f" * Saving {vals}")
-            except Exception as e:
-                print(f" * Error saving {vals}: {repr(e)}")
-        self.dbFile.commit()
-        clearOld("parts", db.parts)
-
-    def loadFile(self):
+        full = not self.synced
+        dirty, deleted = db.takeChanges()
+        snap = {"full": full, "dirty": dirty, "deleted": deleted, "journal": self.journal.count}
+        snap["globals"] = [(name, getattr(db.globals, name)) for name in db.globals.getGlobals() if full or name in dirty["globals"]]
+        for table in RECORD_TABLES:
+            records = db.byId[table]
+            saved = list(records.values()) if full else [records[id] for id in dirty[table]]
+            childRows = [row for record in saved for row in record.getChildRows()] if table in CHILD_TABLES else []
+            snap[table] = ([record.getTuple() for record in saved], childRows, None if full else [(id,) for id in deleted[table]])
+        # history only changes by importing into a new database
+        snap["history"] = db.historyRows() if full else None
+        return snap
+
+    # Writes a snapshot in one transaction.  Safe to call from a worker
+    # thread with its own connection.
+    def writeSnapshot(self, conn: sqlite3.Connection, snap, progress = None):
+        print(f"Saving {"all" if snap["full"] else "changed"} entries to {self.filePath}")
+        with conn:
+            conn.executemany("INSERT OR REPLACE INTO globals VALUES (?, ?)", snap["globals"])
+            print(f" * Saved {len(snap["globals"])} globals")
+
+            for table in RECORD_TABLES:
+                rows, childRows, deleted = snap[table]
+                if len(rows) > 0:
+                    conn.executemany(f"INSERT OR REPLACE INTO {table} VALUES ({", ".join(["?"] * len(rows[0]))})", rows)
+                if deleted == None:
+                    saved = {row[0] for row in rows}
+                    res = conn.execute(f"SELECT id FROM {table}")
+                    deleted = [vals for vals in res.fetchall() if not vals[0] in saved]
+                conn.executemany(f"DELETE FROM {table} WHERE id=?", deleted)
+                print(f" * Saved {len(rows)} {table}, deleted {len(deleted)}")
+
+                if table in CHILD_TABLES:
+                    child, owner = CHILD_TABLES[table]
+                    conn.executemany(f"DELETE FROM {child} WHERE {owner}=?", [(row[0],) for row in rows] + deleted)
+                    if len(childRows) > 0:
+                        conn.executemany(f"INSERT INTO {child} VALUES ({", ".join(["?"] * len(childRows[0]))})", childRows)
+                    print(f" * Saved {len(childRows)} {child}")
+                if not progress == None:
+                    progress(table, len(rows), len(rows))
+
+            if not snap["history"] == None:
+                conn.execute("DELETE FROM history")
+                conn.executemany("INSERT INTO history VALUES (?, ?, ?, ?, ?)", snap["history"])
+                print(f" * Saved {len(snap["history"])} history entries")
+
+    def finishSave(self, snap, success):
+        if success:
+            self.synced = True
+            self.mainApp.db.changesSaved()
+            self.journal.compact(snap["journal"])
+        else:
+            self.mainApp.db.restoreChanges(snap["dirty"], snap["deleted"])
+
+    def saveFile(self):
         assert((not self.filePath == None) and (not self.dbFile == None))
+        snap = self.snapshot()
+        try:
+            self.writeSnapshot(self.dbFile, snap)
+            success = True
+        except Exception as e:
+            print(f"Save error: {repr(e)}")
+            success = False
+        self.finishSave(snap, success)
+        return success
+
+    # Streams each table through the cursor in chunks.  progress, if given,
+    # is called as progress(table, loaded, total) after every chunk; trace
+    # prints every loaded row.
+    def loadTable(self, conn: sqlite3.Connection, table, build, add, progress = None, trace = False, order = None):
+        total = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+        print(f"Loading {total} {table} from {self.filePath}")
+        res = conn.execute(f"SELECT * FROM {table}" + ("" if order == None else f" ORDER BY {order}"))
+        loaded = 0
+        while True:
+            rows = res.fetchmany(LOAD_CHUNK)
+            if len(rows) == 0:
+                break
+            for values in rows:
+                record = build(values)
+                add(record)
+                if trace:
+                    print(f" * Loaded {values}")
+                    print(f" --> Loaded {record}")
+            loaded += len(rows)
+            if not progress == None:
+                progress(table, loaded, total)
+
+    # Builds a new Database from the file.  Safe to call from a worker
+    # thread with its own connection; nothing else sees the database until
+    # it is returned.
+    def readDatabase(self, conn: sqlite3.Connection, progress = None, trace = False):
         from records import emptyDB
-        self.mainApp.db = emptyDB()
-        db = self.mainApp.db
+        db = emptyDB()
         print(f"Loading globals from {self.filePath}")
-        res = self.dbFile.execute("SELECT * FROM globals")
+        res = conn.execute("SELECT * FROM globals")
         for pair in res.fetchall():
             name, val = pair
             setattr(db.globals, name, val)
-            print(f" * Loaded {name} = {val}")
+            if trace:
+                print(f" * Loaded {name} = {val}")
 
-        print(f"Loading materials from {self.filePath}")
-        res = self.dbFile.execute("SELECT * FROM materials")
-        for values in res.fetchall():
-            material = Material("ERROR")
-            material.fromTuple(values)
-            db.materials[material.name] = material
-            material.db = db
-            print(f" * Loaded {values}")
-            print(f" --> Loaded {material}")
-
-        print(f"Loading mixtures from {self.filePath}")
-        res = self.dbFile.execute("SELECT * FROM mixtures")
-        for values in res.fetchall():
-            mixture = Mixture("ERROR")
-            mixture.fromTuple(values)
-            db.mixtures[mixture.name] = mixture
-            mixture.db = db
-            print(f" * Loaded {values}")
-            print(f" --> Loaded {mixture}")
-
-        print(f"Loading packaging from {self.filePath}")
-        res = self.dbFile.execute("SELECT * FROM packaging")
-        for values in res.fetchall():
-            package = Package("ERROR", None, None)
-            package.fromTuple(values)
-            db.packaging[package.name] = package
-            package.db = db
-            print(f" * Loaded {values}")
-            print(f" --> Loaded {package}")
-
-        print(f"Loading parts from {self.filePath}")
-        res = self.dbFile.execute("SELECT * FROM parts")
-        for values in res.fetchall():
-            part = Part("ERROR")
-            part.fromTuple(values)
-            db.parts[part.name] = part
-            part.db = db
-            print(f" * Loaded {values}")
-            print(f" --> Loaded {part}")
-
-    def setFile(self, filePath):
+        self.loadTable(conn, "materials", Material.fromRow, db.loadRecord, progress, trace)
+        self.loadTable(conn, "mixtures", Mixture.fromRow, db.loadRecord, progress, trace)
+        self.loadTable(conn, "packaging", Package.fromRow, db.loadRecord, progress, trace)
+        self.loadTable(conn, "parts", Part.fromRow, db.loadRecord, progress, trace)
+        for table, (child, owner) in CHILD_TABLES.items():
+            records = db.byId[table]
+            self.loadTable(conn, child, lambda values: values, lambda values: records[values[0]].addChildRow(values), progress, trace, f"{owner}, position")
+        self.loadTable(conn, "history", lambda values: values, db.addHistoryRow, progress, trace, "version")
+        db.clearChanges()
+        return db
+
+    # Replays the changes the file's journal holds beyond its saved tables
+    # before the database starts logging to it.
+    def finishLoad(self, db):
+        self.mainApp.db = db
+        self.synced = True
+        self.recovered = self.journal.replay(db)
+        if self.recovered > 0:
+            print(f"Recovered {self.recovered} unsaved changes from {self.journal.path}")
+        db.journal = None if self.readOnly else self.journal
+
+    def needsCompaction(self):
+        return not self.journal == None and self.journal.count >= COMPACT_ENTRIES
+
+    def loadFile(self, progress = None, trace = False):
+        assert((not self.filePath == None) and (not self.dbFile == None))
+        self.finishLoad(self.readDatabase(self.dbFile, progress, trace))
+
+    def close(self):
+        if not self.journal == None:
+            self.journal.close()
+            self.journal = None
+        if not self.dbFile == None:
+            self.dbFile.close()
+            self.dbFile = None
+
+    # Leaves no file set, e.g. when the file setFile moved to could not be
+    # loaded.
+    def forget(self):
+        self.close()
+        self.filePath = None
+        self.synced = False
+
+    def isLarge(self):
+        return sum(self.dbFile.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0] for table in RECORD_TABLES) > LAZY_THRESHOLD
+
+    # Reads records from the open file as they are used instead of up front.
+    def loadLazy(self):
+        assert((not self.filePath == None) and (not self.dbFile == None))
+        print(f"Opening {self.filePath} for reading on demand")
+        self.finishLoad(LazyDatabase(self.dbFile))
+
+    # copy keeps the current database for the new file (save as).  A lazy
+    # database still reads from the old file, so that file is copied over
+    # and only the changes need saving.
+    def setFile(self, filePath, copy = False):
         oldPath = self.filePath
         oldConn = self.dbFile
         self.filePath = filePath
         success = self.initFile()
         if success:
+            self.synced = False
+            db = getattr(self.mainApp, "db", None)
+            if copy and isinstance(db, LazyDatabase) and db.conn is oldConn:
+                oldConn.backup(self.dbFile)
+                db.rebind(self.dbFile)
+                self.synced = True
+            if not self.journal == None:
+                self.journal.close()
+            self.journal = Journal(filePath + ".changes")
+            if copy and not db == None:
+                # whatever the new file held is about to be overwritten
+                self.journal.clear()
+                db.journal = self.journal
+            elif not db == None:
+                # the database about to be replaced no longer logs anywhere
+                db.journal = None
             if not oldConn == None:
                 oldConn.close()
         else:
             print(f"Failed to initialize {filePath}")
             self.filePath = oldPath
             self.dbFile = oldConn
-        return success
\ No newline at end of file
+        return success
+
+    # Opens filePath for reading only (see cli.py): nothing is written to
+    # the file or next to it, so it can sit on a read-only share.  An older
+    # schema is migrated in a copy held in memory, and unsaved changes in
+    # the journal are replayed without the database logging to it.
+    def openReadOnly(self, filePath):
+        assert(self.dbFile == None)
+        self.filePath = filePath
+        self.readOnly = True
+        try:
+            # without a write-ahead log to read there is nothing to lock or
+            # share, and immutable keeps SQLite from creating -wal/-shm files
+            mode = "mode=ro" if os.path.exists(filePath + "-wal") else "immutable=1"
+            self.dbFile = sqlite3.connect(f"file:{pathname2url(os.path.abspath(filePath))}?{mode}", uri = True)
+            tables, version = self.schema()
+            if self.isOld(tables, version):
+                memory = sqlite3.connect(":memory:")
+                self.dbFile.backup(memory)
+                self.dbFile.close()
+                self.dbFile = memory
+                self.migrate(version)
+            elif not (sorted(tables) == sorted(TABLES) and version == SCHEMA_VERSION):
+                print(f"Initialization error: {filePath} is not a database of schema version {SCHEMA_VERSION} or older")
+                self.close()
+                return False
+        except Exception as e:
+            print(f"Initialization error: {repr(e)}")
+            self.close()
+            return False
+        self.journal = Journal(filePath + ".changes", readOnly = True)
+        return True
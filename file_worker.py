@@ -0,0 +1,36 @@
+from PySide6.QtCore import QThread, Signal
+import sqlite3
+
+from file_manager import FileManager
+
+# Runs one load or save on its own thread and SQLite connection, so the
+# event loop keeps running.  A save writes a snapshot taken on the GUI
+# thread; a load builds a new Database that is only handed over in done.
+class FileWorker(QThread):
+    progress = Signal(str, int, int)
+    done = Signal(bool, object)
+
+    def __init__(self, fileManager: FileManager, mode, snap = None) -> None:
+        super().__init__()
+        assert(mode in ["load", "save"])
+        self.fileManager = fileManager
+        self.mode = mode
+        self.snap = snap
+
+    def run(self):
+        result = None
+        conn = None
+        try:
+            conn = sqlite3.connect(self.fileManager.filePath)
+            if self.mode == "load":
+                result = self.fileManager.readDatabase(conn, self.progress.emit)
+            else:
+                self.fileManager.writeSnapshot(conn, self.snap, self.progress.emit)
+            success = True
+        except Exception as e:
+            print(f"{self.mode.capitalize()} error: {repr(e)}")
+            success = False
+        finally:
+            if not conn == None:
+                conn.close()
+        self.done.emit(success, result)
@@ -3,9 +3,7 @@ from table import DBTable
 from app import MainWindow
 from records import Package
 from error import ErrorWindow, errorMessage
-from utils import getComboBox, widgetFromList, checkInput, newVLine, startfile
-
-from report import PDFReport
+from utils import getComboBox, widgetFromList, checkInput, newVLine
 import os
 
 class GlobalsTab(QWidget):
@@ -41,8 +39,6 @@ class GlobalsTab(QWidget):
                             errorMessage(self.mainApp, errors)
                         else:
                             setattr(self.mainApp.db.globals, currGlob, val)
-                            self.mainApp.partsTab.refreshTable()
-                            self.refreshTab()
                 return update
             
             self.buttons[glob].clicked.connect(getUpdate(glob))
@@ -58,13 +54,16 @@ class GlobalsTab(QWidget):
     def report(self):
         reportFile  = QFileDialog.getSaveFileName(self, "Save globals Report As", os.path.expanduser("~"), "Portable Document Format (*.pdf)")
         if not reportFile[0] == "":
-            pdf = PDFReport(self.mainApp.db, reportFile[0])
-            pdf.globalsReport()
-            startfile(reportFile[0])
+            self.mainApp.reports.add("Globals report", reportFile[0], self.mainApp.db, "globalsReport")
     
     def refreshTab(self):
         globalKeys = self.mainApp.db.globals.getGlobals()
         globalStrings = self.mainApp.db.globals.getStrings()
 
         for glob in globalKeys:
-            self.values[glob].setText(f"{getattr(self.mainApp.db.globals, glob)} ({globalStrings[glob][1]})")
\ No newline at end of file
+            self.values[glob].setText(f"{getattr(self.mainApp.db.globals, glob)} ({globalStrings[glob][1]})")
+
+    # Follows a database change (see changes.py) to the globals.
+    def onChange(self, event):
+        if event.kind == "globals":
+            self.refreshTab()
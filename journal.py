@@ -0,0 +1,120 @@
+import json
+import os
+
+from records import Database, Record, Material, Mixture, Package, Part
+
+RECORD_CLASSES = {cls.table: cls for cls in [Material, Mixture, Package, Part]}
+
+# Append-only log, kept next to the database file, of every change made
+# since the last save.  Replaying it over the saved tables recovers work
+# lost when the app dies between saves.  Entries hold absolute values, so
+# replaying entries that were already saved is harmless.
+#
+# A readOnly journal only replays: it never touches the file.
+class Journal:
+    def __init__(self, path, readOnly = False) -> None:
+        self.path = path
+        lines = self.read()
+        self.count = len(lines)
+        self.file = None
+        if readOnly:
+            return
+        # drop a line left half written by a crash before appending to it
+        if os.path.exists(path):
+            with open(path) as file:
+                if not file.read() == "".join(lines):
+                    self.rewrite(lines)
+        self.file = open(path, "a")
+
+    def read(self):
+        if not os.path.exists(self.path):
+            return []
+        lines = []
+        with open(self.path) as file:
+            for line in file:
+                if not line.endswith("\n"):
+                    break
+                try:
+                    json.loads(line)
+                except json.JSONDecodeError:
+                    break
+                lines.append(line)
+        return lines
+
+    def rewrite(self, lines):
+        with open(self.path + ".tmp", "w") as file:
+            file.writelines(lines)
+        os.replace(self.path + ".tmp", self.path)
+
+    def append(self, entry):
+        self.file.write(json.dumps(entry) + "\n")
+        self.file.flush()
+        self.count += 1
+
+    # Only real attributes are logged; reference descriptors (Part.mix,
+    # Mixture.materials, ...) are covered by the id fields behind them.
+    def setFields(self, record: Record, fields):
+        values = {field: record.__dict__[field] for field in fields if field in record.__dict__}
+        if len(values) > 0:
+            self.append(["set", record.table, record.id, values])
+
+    def setGlobal(self, name, value):
+        self.append(["set", "globals", None, {name: value}])
+
+    def add(self, kind, record: Record):
+        self.append(["add", kind, record.id, {field: value for field, value in vars(record).items() if not field == "db"}])
+
+    def delete(self, kind, record: Record):
+        self.append(["del", kind, record.id, None])
+
+    # Applies every entry to db, which must not log to this journal yet.
+    def replay(self, db: Database):
+        entries = [json.loads(line) for line in self.read()]
+        for op, table, id, fields in entries:
+            if table == "globals":
+                for name, value in fields.items():
+                    setattr(db.globals, name, value)
+                continue
+            records = db.byId[table]
+            names = getattr(db, table)
+            record = records.get(id)
+            if op == "del":
+                if not record == None:
+                    db.forget(table, record)
+                    if names.get(record.name) is record:
+                        del names[record.name]
+            elif op == "add" and record == None:
+                record = RECORD_CLASSES[table].fromRow([])
+                record.__dict__.update(fields)
+                db.attach(table, record)
+                names[record.name] = record
+            elif not record == None:
+                if "name" in fields:
+                    db.rename(names, record.name, fields["name"])
+                for field, value in fields.items():
+                    if not field in ["id", "name"]:
+                        setattr(record, field, value)
+        # renames replayed over newer saved names can collide on the way
+        for table in RECORD_CLASSES:
+            names = getattr(db, table)
+            if isinstance(names, dict) and not len(names) == len(db.byId[table]):
+                records = {record.name: record for record in db.byId[table].values()}
+                names.clear()
+                names.update(records)
+        return len(entries)
+
+    # Drops the first mark entries, once a save has folded them into the
+    # tables.
+    def compact(self, mark):
+        self.file.close()
+        lines = self.read()[mark:]
+        self.rewrite(lines)
+        self.count = len(lines)
+        self.file = open(self.path, "a")
+
+    def clear(self):
+        self.compact(self.count)
+
+    def close(self):
+        if not self.file == None:
+            self.file.close()
@@ -0,0 +1,326 @@
+import sqlite3
+import weakref
+from collections import OrderedDict
+from collections.abc import MutableMapping
+
+from records import Database, Globals, Record, Material, Mixture, Package, Part
+
+LAZY_CAPACITY = 5000
+LAZY_CHUNK = 500
+
+# Records of one table, read from the file when first used.  Clean records
+# are held in a bounded LRU; changed and new records are pinned until a save
+# has written them.  The weak identity map hands out the same object for a
+# record for as long as anything still holds it.
+class LazyTable:
+    def __init__(self, db: Database, cls, capacity) -> None:
+        self.db = db
+        self.cls = cls
+        self.table = cls.table
+        self.capacity = capacity
+        self.recent: OrderedDict[int, Record] = OrderedDict()
+        self.recentNames: dict[str, int] = {}
+        self.live = weakref.WeakValueDictionary()
+        self.pinned: dict[int, Record] = {}
+        self.pinnedNames: dict[str, int] = {}
+        # ids still in the file but deleted since the last save
+        self.dropped: set[int] = set()
+        self.evicted = 0
+        # what listing() last read, until a record comes, goes or is renamed
+        self.listed = None
+        self.names = LazyNames(self)
+        self.ids = LazyIds(self)
+
+    def childRows(self, ids):
+        rows = {}
+        if self.cls.childTable == None or len(ids) == 0:
+            return rows
+        child, key = self.cls.childTable, self.cls.childKey
+        res = self.db.conn.execute(f"SELECT * FROM {child} WHERE {key} IN ({", ".join(["?"] * len(ids))}) ORDER BY {key}, position", ids)
+        for values in res.fetchall():
+            rows.setdefault(values[0], []).append(values)
+        return rows
+
+    def hydrate(self, values, children):
+        record = self.live.get(values[0])
+        if record == None:
+            record = self.cls.fromRow(values)
+            for row in children:
+                record.addChildRow(row)
+            record.__dict__["db"] = self.db
+            self.live[record.id] = record
+        self.touch(record)
+        return record
+
+    def touch(self, record: Record):
+        if record.id in self.pinned:
+            return
+        self.recent[record.id] = record
+        self.recent.move_to_end(record.id)
+        self.recentNames[record.name] = record.id
+        while len(self.recent) > self.capacity:
+            id, old = self.recent.popitem(last = False)
+            self.recentNames.pop(old.name, None)
+            self.db.evict(old)
+            self.evicted += 1
+        if self.evicted >= self.capacity:
+            self.db.cache.prune()
+            self.evicted = 0
+
+    def pin(self, record: Record, name = None):
+        name = record.name if name == None else name
+        if not self.pinnedNames.get(name) == record.id:
+            self.listed = None
+        self.recent.pop(record.id, None)
+        self.pinned[record.id] = record
+        self.pinnedNames[name] = record.id
+        self.live[record.id] = record
+
+    # Unpins what the last save wrote; records changed since stay pinned.
+    def release(self, dirty: set[int], deleted: set[int]):
+        for id in [id for id in self.pinned if not id in dirty]:
+            self.touch(self.pinned.pop(id))
+        self.pinnedNames = {record.name: id for id, record in self.pinned.items()}
+        self.dropped &= deleted
+        self.listed = None
+
+    def remove(self, id):
+        record = self.pinned.pop(id, None)
+        if not record == None:
+            self.pinnedNames.pop(record.name, None)
+        self.recent.pop(id, None)
+        self.live.pop(id, None)
+        self.dropped.add(id)
+        self.listed = None
+
+    def get(self, id):
+        if id in self.pinned:
+            return self.pinned[id]
+        if id in self.dropped:
+            return None
+        record = self.live.get(id)
+        if not record == None:
+            self.touch(record)
+            return record
+        values = self.db.conn.execute(f"SELECT * FROM {self.table} WHERE id=?", (id,)).fetchone()
+        if values == None:
+            return None
+        return self.hydrate(values, self.childRows([id]).get(id, []))
+
+    def lookup(self, name):
+        for names, records in [(self.pinnedNames, self.pinned), (self.recentNames, self.recent)]:
+            record = records.get(names.get(name))
+            if not record == None and record.name == name:
+                self.touch(record)
+                return record
+        values = self.db.conn.execute(f"SELECT * FROM {self.table} WHERE name=?", (name,)).fetchone()
+        # a pinned record may have been renamed away from its saved name
+        if values == None or values[0] in self.pinned or values[0] in self.dropped:
+            return None
+        return self.hydrate(values, self.childRows([values[0]]).get(values[0], []))
+
+    def contains(self, id):
+        if id in self.pinned or id in self.live:
+            return True
+        if id in self.dropped:
+            return False
+        return not self.db.conn.execute(f"SELECT 1 FROM {self.table} WHERE id=?", (id,)).fetchone() == None
+
+    # (id, name) of every record, saved ones in id order, then new ones.
+    def listing(self):
+        if not self.listed == None:
+            return self.listed
+        res = []
+        seen = set()
+        for id, name in self.db.conn.execute(f"SELECT id, name FROM {self.table} ORDER BY id").fetchall():
+            seen.add(id)
+            if not id in self.dropped:
+                res.append((id, self.pinned[id].name if id in self.pinned else name))
+        res.extend((id, self.pinned[id].name) for id in sorted(self.pinned) if not id in seen)
+        self.listed = res
+        return res
+
+    # name -> field of every record, saved ones read from their column
+    # without reading the records.
+    def column(self, field):
+        columns = [info[1] for info in self.db.conn.execute(f"PRAGMA table_info({self.table})").fetchall()]
+        res = {}
+        for id, name, value in self.db.conn.execute(f"SELECT id, name, {columns[self.cls.columns.index(field)]} FROM {self.table} ORDER BY id").fetchall():
+            if not id in self.pinned and not id in self.dropped:
+                res[name] = value
+        for record in self.pinned.values():
+            res[record.name] = getattr(record, field)
+        return res
+
+    # Streams every record, reading missing ones a chunk at a time.
+    def records(self):
+        seen = set()
+        res = self.db.conn.execute(f"SELECT * FROM {self.table} ORDER BY id")
+        while True:
+            rows = res.fetchmany(LAZY_CHUNK)
+            if len(rows) == 0:
+                break
+            children = self.childRows([values[0] for values in rows if not values[0] in self.live])
+            for values in rows:
+                id = values[0]
+                seen.add(id)
+                if id in self.pinned:
+                    yield self.pinned[id]
+                elif not id in self.dropped:
+                    yield self.hydrate(values, children.get(id, []))
+        for id in sorted(self.pinned):
+            if not id in seen and id in self.pinned:
+                yield self.pinned[id]
+
+class LazyNames(MutableMapping):
+    def __init__(self, table: LazyTable) -> None:
+        self.table = table
+
+    def __getitem__(self, name):
+        record = self.table.lookup(name)
+        if record == None:
+            raise KeyError(name)
+        return record
+
+    def __contains__(self, name):
+        return not self.table.lookup(name) == None
+
+    def __setitem__(self, name, record: Record):
+        # new records are pinned once attach gives them an id
+        if not record.id == None:
+            self.table.pin(record, name)
+
+    def __delitem__(self, name):
+        # records leave through Database.forget; this only drops a name
+        # that a rename is moving away from
+        self.table.pinnedNames.pop(name, None)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.table.listing())
+
+    def keys(self):
+        return [name for id, name in self.table.listing()]
+
+    def values(self):
+        return self.table.records()
+
+    def items(self):
+        return ((record.name, record) for record in self.table.records())
+
+class LazyIds(MutableMapping):
+    def __init__(self, table: LazyTable) -> None:
+        self.table = table
+
+    def __getitem__(self, id):
+        record = self.table.get(id)
+        if record == None:
+            raise KeyError(id)
+        return record
+
+    def __contains__(self, id):
+        return self.table.contains(id)
+
+    def __setitem__(self, id, record: Record):
+        self.table.pin(record)
+
+    def __delitem__(self, id):
+        self.table.remove(id)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def __len__(self):
+        return len(self.table.listing())
+
+    def keys(self):
+        return [id for id, name in self.table.listing()]
+
+    def values(self):
+        return self.table.records()
+
+    def items(self):
+        return ((record.id, record) for record in self.table.records())
+
+# Database whose records stay in the open file until they are used.  Only
+# the records in use, the most recently used ones and the unsaved ones are
+# kept in memory, so opening a file costs the same whatever its size.
+class LazyDatabase(Database):
+    def __init__(self, conn: sqlite3.Connection, capacity = LAZY_CAPACITY) -> None:
+        super().__init__(Globals(), {}, {}, {}, {})
+        self.conn = conn
+        self.tables = {cls.table: LazyTable(self, cls, capacity) for cls in [Material, Mixture, Package, Part]}
+        self.materials = self.tables["materials"].names
+        self.mixtures = self.tables["mixtures"].names
+        self.packaging = self.tables["packaging"].names
+        self.parts = self.tables["parts"].names
+        self.byId = {table: lazy.ids for table, lazy in self.tables.items()}
+        for table in self.tables:
+            self.nextId[table] = (conn.execute(f"SELECT MAX(id) FROM {table}").fetchone()[0] or 0) + 1
+        for name, val in conn.execute("SELECT * FROM globals").fetchall():
+            setattr(self.globals, name, val)
+        self.clearChanges()
+
+    def rebind(self, conn: sqlite3.Connection):
+        self.conn = conn
+        for lazy in self.tables.values():
+            lazy.listed = None
+
+    def columnValues(self, table, field):
+        return self.tables[table].column(field)
+
+    def changed(self, record: Record, fields):
+        super().changed(record, fields)
+        if record.id in self.dirty[record.table]:
+            self.tables[record.table].pin(record)
+
+    def evict(self, record: Record):
+        for field in vars(record):
+            self.cache.invalidate((record, field))
+
+    def changesSaved(self):
+        for table, lazy in self.tables.items():
+            lazy.release(self.dirty[table], self.deleted[table])
+
+    # History stays in the file along with the records.
+    def historyRows(self):
+        return self.conn.execute("SELECT * FROM history").fetchall()
+
+    def getHistory(self, table, name):
+        res = {}
+        for version, field, value in self.conn.execute("SELECT version, field, value FROM history WHERE kind=? AND name=? ORDER BY version", (table, name)).fetchall():
+            res.setdefault(version, {})[field] = value
+        return res
+
+    # Saved references come from the indexed columns and child tables of the
+    # file, unsaved ones from the pinned records.
+    def referrers(self, record: Record) -> dict[Record, list[str]]:
+        id = record.id
+        if isinstance(record, Material):
+            kind = "mixtures"
+            rows = self.conn.execute("SELECT mixture, 'material' FROM mixture_components WHERE material=? ORDER BY mixture, position", (id,)).fetchall()
+            scan = lambda mix: ["material" for ref in mix.materialIds if ref == id]
+        elif isinstance(record, Mixture):
+            kind = "parts"
+            rows = self.conn.execute("SELECT id, 'mix' FROM parts WHERE mix=?", (id,)).fetchall()
+            scan = lambda part: ["mix"] if part.mixId == id else []
+        elif isinstance(record, Package):
+            kind = "parts"
+            rows = self.conn.execute("SELECT id, 'box' FROM parts WHERE box=?", (id,)).fetchall()
+            rows += self.conn.execute("SELECT id, 'pallet' FROM parts WHERE pallet=?", (id,)).fetchall()
+            rows += self.conn.execute("SELECT part, role FROM part_packaging WHERE item=? ORDER BY part, position", (id,)).fetchall()
+            scan = lambda part: [role for role, ids in (("box", [part.boxId]), ("pallet", [part.palletId]), ("pad", part.padIds or []), ("misc", part.miscIds)) for ref in ids if ref == id]
+        else:
+            return {}
+        table = self.tables[kind]
+        roles: dict[int, list[str]] = {}
+        for referrer, role in rows:
+            if not referrer in table.pinned and not referrer in table.dropped:
+                roles.setdefault(referrer, []).append(role)
+        for referrer, pinned in table.pinned.items():
+            found = scan(pinned)
+            if len(found) > 0:
+                roles[referrer] = found
+        return {table.get(referrer): found for referrer, found in sorted(roles.items())}
@@ -1,3 +1,6 @@
+import time
+started = time.perf_counter()
+
 from PySide6.QtWidgets import QApplication
 from PySide6.QtGui import QIcon
 import os
@@ -13,6 +16,19 @@ except ImportError:
 
 basedir = os.path.dirname(__file__)
 
+# seconds from launch to the first paint of the window
+STARTUP_BUDGET = 0.3
+# set ANIKA_STARTUP=1 to hear the startup time when it is within budget too
+SHOW_STARTUP = os.environ.get("ANIKA_STARTUP") == "1"
+
+# Only a startup over budget is reported, unless SHOW_STARTUP.
+def showStartup():
+    elapsed = time.perf_counter() - started
+    if elapsed > STARTUP_BUDGET:
+        print(f"First paint after {elapsed * 1000:.0f} ms, over the {STARTUP_BUDGET * 1000:.0f} ms budget")
+    elif SHOW_STARTUP:
+        print(f"First paint after {elapsed * 1000:.0f} ms")
+
 # from converter import importDatabase
 # db = importDatabase(False)
 db = None
@@ -21,5 +37,6 @@ if __name__ == "__main__":
     app = QApplication([])
     app.setWindowIcon(QIcon(os.path.join(basedir, 'ceramics_icon.ico')))
     window = MainWindow(db)
+    window.firstPaint = showStartup
     window.show()
     app.exec()
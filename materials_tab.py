@@ -1,6 +1,7 @@
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QMessageBox
-from table import DBTable
+from table import DBTable, SearchBar
 from app import MainWindow
+from search import SearchIndex
 from records import Material
 from error import ErrorWindow, errorMessage
 from utils import getComboBox, widgetFromList, checkInput
@@ -12,8 +13,9 @@ class MaterialsTab(QWidget):
         self.windows = []
         # self.error = None
         self.genTableData()
-        self.table = DBTable(self.materials, self.headers)
+        self.table = DBTable(self.materials, self.headers, self.cell, self.key)
         self.table.parentTab = self
+        self.search = SearchBar(self.table, self.searchIndex)
 
         self.selection = []
         self.selectLabel = QLabel("Selection: N/A")
@@ -35,30 +37,50 @@ class MaterialsTab(QWidget):
         barLayout.addWidget(delete)
 
         layout = QVBoxLayout()
+        layout.addWidget(self.search)
         layout.addWidget(self.table)
         layout.addLayout(barLayout)
         self.setLayout(layout)
     
+    def key(self, entry):
+        hasPrice = 0 if not self.mainApp.db.materials[entry].getCostPerLb() == None else 1
+        return (hasPrice, entry)
+
     def genTableData(self):
         db = self.mainApp.db
-        def getKey(entry):
-            item = db.materials[entry]
-            hasPrice = 0 if not db.materials[entry].getCostPerLb() == None else 1
-            return (hasPrice, entry)
         self.headers = ["Material", "Price", "+50", "-50+100", "-100+200", "-200+325", "-325", "Al2O3", "SiO2", "Fe2O3"]
-        self.materials = [[
-            entry,
-            "${:.4f} / lb".format(db.materials[entry].getCostPerLb()) if not db.materials[entry].getCostPerLb() == None else "N/A",
-            "{:.2f}%".format(db.materials[entry].Plus50),
-            "{:.2f}%".format(db.materials[entry].Sub50Plus100),
-            "{:.2f}%".format(db.materials[entry].Sub100Plus200),
-            "{:.2f}%".format(db.materials[entry].Sub200Plus325),
-            "{:.2f}%".format(db.materials[entry].Sub325),
-            "{:.2f}%".format(db.materials[entry].Al2O3),
-            "{:.2f}%".format(db.materials[entry].SiO2),
-            "{:.2f}%".format(db.materials[entry].Fe2O3)
-        ] for entry in db.materials]
-        self.materials.sort(key=lambda row: getKey(row[0]))
+        # one formatter per column, called only for the cells in view
+        self.columns = [
+            lambda entry: entry,
+            lambda entry: "${:.4f} / lb".format(db.materials[entry].getCostPerLb()) if not db.materials[entry].getCostPerLb() == None else "N/A",
+            lambda entry: "{:.2f}%".format(db.materials[entry].Plus50),
+            lambda entry: "{:.2f}%".format(db.materials[entry].Sub50Plus100),
+            lambda entry: "{:.2f}%".format(db.materials[entry].Sub100Plus200),
+            lambda entry: "{:.2f}%".format(db.materials[entry].Sub200Plus325),
+            lambda entry: "{:.2f}%".format(db.materials[entry].Sub325),
+            lambda entry: "{:.2f}%".format(db.materials[entry].Al2O3),
+            lambda entry: "{:.2f}%".format(db.materials[entry].SiO2),
+            lambda entry: "{:.2f}%".format(db.materials[entry].Fe2O3)
+        ]
+        self.materials = sorted(db.materials.keys(), key=self.key)
+
+    def cell(self, entry, column):
+        return self.columns[column](entry)
+
+    # A material is found by its name and filtered on its price, sizing and
+    # chemistry.
+    def searchIndex(self):
+        db = self.mainApp.db
+        def values(prop):
+            return lambda names: [getattr(db.materials[name], prop) for name in names]
+        return SearchIndex(lambda: self.table.dbModel.names, lambda entry: [entry], {
+            "price": (lambda names: [db.materials[name].getCostPerLb() for name in names], False),
+            "plus50": (values("Plus50"), False),
+            "sub325": (values("Sub325"), False),
+            "al2o3": (values("Al2O3"), False),
+            "sio2": (values("SiO2"), False),
+            "fe2o3": (values("Fe2O3"), False)
+        })
     
     def setSelection(self, selection):
         self.selection = selection
@@ -89,7 +111,6 @@ class MaterialsTab(QWidget):
             if confirm == QMessageBox.StandardButton.Yes:
                 usedIn = self.mainApp.db.delMaterial(material)
                 if len(usedIn) == 0:
-                    self.refreshTable()
                     QMessageBox.information(self.mainApp, "Success!", f"Deleted material {material}")
                 else:
                     errorMessage(self.mainApp, [f"{material} is used in {item}!" for item in usedIn])
@@ -97,9 +118,22 @@ class MaterialsTab(QWidget):
     def refreshTable(self):
         self.genTableData()
         self.table.setData(self.materials)
+        self.search.reset()
         selection = [material for material in self.selection if material in self.mainApp.db.materials]
         self.setSelection(selection)
 
+    # Follows a database change (see changes.py) to the materials.
+    def onChange(self, event):
+        if not event.kind == "materials":
+            return
+        names = self.table.dbModel.follow(event, self.mainApp.db.materials)
+        if names == None:
+            self.refreshTable()
+            return
+        self.search.changed(names, event.names if event.action == "removed" else ())
+        self.table.dbModel.changedNames(names)
+        self.setSelection([material for material in self.selection if material in self.mainApp.db.materials])
+
 class MaterialsDetailsWindow(QWidget):
     def __init__(self, entry, mainApp: MainWindow):
         super().__init__()
@@ -204,21 +238,20 @@ class MaterialsEditWindow(QWidget):
 
         if len(errors) == 0:
             isNone = self.material == None
-            if isNew:
-                self.material = Material(name)
-                self.mainApp.db.addMaterial(self.material)
-            else:
-                assert(not isNone)
-                self.mainApp.db.updateMaterial(self.material.name, name)
-            self.material.price = price
-            self.material.freight = freight
-            self.material.setChems(SiO2, Al2O3, Fe2O3, TiO2, Li2O, P2O5, Na2O, CaO, K2O, MgO, LOI)
-            self.material.setSizes(Plus50, Sub50Plus100, Sub100Plus200, Sub200Plus325, Sub325)
+            # the tables hear about the material once it is complete
+            with self.mainApp.db.changes.batch():
+                if isNew:
+                    self.material = Material(name)
+                    self.mainApp.db.addMaterial(self.material)
+                else:
+                    assert(not isNone)
+                    self.mainApp.db.updateMaterial(self.material.name, name)
+                self.material.price = price
+                self.material.freight = freight
+                self.material.setChems(SiO2, Al2O3, Fe2O3, TiO2, Li2O, P2O5, Na2O, CaO, K2O, MgO, LOI)
+                self.material.setSizes(Plus50, Sub50Plus100, Sub100Plus200, Sub200Plus325, Sub325)
             if isNone:
                 self.material = None
-            self.mainApp.materialsTab.refreshTable()
-            self.mainApp.mixturesTab.refreshTable()
-            self.mainApp.partsTab.refreshTable()
             res = True
         else:
             # self.error = ErrorWindow(errors)
@@ -1,11 +1,11 @@
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QMessageBox, QFileDialog
-from table import DBTable
+from table import DBTable, SearchBar
 from app import MainWindow
+from search import SearchIndex
 from records import Mixture
+from chemistry import MixtureAnalysis
 from error import ErrorWindow, errorMessage
-from utils import getComboBox, widgetFromList, checkInput, startfile
-
-from report import PDFReport
+from utils import getComboBox, widgetFromList, checkInput
 import os
 
 class MixturesTab(QWidget):
@@ -15,8 +15,9 @@ class MixturesTab(QWidget):
         self.windows = []
         # self.error = None
         self.genTableData()
-        self.table = DBTable(self.mixtures, self.headers)
+        self.table = DBTable(self.mixtures, self.headers, self.cell, self.key)
         self.table.parentTab = self
+        self.search = SearchBar(self.table, self.searchIndex)
 
         self.selection = []
         self.selectLabel = QLabel("Selection: N/A")
@@ -31,6 +32,8 @@ class MixturesTab(QWidget):
         delete.clicked.connect(self.deleteSelection)
         report = QPushButton("Report")
         report.clicked.connect(self.reportSelection)
+        reportAll = QPushButton("Report All")
+        reportAll.clicked.connect(lambda: self.reportBatch(list(self.mainApp.db.mixtures.keys())))
 
         barLayout = QHBoxLayout()
         barLayout.addWidget(self.selectLabel)
@@ -39,32 +42,55 @@ class MixturesTab(QWidget):
         barLayout.addWidget(new)
         barLayout.addWidget(delete)
         barLayout.addWidget(report)
+        barLayout.addWidget(reportAll)
 
         layout = QVBoxLayout()
+        layout.addWidget(self.search)
         layout.addWidget(self.table)
         layout.addLayout(barLayout)
         self.setLayout(layout)
     
+    def key(self, entry):
+        return (entry, )
+
     def genTableData(self):
         db = self.mainApp.db
-        def getKey(entry):
-            item = db.mixtures[entry]
-            return (entry, )
         self.headers = ["Mixture", "Price", "Batch Weight", "+50", "-50+100", "-100+200", "-200+325", "-325", "Al2O3", "SiO2", "Fe2O3"]
-        self.mixtures = [[
-            entry,
-            "${:.4f} / lb".format(db.mixtures[entry].getCost()) if not db.mixtures[entry].getCost() == None else "N/A",
-            "{:.4f} lbs".format(db.mixtures[entry].getBatchWeight()),
-            "{:.2f}%".format(db.mixtures[entry].getProp("Plus50", False)),
-            "{:.2f}%".format(db.mixtures[entry].getProp("Sub50Plus100", False)),
-            "{:.2f}%".format(db.mixtures[entry].getProp("Sub100Plus200", False)),
-            "{:.2f}%".format(db.mixtures[entry].getProp("Sub200Plus325", False)),
-            "{:.2f}%".format(db.mixtures[entry].getProp("Sub325", False)),
-            "{:.2f}%".format(db.mixtures[entry].getProp("Al2O3")),
-            "{:.2f}%".format(db.mixtures[entry].getProp("SiO2")),
-            "{:.2f}%".format(db.mixtures[entry].getProp("Fe2O3"))
-        ] for entry in db.mixtures]
-        self.mixtures.sort(key=lambda row: getKey(row[0]))
+        self.analysis = MixtureAnalysis(db)
+        # one formatter per column, called only for the cells in view
+        self.columns = [
+            lambda entry: entry,
+            lambda entry: "${:.4f} / lb".format(db.mixtures[entry].getCost()) if not db.mixtures[entry].getCost() == None else "N/A",
+            lambda entry: "{:.4f} lbs".format(self.analysis.getBatchWeight(entry)),
+            lambda entry: self.analysis.format(entry, "Plus50", False),
+            lambda entry: self.analysis.format(entry, "Sub50Plus100", False),
+            lambda entry: self.analysis.format(entry, "Sub100Plus200", False),
+            lambda entry: self.analysis.format(entry, "Sub200Plus325", False),
+            lambda entry: self.analysis.format(entry, "Sub325", False),
+            lambda entry: self.analysis.format(entry, "Al2O3"),
+            lambda entry: self.analysis.format(entry, "SiO2"),
+            lambda entry: self.analysis.format(entry, "Fe2O3")
+        ]
+        self.mixtures = sorted(db.mixtures.keys(), key=self.key)
+
+    def cell(self, entry, column):
+        return self.columns[column](entry)
+
+    # A mixture is found by its name and materials, and filtered on its
+    # price, sizing and chemistry.
+    def searchIndex(self):
+        db = self.mainApp.db
+        def analysis(prop, LOI = True):
+            return lambda names: (self.analysis.corrected if LOI else self.analysis.raw)[[self.analysis.index[name] for name in names], self.analysis.propIndex[prop]]
+        return SearchIndex(lambda: self.table.dbModel.names, lambda entry: [entry, *db.mixtures[entry].materials], {
+            "price": (lambda names: [db.mixtures[name].getCost() for name in names], False),
+            "batch": (lambda names: self.analysis.batchWeights[[self.analysis.index[name] for name in names]], False),
+            "plus50": (analysis("Plus50", False), False),
+            "sub325": (analysis("Sub325", False), False),
+            "al2o3": (analysis("Al2O3"), False),
+            "sio2": (analysis("SiO2"), False),
+            "fe2o3": (analysis("Fe2O3"), False)
+        })
     
     def setSelection(self, selection):
         self.selection = selection
@@ -95,7 +121,6 @@ class MixturesTab(QWidget):
             if confirm == QMessageBox.StandardButton.Yes:
                 usedIn = self.mainApp.db.delMixture(mixture)
                 if len(usedIn) == 0:
-                    self.refreshTable()
                     QMessageBox.information(self.mainApp, "Success!", f"Deleted mixture {mixture}")
                 else:
                     errorMessage(self.mainApp, [f"{mixture} is used in {item}!" for item in usedIn])
@@ -103,19 +128,55 @@ class MixturesTab(QWidget):
     def reportSelection(self):
         if len(self.selection) == 0:
             errorMessage(self.mainApp, ["No mixtures selected."])
-        for mixture in self.selection:
+        elif len(self.selection) == 1:
+            mixture = self.selection[0]
             reportFile  = QFileDialog.getSaveFileName(self, f"Save {mixture} Report As", os.path.expanduser("~"), "Portable Document Format (*.pdf)")
             if not reportFile[0] == "":
-                pdf = PDFReport(self.mainApp.db, reportFile[0])
-                pdf.mixReport(mixture)
-                startfile(reportFile[0])
+                self.mainApp.reports.add(f"{mixture} report", reportFile[0], self.mainApp.db, "mixReport", mixture)
+        else:
+            self.reportBatch(self.selection[:])
+
+    # Several mixtures go into one PDF, or one PDF each in a zip.
+    def reportBatch(self, mixtures):
+        reportFile  = QFileDialog.getSaveFileName(self, f"Save {len(mixtures)} Mixture Reports As", os.path.expanduser("~"), "Portable Document Format (*.pdf);;Zip Archive (*.zip)")
+        if reportFile[0] == "":
+            return
+        # reportlab is only loaded once a report is asked for
+        from report import mixZip
+        if reportFile[0].lower().endswith(".zip") or reportFile[1].startswith("Zip"):
+            self.mainApp.reports.add(f"{len(mixtures)} mixture reports", reportFile[0], self.mainApp.db, mixZip, mixtures)
+        else:
+            self.mainApp.reports.add(f"{len(mixtures)} mixture report", reportFile[0], self.mainApp.db, "mixBook", mixtures)
     
     def refreshTable(self):
         self.genTableData()
         self.table.setData(self.mixtures)
+        self.search.reset()
         selection = [mixture for mixture in self.selection if mixture in self.mainApp.db.mixtures]
         self.setSelection(selection)
 
+    # Follows a database change (see changes.py): a mixture's row is only
+    # analysed again and redrawn when it or one of its materials changed.
+    def onChange(self, event):
+        db = self.mainApp.db
+        model = self.table.dbModel
+        if event.kind == "mixtures":
+            if not event.action == "removed" and not "name" in event.fields:
+                self.analysis.update([name for name in event.names if name in db.mixtures])
+            names = model.follow(event, db.mixtures)
+            if names == None:
+                self.refreshTable()
+                return
+            self.search.changed(names, event.names if event.action == "removed" else ())
+        elif event.kind == "materials" and event.action == "changed":
+            names = db.dependents(event.kind, event.ids)["mixtures"]
+            self.analysis.update(names)
+            self.search.changed(names)
+        else:
+            return
+        model.changedNames(names)
+        self.setSelection([mixture for mixture in self.selection if mixture in db.mixtures])
+
 class MixturesDetailsWindow(QWidget):
     def __init__(self, entry, mainApp: MainWindow):
         super().__init__()
@@ -129,27 +190,16 @@ class MixturesDetailsWindow(QWidget):
         ]
         for i in range(len(mixture.materials)):
             labels.append([QLabel(f"Material {i+1}: {mixture.materials[i]}"), QLabel(f"Weight: {mixture.weights[i]}")])
+        analysis = MixtureAnalysis(self.mainApp.db, [entry])
         labels.extend([
+            [QLabel(f"{prop}: {analysis.format(entry, prop, spec="{:.4f}%")}") for prop in MixtureAnalysis.chemistry[:5]],
+            [QLabel(f"{prop}: {analysis.format(entry, prop, spec="{:.4f}%")}") for prop in MixtureAnalysis.chemistry[5:]],
             [
-                QLabel(f"SiO2: {mixture.getProp("SiO2"):.4f}%"),
-                QLabel(f"Al2O3: {mixture.getProp("Al2O3"):.4f}%"),
-                QLabel(f"Fe2O3: {mixture.getProp("Fe2O3"):.4f}%"),
-                QLabel(f"TiO2: {mixture.getProp("TiO2"):.4f}%"),
-                QLabel(f"Li2O: {mixture.getProp("Li2O"):.4f}%")
-            ],
-            [
-                QLabel(f"P2O5: {mixture.getProp("P2O5"):.4f}%"),
-                QLabel(f"Na2O: {mixture.getProp("Na2O"):.4f}%"),
-                QLabel(f"CaO: {mixture.getProp("CaO"):.4f}%"),
-                QLabel(f"K2O: {mixture.getProp("K2O"):.4f}%"),
-                QLabel(f"MgO: {mixture.getProp("MgO"):.4f}%")
-            ],
-            [
-                QLabel(f"+50: {mixture.getProp("Plus50", False):.4f}%"),
-                QLabel(f"-50+100: {mixture.getProp("Sub50Plus100", False):.4f}%"),
-                QLabel(f"-100+200: {mixture.getProp("Sub100Plus200", False):.4f}%"),
-                QLabel(f"-200+325: {mixture.getProp("Sub200Plus325", False):.4f}%"),
-                QLabel(f"-325: {mixture.getProp("Sub325", False):.4f}%")
+                QLabel(f"+50: {analysis.format(entry, "Plus50", False, "{:.4f}%")}"),
+                QLabel(f"-50+100: {analysis.format(entry, "Sub50Plus100", False, "{:.4f}%")}"),
+                QLabel(f"-100+200: {analysis.format(entry, "Sub100Plus200", False, "{:.4f}%")}"),
+                QLabel(f"-200+325: {analysis.format(entry, "Sub200Plus325", False, "{:.4f}%")}"),
+                QLabel(f"-325: {analysis.format(entry, "Sub325", False, "{:.4f}%")}")
             ]
         ])
 
@@ -207,20 +257,20 @@ class MixturesEditWindow(QWidget):
 
         if len(errors) == 0:
             isNone = self.mixture == None
-            if isNew:
-                self.mixture = Mixture(name)
-                self.mainApp.db.addMixture(self.mixture)
-            else:
-                assert(not isNone)
-                self.mainApp.db.updateMixture(self.mixture.name, name)
-            self.mixture.materials = []
-            self.mixture.weights = []
-            for i in range(len(materials)):
-                self.mixture.add(materials[i], weights[i])
+            # the tables hear about the mixture once it is complete
+            with self.mainApp.db.changes.batch():
+                if isNew:
+                    self.mixture = Mixture(name)
+                    self.mainApp.db.addMixture(self.mixture)
+                else:
+                    assert(not isNone)
+                    self.mainApp.db.updateMixture(self.mixture.name, name)
+                self.mixture.materials = []
+                self.mixture.weights = []
+                for i in range(len(materials)):
+                    self.mixture.add(materials[i], weights[i])
             if isNone:
                 self.mixture = None
-            self.mainApp.mixturesTab.refreshTable()
-            self.mainApp.partsTab.refreshTable()
             res = True
         else:
             # self.error = ErrorWindow(errors)
@@ -1,6 +1,7 @@
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QMessageBox
-from table import DBTable
+from table import DBTable, SearchBar
 from app import MainWindow
+from search import SearchIndex
 from records import Package
 from error import ErrorWindow, errorMessage
 from utils import getComboBox, widgetFromList, checkInput
@@ -12,8 +13,9 @@ class PackagingTab(QWidget):
         self.windows = []
         # self.error = None
         self.genTableData()
-        self.table = DBTable(self.data, self.headers)
+        self.table = DBTable(self.data, self.headers, self.cell, self.key)
         self.table.parentTab = self
+        self.search = SearchBar(self.table, self.searchIndex)
 
         self.selection = []
         self.selectLabel = QLabel("Selection: N/A")
@@ -35,22 +37,35 @@ class PackagingTab(QWidget):
         barLayout.addWidget(delete)
 
         layout = QVBoxLayout()
+        layout.addWidget(self.search)
         layout.addWidget(self.table)
         layout.addLayout(barLayout)
         self.setLayout(layout)
     
+    def key(self, entry):
+        item = self.mainApp.db.packaging[entry]
+        return (item.kind, entry)
+
     def genTableData(self):
         db = self.mainApp.db
-        def getKey(entry):
-            item = db.packaging[entry]
-            return (item.kind, entry)
         self.headers = ["Item", "Type", "Price"]
-        self.data = [[
-            entry,
-            db.packaging[entry].kind,
-            "${:.4f}".format(db.packaging[entry].price)
-        ] for entry in db.packaging]
-        self.data.sort(key=lambda row: getKey(row[0]))
+        # one formatter per column, called only for the cells in view
+        self.columns = [
+            lambda entry: entry,
+            lambda entry: db.packaging[entry].kind,
+            lambda entry: "${:.4f}".format(db.packaging[entry].price)
+        ]
+        self.data = sorted(db.packaging.keys(), key=self.key)
+
+    def cell(self, entry, column):
+        return self.columns[column](entry)
+
+    # An item is found by its name and type and filtered on its price.
+    def searchIndex(self):
+        db = self.mainApp.db
+        return SearchIndex(lambda: self.table.dbModel.names, lambda entry: [entry, db.packaging[entry].kind], {
+            "price": (lambda names: [db.packaging[name].price for name in names], False)
+        })
     
     def setSelection(self, selection):
         self.selection = selection
@@ -76,7 +91,6 @@ class PackagingTab(QWidget):
             if confirm == QMessageBox.StandardButton.Yes:
                 usedIn = self.mainApp.db.delPackaging(packaging)
                 if len(usedIn) == 0:
-                    self.refreshTable()
                     QMessageBox.information(self.mainApp, "Success!", f"Deleted packaging {packaging}")
                 else:
                     errorMessage(self.mainApp, [f"{packaging} is used in {item}!" for item in usedIn])
@@ -84,8 +98,21 @@ class PackagingTab(QWidget):
     def refreshTable(self):
         self.genTableData()
         self.table.setData(self.data)
+        self.search.reset()
         selection = [package for package in self.selection if package in self.mainApp.db.packaging]
         self.setSelection(selection)
+
+    # Follows a database change (see changes.py) to the packaging.
+    def onChange(self, event):
+        if not event.kind == "packaging":
+            return
+        names = self.table.dbModel.follow(event, self.mainApp.db.packaging)
+        if names == None:
+            self.refreshTable()
+            return
+        self.search.changed(names, event.names if event.action == "removed" else ())
+        self.table.dbModel.changedNames(names)
+        self.setSelection([package for package in self.selection if package in self.mainApp.db.packaging])
         
 class PackagingEditWindow(QWidget):
     def __init__(self, entry, mainApp: MainWindow):
@@ -133,18 +160,18 @@ class PackagingEditWindow(QWidget):
 
         if len(errors) == 0:
             isNone = self.item == None
-            if isNew:
-                self.item = Package(name, None, None)
-                self.mainApp.db.addPackaging(self.item)
-            else:
-                assert(not isNone)
-                self.mainApp.db.updatePackaging(self.item.name, name)
-            self.item.kind = kind
-            self.item.price = price
+            # the tables hear about the item once it is complete
+            with self.mainApp.db.changes.batch():
+                if isNew:
+                    self.item = Package(name, None, None)
+                    self.mainApp.db.addPackaging(self.item)
+                else:
+                    assert(not isNone)
+                    self.mainApp.db.updatePackaging(self.item.name, name)
+                self.item.kind = kind
+                self.item.price = price
             if isNone:
                 self.item = None
-            self.mainApp.packagingTab.refreshTable()
-            self.mainApp.partsTab.refreshTable()
             res = True
         else:
             # self.error = ErrorWindow(errors)
@@ -1,12 +1,13 @@
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, QCheckBox, QMessageBox, QFileDialog
 from PySide6.QtCore import Qt
-from table import DBTable
+from table import DBTable, SearchBar
 from app import MainWindow
 from records import Part
+from cost_table import CostTable
+from search import SearchIndex
 from error import ErrorWindow, errorMessage
-from utils import getComboBox, widgetFromList, checkInput, startfile
-
-from report import PDFReport
+from utils import getComboBox, widgetFromList, checkInput
+import numpy as np
 import os
 
 class PartsTab(QWidget):
@@ -16,8 +17,9 @@ class PartsTab(QWidget):
         self.windows = []
         # self.error = None
         self.genTableData()
-        self.table = DBTable(self.parts, self.headers)
+        self.table = DBTable(self.parts, self.headers, self.cell, self.key)
         self.table.parentTab = self
+        self.search = SearchBar(self.table, self.searchIndex)
 
         self.selection = []
         self.selectLabel = QLabel("Selection: N/A")
@@ -42,32 +44,70 @@ class PartsTab(QWidget):
         barLayout.addWidget(report)
 
         layout = QVBoxLayout()
+        layout.addWidget(self.search)
         layout.addWidget(self.table)
         layout.addLayout(barLayout)
         self.setLayout(layout)
     
+    # Sales of every part are read in one go (see Database.columnValues),
+    # those of a changed or new part when it is next asked for.
+    def getSales(self, entry):
+        if not entry in self.sales:
+            self.sales[entry] = self.mainApp.db.parts[entry].sales
+        return self.sales[entry]
+
+    def key(self, entry):
+        isQuote = 0 if isinstance(self.getSales(entry), int) else 1
+        return (isQuote, entry)
+
     def genTableData(self):
         db = self.mainApp.db
-        def getKey(entry):
-            item = db.parts[entry]
-            isQuote = 0 if isinstance(item.sales, int) else 1
-            return (isQuote, entry)
         self.headers = ["Part", "Weight", "Mix", "Materials", "Labor", "Scrap", "Packaging", "Var. Cost", "Man. Cost", "Total Cost", "Price", "Sales"]
-        self.parts = [[
-            entry,
-            "{} lbs".format(db.parts[entry].weight),
-            db.parts[entry].mix,
-            "${:.4f}".format(db.parts[entry].getMatlCost()),
-            "${:.4f}".format(db.parts[entry].getLaborCost()),
-            "{:.2f}%".format(100 * db.parts[entry].getScrap()),
-            "${:.4f}".format(db.parts[entry].getPackagingCost()),
-            "${:.4f}".format(db.parts[entry].getVariableCost()),
-            "${:.4f}".format(db.parts[entry].getManufacturingCost()),
-            "${:.4f}".format(db.parts[entry].getTotalCost()),
-            "${:.4f}".format(db.parts[entry].price),
-            str(db.parts[entry].sales)
-        ] for entry in db.parts]
-        self.parts.sort(key=lambda row: getKey(row[0]))
+        self.costs = CostTable(db)
+        self.sales = db.columnValues("parts", "sales")
+        # one formatter per column, called only for the cells in view
+        self.columns = [
+            lambda entry: entry,
+            lambda entry: "{} lbs".format(db.parts[entry].weight),
+            lambda entry: db.parts[entry].mix,
+            lambda entry: "${:.4f}".format(self.costs.get(entry, "matlCost")),
+            lambda entry: "${:.4f}".format(self.costs.get(entry, "laborCost")),
+            lambda entry: "{:.2f}%".format(100 * self.costs.get(entry, "scrap")),
+            lambda entry: "${:.4f}".format(self.costs.get(entry, "packagingCost")),
+            lambda entry: "${:.4f}".format(self.costs.get(entry, "variableCost")),
+            lambda entry: "${:.4f}".format(self.costs.get(entry, "manufacturingCost")),
+            lambda entry: "${:.4f}".format(self.costs.get(entry, "totalCost")),
+            lambda entry: "${:.4f}".format(db.parts[entry].price),
+            lambda entry: str(db.parts[entry].sales)
+        ]
+        self.parts = sorted(self.sales, key=self.key)
+
+    def cell(self, entry, column):
+        return self.columns[column](entry)
+
+    # A part is found by its name, mix and packaging, and filtered on its
+    # costs as the table shows them.
+    def searchIndex(self):
+        db = self.mainApp.db
+        def costs(column):
+            return lambda names: self.costs[column][np.fromiter(map(self.costs.index.__getitem__, names), dtype=int, count=len(names))]
+        def terms(entry):
+            part = db.parts[entry]
+            return [entry, part.mix, part.box, part.pallet, *part.pad, *part.misc]
+        return SearchIndex(lambda: self.table.dbModel.names, terms, {
+            "weight": (costs("weight"), False),
+            "materials": (costs("matlCost"), False),
+            "labor": (costs("laborCost"), False),
+            "scrap": (costs("scrap"), True),
+            "packaging": (costs("packagingCost"), False),
+            "var": (costs("variableCost"), False),
+            "man": (costs("manufacturingCost"), False),
+            "total": (costs("totalCost"), False),
+            "price": (costs("price"), False),
+            "gm": (costs("GM"), True),
+            "cm": (costs("CM"), True),
+            "sales": (lambda names: [sales if isinstance(sales, int) else None for sales in map(self.getSales, names)], False)
+        })
     
     def setSelection(self, selection):
         self.selection = selection
@@ -94,15 +134,12 @@ class PartsTab(QWidget):
 
             if confirm == QMessageBox.StandardButton.Yes:
                 self.mainApp.db.delPart(part)
-                self.refreshTable()
                 QMessageBox.information(self.mainApp, "Success!", f"Deleted part {part}")
 
     def reportSales(self):
         reportFile  = QFileDialog.getSaveFileName(self, f"Save Sales Report As", os.path.expanduser("~"), "Portable Document Format (*.pdf)")
         if not reportFile[0] == "":
-            pdf = PDFReport(self.mainApp.db, reportFile[0])
-            pdf.salesReport()
-            startfile(reportFile[0])
+            self.mainApp.reports.add("Sales report", reportFile[0], self.mainApp.db, "salesReport")
     
     def openNew(self):
         self.windows.append(PartsEditWindow(None, self.mainApp))
@@ -110,9 +147,40 @@ class PartsTab(QWidget):
     def refreshTable(self):
         self.genTableData()
         self.table.setData(self.parts)
+        self.search.reset()
         selection = [part for part in self.selection if part in self.mainApp.db.parts]
         self.setSelection(selection)
 
+    # Follows a database change (see changes.py): only the parts it touches,
+    # directly or through their mixture or packaging, are costed again and
+    # redrawn.  A new global value changes every cost.
+    def onChange(self, event):
+        db = self.mainApp.db
+        model = self.table.dbModel
+        if event.kind == "globals":
+            self.costs = CostTable(db)
+            model.changedAll()
+            self.search.valuesChanged()
+            return
+        if event.kind == "parts":
+            for name in event.names:
+                self.sales.pop(name, None)
+            if not event.action == "removed" and not "name" in event.fields:
+                self.costs.update([name for name in event.names if name in db.parts])
+            names = model.follow(event, db.parts)
+            if names == None:
+                self.refreshTable()
+                return
+            self.search.changed(names, event.names if event.action == "removed" else ())
+        elif event.action == "changed":
+            names = db.dependents(event.kind, event.ids)["parts"]
+            self.costs.update(names)
+            self.search.changed(names)
+        else:
+            return
+        model.changedNames(names)
+        self.setSelection([part for part in self.selection if part in db.parts])
+
 class PartsDetailsWindow(QWidget):
     def __init__(self, entry, mainApp: MainWindow):
         super().__init__()
@@ -265,18 +333,19 @@ class PartsEditWindow(QWidget):
 
         if len(errors) == 0:
             isNone = self.part == None
-            if isNew:
-                self.part = Part(name)
-                self.mainApp.db.addPart(self.part)
-            else:
-                assert(not isNone)
-                self.mainApp.db.updatePart(self.part.name, name)
-            self.part.setProduction(weight, mix, pressing, turning, loading, unloading, inspection, greenScrap, fireScrap, price)
-            self.part.setPackaging(box, piecesPerBox, pallet, boxesPerPallet, pad, padsPerBox, misc)
-            self.part.sales = sales
+            # the tables hear about the part once it is complete
+            with self.mainApp.db.changes.batch():
+                if isNew:
+                    self.part = Part(name)
+                    self.mainApp.db.addPart(self.part)
+                else:
+                    assert(not isNone)
+                    self.mainApp.db.updatePart(self.part.name, name)
+                self.part.setProduction(weight, mix, pressing, turning, loading, unloading, inspection, greenScrap, fireScrap, price)
+                self.part.setPackaging(box, piecesPerBox, pallet, boxesPerPallet, pad, padsPerBox, misc)
+                self.part.sales = sales
             if isNone:
                 self.part = None
-            self.mainApp.partsTab.refreshTable()
             res = True
         else:
             # self.error = ErrorWindow(errors)
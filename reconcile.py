@@ -0,0 +1,133 @@
+import csv
+import numpy as np
+
+from records import Database, ImportedPart
+from cost_table import CostTable
+
+# (term, Part Costs column) pairs checked for every imported part
+TERMS = [
+    ("matlCost", "G"),
+    ("batchingTime", "I"),
+    ("pressingTime", "K"),
+    ("turningTime", "M"),
+    ("loadingTime", "O"),
+    ("unloadingTime", "Q"),
+    ("inspectionTime", "S"),
+    ("laborCost", "U"),
+    ("grossMatlLaborCost", "W"),
+    ("packagingCost", "X"),
+    ("manufacturingOverhead", "Y"),
+    ("manufacturingCost", "AA"),
+    ("SGA", "AC"),
+    ("totalCost", "AE"),
+    ("GM", "AG"),
+    ("CM", "AH"),
+    ("variableCost", "AI"),
+    ("productivity", "AK")
+]
+RTOL = 1e-6
+ATOL = 1e-9
+
+def number(val):
+    if isinstance(val, bool) or not isinstance(val, (int, float)):
+        return np.nan
+    return float(val)
+
+# Compares the values cached in the costing workbook with the same terms
+# computed column-wise two ways: the workbook's own formulas (ImportedPart)
+# and the converted model (Part, through CostTable).  Terms the Part model
+# does not have stay NaN and are not counted as failures.
+class Reconciliation:
+    def __init__(self, db: Database, importedParts: dict[str, ImportedPart], checkRows: dict[str, int], sheet) -> None:
+        self.db = db
+        self.names = [name for name in db.parts if name in importedParts and name in checkRows]
+        self.terms = [term for term, col in TERMS]
+        self.columns = [col for term, col in TERMS]
+        self.expected = np.array([[number(sheet.value(col, checkRows[name])) for col in self.columns] for name in self.names], dtype=float).reshape(len(self.names), len(TERMS))
+        self.legacy = self.legacyCosts([importedParts[name] for name in self.names])
+        costs = CostTable(db, self.names)
+        missing = np.full(len(self.names), np.nan)
+        self.current = np.column_stack([costs.data.get(term, missing) for term in self.terms]).reshape(len(self.names), len(TERMS))
+        self.legacyOk = self.matches(self.legacy)
+        # only the terms CostTable does not compute are exempt; a computed
+        # term that is NaN (an unresolved mix or packaging item) diverges
+        uncomputed = np.array([not term in costs.data for term in self.terms], dtype=bool)
+        self.currentOk = self.matches(self.current) | uncomputed
+
+    def matches(self, values: np.ndarray) -> np.ndarray:
+        return np.isclose(values, self.expected, rtol = RTOL, atol = ATOL, equal_nan = True)
+
+    # ImportedPart's cost chain, term by term over every part at once.
+    def legacyCosts(self, parts: list[ImportedPart]) -> np.ndarray:
+        db = self.db
+        glob = db.globals
+        mixCosts = {}
+        if len(parts) > 0:
+            mixIndex, costs = CostTable(db, []).mixtureCosts()
+            mixCosts = {db.byId["mixtures"][id].name: costs[i] for id, i in mixIndex.items()}
+        prices = {name: item.price for name, item in db.packaging.items()}
+
+        def column(field):
+            return np.array([getattr(part, field) for part in parts], dtype=float)
+
+        def price(name):
+            return prices.get(name, np.nan)
+
+        weight = column("weight")
+        boardQty = column("boardQty")
+        scrap = column("scrap")
+        salePrice = column("price")
+        box = np.array([price(part.box) for part in parts], dtype=float)
+        pallet = np.array([price(part.pallet) for part in parts], dtype=float)
+        pads = np.array([sum(price(part.pad[i]) * part.padsPerBox[i] for i in range(len(part.pad))) for part in parts], dtype=float)
+        miscs = np.array([sum(price(misc) for misc in part.misc) for part in parts], dtype=float)
+        boxesPerPallet = column("boxesPerPallet")
+
+        col = {}
+        with np.errstate(divide="ignore", invalid="ignore"):
+            col["matlCost"] = weight * np.array([mixCosts.get(part.mix, np.nan) for part in parts], dtype=float) + weight * glob.gasCost
+            col["batchingTime"] = weight * glob.batchingFactor
+            col["pressingTime"] = 8 / (18 * column("pressing") * boardQty)
+            col["turningTime"] = column("turning") / (18 * boardQty)
+            col["loadingTime"] = column("loading") / (18 * boardQty)
+            col["unloadingTime"] = column("unloading") / (18 * boardQty)
+            col["inspectionTime"] = 1 / column("inspection")
+            laborHours = col["batchingTime"] + col["pressingTime"] + col["turningTime"] + col["loadingTime"] + col["unloadingTime"] + col["inspectionTime"]
+            col["laborCost"] = laborHours * glob.laborCost
+            col["grossMatlLaborCost"] = (col["matlCost"] + col["laborCost"]) / (1 - scrap)
+            col["packagingCost"] = ((box + pads) * boxesPerPallet + pallet) / (column("piecesPerBox") * boxesPerPallet) + miscs
+            col["manufacturingOverhead"] = weight * glob.manufacturingOverhead
+            col["manufacturingCost"] = col["grossMatlLaborCost"] + col["packagingCost"] + col["manufacturingOverhead"]
+            col["SGA"] = weight * glob.SGA
+            col["totalCost"] = col["manufacturingCost"] + col["SGA"]
+            col["variableCost"] = col["grossMatlLaborCost"] + col["packagingCost"]
+            col["GM"] = (salePrice - col["manufacturingCost"]) / salePrice
+            col["CM"] = (salePrice - col["variableCost"]) / salePrice
+            col["productivity"] = weight * (1 - scrap) / laborHours
+        return np.column_stack([col[term] for term in self.terms]).reshape(len(parts), len(TERMS))
+
+    # (part, term, column, expected, legacy, current, legacy ok, current ok)
+    # for every part and term, or only the diverging ones.
+    def rows(self, failuresOnly = False):
+        res = []
+        for i, name in enumerate(self.names):
+            for j, term in enumerate(self.terms):
+                legacyOk = bool(self.legacyOk[i, j])
+                currentOk = bool(self.currentOk[i, j])
+                if failuresOnly and legacyOk and currentOk:
+                    continue
+                res.append((name, term, self.columns[j], float(self.expected[i, j]), float(self.legacy[i, j]), float(self.current[i, j]), legacyOk, currentOk))
+        return res
+
+    def writeCSV(self, path, failuresOnly = False):
+        with open(path, "w", newline = "") as file:
+            writer = csv.writer(file)
+            writer.writerow(["part", "term", "column", "expected", "legacy", "current", "legacyOk", "currentOk"])
+            writer.writerows(self.rows(failuresOnly))
+
+    def printReport(self):
+        for name, term, col, expected, legacy, current, legacyOk, currentOk in self.rows(True):
+            print("{} | {} ({}) expected {:.6g} legacy {:.6g}{} current {:.6g}{}".format(name, term, col, expected, legacy, "" if legacyOk else " !", current, "" if currentOk else " !"))
+        legacyFailed = int((~self.legacyOk).sum())
+        currentFailed = int((~self.currentOk).sum())
+        print("Checked {} parts: {} legacy and {} current terms diverge".format(len(self.names), legacyFailed, currentFailed))
@@ -1,8 +1,95 @@
 import sqlite3
-from utils import listToString, stringToList
+from cache import Cache, cached
+from references import ReferenceIndex
+from changes import ChangeBus
+
+# Records reference each other by integer id.  Until a record is attached
+# to a Database its reference fields may still hold names; attaching
+# resolves them to ids.
+class Record:
+    table: str = None
+    # reference field -> Database collection it points into
+    refFields: dict[str, str] = {}
+    # table holding list entries one per row, and its owner id column
+    childTable: str = None
+    childKey: str = None
+
+    def __setattr__(self, name, value) -> None:
+        super().__setattr__(name, value)
+        if not name == "db":
+            self.changed(name)
+
+    def changed(self, *fields):
+        db = getattr(self, "db", None)
+        if not db == None:
+            db.changed(self, fields)
+
+    def use(self, *fields):
+        if not self.db == None:
+            for field in fields:
+                self.db.cache.read((self, field))
+
+    def refId(self, kind, ref):
+        db = getattr(self, "db", None)
+        if db == None or ref == None or isinstance(ref, int):
+            return ref
+        records = getattr(db, kind)
+        return records[ref].id if ref in records else ref
+
+    def refName(self, kind, ref):
+        db = getattr(self, "db", None)
+        if db == None or not isinstance(ref, int):
+            return ref
+        return db.byId[kind][ref].name
+
+    def resolve(self):
+        for field, kind in self.refFields.items():
+            ref = getattr(self, field)
+            if isinstance(ref, list):
+                ids = [self.refId(kind, val) for val in ref]
+            else:
+                ids = self.refId(kind, ref)
+            if not ids == ref:
+                setattr(self, field, ids)
+
+    # Builds a record straight from a saved row, skipping the change hooks
+    # that normal attribute assignment goes through.
+    @classmethod
+    def fromRow(cls, values):
+        record = cls.__new__(cls)
+        record.__dict__.update(zip(cls.columns, values))
+        record.__dict__["db"] = None
+        return record
+
+class Reference:
+    def __init__(self, field, kind) -> None:
+        self.field = field
+        self.kind = kind
+
+    def __get__(self, record, owner = None):
+        if record == None:
+            return self
+        return record.refName(self.kind, getattr(record, self.field))
+
+    def __set__(self, record, name):
+        setattr(record, self.field, record.refId(self.kind, name))
+
+class ReferenceList(Reference):
+    def __get__(self, record, owner = None):
+        if record == None:
+            return self
+        refs = getattr(record, self.field)
+        return None if refs == None else [record.refName(self.kind, ref) for ref in refs]
+
+    def __set__(self, record, names):
+        setattr(record, self.field, None if names == None else [record.refId(self.kind, name) for name in names])
+
+class Material(Record):
+    table = "materials"
+    columns = ["id", "name", "price", "freight", "SiO2", "Al2O3", "Fe2O3", "TiO2", "Li2O", "P2O5", "Na2O", "CaO", "K2O", "MgO", "LOI", "Plus50", "Sub50Plus100", "Sub100Plus200", "Sub200Plus325", "Sub325"]
 
-class Material:
     def __init__(self, name) -> None:
+        self.id = None
         self.name = name
         self.db: Database = None
         self.price = None
@@ -55,6 +142,7 @@ class Material:
     
     def getTuple(self):
         return (
+            self.id,
             self.name,
             self.price,
             self.freight,
@@ -77,10 +165,11 @@ class Material:
         )
     
     def fromTuple(self, vals):
-        self.name = vals[0]
-        self.setCost(*vals[1:3])
-        self.setChems(*vals[3:14])
-        self.setSizes(*vals[14:])
+        self.id = vals[0]
+        self.name = vals[1]
+        self.setCost(*vals[2:4])
+        self.setChems(*vals[4:15])
+        self.setSizes(*vals[15:])
     
     def __str__(self) -> str:
         res = "({} | {} {} | {}, {}, {}, {}, {}, {}, {}, {}, {}, {}, {} | {}, {}, {}, {}, {})".format(self.name,
@@ -89,82 +178,107 @@ class Material:
                  self.Plus50, self.Sub50Plus100, self.Sub100Plus200, self.Sub200Plus325, self.Sub325)
         return res
     
-class Package:
+class Package(Record):
+    table = "packaging"
+    columns = ["id", "name", "kind", "price"]
+
     def __init__(self, name, kind, price) -> None:
+        self.id = None
         self.name = name
         self.db: Database = None
         self.kind = kind
         self.price = price
     def getTuple(self):
         return (
+            self.id,
             self.name,
             self.kind,
             self.price
         )
     def fromTuple(self, values):
-        self.name = values[0]
-        self.kind = values[1]
-        self.price = values[2]
+        self.id = values[0]
+        self.name = values[1]
+        self.kind = values[2]
+        self.price = values[3]
     def __str__(self) -> str:
         res = "({} {} {})".format(self.name, self.kind, self.price)
         return res
 
-class Mixture:
+class Mixture(Record):
+    table = "mixtures"
+    columns = ["id", "name"]
+    refFields = {"materialIds": "materials"}
+    childTable = "mixture_components"
+    childKey = "mixture"
+    materials = ReferenceList("materialIds", "materials")
+
     def __init__(self, name, materials: list[str] = [], weights: list[int] = []) -> None:
+        self.id = None
         self.name = name
         self.db: Database = None
         self.materials = materials[:]
         self.weights = weights[:]
     def add(self, mat, wt):
-        self.materials.append(mat)
+        self.materialIds.append(self.refId("materials", mat))
         self.weights.append(wt)
+        self.changed("materialIds", "weights")
+    @cached("materialIds", "weights")
     def getCost(self):
         cost = 0
         weight = 0
         for wt in self.weights:
             weight += wt
-        for i in range(len(self.materials)):
+        for i in range(len(self.materialIds)):
             pct = self.weights[i] / weight
-            cost += pct * self.db.materials[self.materials[i]].getCostPerLb()
+            material = self.db.byId["materials"][self.materialIds[i]]
+            material.use("price", "freight")
+            cost += pct * material.getCostPerLb()
         return cost
     def getBatchWeight(self):
         weight = 0
         for wt in self.weights:
             weight += wt
         return weight
-    def getProp(self, prop, LOI = True):
-        ret = 0
-        for i in range(len(self.materials)):
-            matVal = getattr(self.db.materials[self.materials[i]], prop)
-            if matVal == None:
-                ret = None
-                break
-            pct = self.weights[i] / self.getBatchWeight()
-            ret += (pct * matVal / (1 - self.db.materials[self.materials[i]].LOI / 100)) if LOI else pct * matVal
-        return ret
     
     def getTuple(self):
         return (
-            self.name,
-            listToString(self.materials, str),
-            listToString(self.weights, float)
+            self.id,
+            self.name
         )
+
+    # (mixture, material, weight, position) rows of mixture_components
+    def getChildRows(self):
+        return [(self.id, self.materialIds[i], self.weights[i], i) for i in range(len(self.materialIds))]
     
     def fromTuple(self, values):
-        self.name = values[0]
-        self.materials = stringToList(values[1], str)
-        self.weights = stringToList(values[2], float)
+        self.id = values[0]
+        self.name = values[1]
+        self.materialIds = []
+        self.weights = []
+
+    # Rows arrive in position order while loading, so no change hooks.
+    def addChildRow(self, values):
+        self.materialIds.append(values[1])
+        self.weights.append(values[2])
+
+    @classmethod
+    def fromRow(cls, values):
+        mixture = super().fromRow(values)
+        mixture.__dict__.update(materialIds=[], weights=[])
+        return mixture
 
     def __str__(self) -> str:
         pairs = []
-        for i in range(len(self.materials)):
-            pair = "{}, {}".format(self.materials[i], self.weights[i])
+        materials = self.materials
+        for i in range(len(materials)):
+            pair = "{}, {}".format(materials[i], self.weights[i])
             pairs.append(pair)
         res = "({} | {})".format(self.name, " | ".join(pairs))
         return res
 
 class Globals:
     def __init__(self) -> None:
+        self.db: Database = None
         self.gasCost = 0.0523
         self.batchingFactor = 1.167/1466.5
         self.laborCost = 19.25
@@ -186,6 +300,17 @@ class Globals:
             "SGA"
         ]
 
+    def __setattr__(self, name, value) -> None:
+        super().__setattr__(name, value)
+        db = getattr(self, "db", None)
+        if not db == None and not name == "db":
+            db.globalChanged(name)
+
+    def use(self, *names):
+        if not self.db == None:
+            for name in names:
+                self.db.cache.read((self, name))
+
     def getStrings(self):
         return {
             "gasCost": ("Gas cost", "$ / lb"),
@@ -200,6 +325,7 @@ class Globals:
     
 class ImportedPart:
     def __init__(self, name) -> None:
+        self.id = None
         self.name = name
         self.db: Database = None
         self.weight = None
@@ -333,8 +459,20 @@ class ImportedPart:
                 self.price)
         return res
     
-class Part:
+class Part(Record):
+    table = "parts"
+    columns = ["id", "name", "weight", "mixId", "pressing", "turning", "loading", "unloading", "inspection", "greenScrap", "fireScrap", "boxId", "piecesPerBox", "palletId", "boxesPerPallet", "price", "sales"]
+    refFields = {"mixId": "mixtures", "boxId": "packaging", "palletId": "packaging", "padIds": "packaging", "miscIds": "packaging"}
+    childTable = "part_packaging"
+    childKey = "part"
+    mix = Reference("mixId", "mixtures")
+    box = Reference("boxId", "packaging")
+    pallet = Reference("palletId", "packaging")
+    pad = ReferenceList("padIds", "packaging")
+    misc = ReferenceList("miscIds", "packaging")
+
     def __init__(self, name) -> None:
+        self.id = None
         self.name = name
         self.db: Database = None
         self.weight = None
@@ -375,11 +513,10 @@ class Part:
         self.boxesPerPallet = boxesPerPallet
         self.pad = pad
         self.padsPerBox = padsPerBox
-        self.misc.clear()
-        self.misc.extend(misc)
+        self.misc = misc
 
     def getMixCost(self):
-        return self.weight * self.db.mixtures[self.mix].getCost()
+        return self.weight * self.db.byId["mixtures"][self.mixId].getCost()
     
     def getGasCost(self):
         return self.weight * self.db.globals.gasCost
@@ -396,12 +533,14 @@ class Part:
     def getTurningTime(self):
         return 1 / self.turning
     
+    @cached("weight", "pressing", "turning", globals=["batchingFactor"])
     def getLaborHours(self):
         return self.getBatchingTime() + self.getPressingTime() + self.getTurningTime()
     
     def getLaborCost(self):
         return self.getLaborHours() * self.db.globals.laborCost
     
+    @cached("fireScrap", globals=["greenScrap"])
     def getScrap(self):
         # return self.greenScrap +self.fireScrap
         return (self.db.globals.greenScrap / 100) + self.fireScrap
@@ -410,16 +549,22 @@ class Part:
     def getGrossMatlLaborCost(self):
         return (self.getMatlCost() + self.getLaborCost()) / (1 - self.getScrap()) 
     
+    @cached("boxId", "piecesPerBox", "palletId", "boxesPerPallet", "padIds", "padsPerBox", "miscIds")
     def getPackagingCost(self):
-        boxCost = self.db.packaging[self.box].price
+        packaging = self.db.byId["packaging"]
+        packaging[self.boxId].use("price")
+        boxCost = packaging[self.boxId].price
         padCost = 0
-        for i in range(len(self.pad)):
-            padCost += self.db.packaging[self.pad[i]].price * self.padsPerBox[i]
-        palletCost = self.db.packaging[self.pallet].price
+        for i in range(len(self.padIds)):
+            packaging[self.padIds[i]].use("price")
+            padCost += packaging[self.padIds[i]].price * self.padsPerBox[i]
+        packaging[self.palletId].use("price")
+        palletCost = packaging[self.palletId].price
         perPalletCost = (boxCost + padCost) * self.boxesPerPallet + palletCost
         miscCost = 0
-        for i in range(len(self.misc)):
-            miscCost += self.db.packaging[self.misc[i]].price
+        for i in range(len(self.miscIds)):
+            packaging[self.miscIds[i]].use("price")
+            miscCost += packaging[self.miscIds[i]].price
 
         return perPalletCost / (self.piecesPerBox * self.boxesPerPallet) + miscCost
     
@@ -449,9 +594,10 @@ class Part:
     
     def getTuple(self):
             return (
+                self.id,
                 self.name,
                 self.weight,
-                self.mix,
+                self.mixId,
                 self.pressing,
                 self.turning,
                 self.loading,
@@ -459,32 +605,42 @@ class Part:
                 self.inspection,
                 self.greenScrap,
                 self.fireScrap,
-                self.box,
+                self.boxId,
                 self.piecesPerBox,
-                self.pallet,
+                self.palletId,
                 self.boxesPerPallet,
-                listToString(self.pad, str),
-                listToString(self.padsPerBox, int),
-                listToString(self.misc, str),
                 self.price,
                 self.sales
             )
+
+    # (part, item, role, qty, position) rows of part_packaging
+    def getChildRows(self):
+        rows = [(self.id, self.padIds[i], "pad", self.padsPerBox[i], i) for i in range(len(self.padIds))]
+        rows += [(self.id, self.miscIds[i], "misc", None, len(rows) + i) for i in range(len(self.miscIds))]
+        return rows
     
     def fromTuple(self, values):
-        self.name = values[0]
-        prod = list(values[1:10])
-        prod.append(values[17])
+        self.id = values[0]
+        self.name = values[1]
+        prod = list(values[2:11])
+        prod.append(values[15])
         self.setProduction(*prod)
-        self.setPackaging(
-            values[10],
-            values[11],
-            values[12],
-            values[13],
-            stringToList(values[14], str),
-            stringToList(values[15], int),
-            stringToList(values[16], str)
-        )
-        self.sales = values[18]
+        self.setPackaging(values[11], values[12], values[13], values[14], [], [], [])
+        self.sales = values[16]
+
+    # Rows arrive in position order while loading, so no change hooks.
+    def addChildRow(self, values):
+        if values[2] == "pad":
+            self.padIds.append(values[1])
+            self.padsPerBox.append(values[3])
+        else:
+            self.miscIds.append(values[1])
+
+    @classmethod
+    def fromRow(cls, values):
+        part = super().fromRow(values)
+        part.__dict__.update(padIds=[], padsPerBox=[], miscIds=[])
+        return part
 
     def __str__(self) -> str:
         res = "({} | {}, {}, {}, {}, {}, {}, {}, {}% + {}% | {}, {}, {}, {}, {}, {}, {} | {})".format(self.name,
@@ -493,21 +649,50 @@ class Part:
                 self.price)
         return res
 
+# records forgotten between two prunes of the cache (see Database.forget)
+PRUNE_AFTER = 100
+
+# Fields kept per imported workbook version (see converter.importHistory)
+HISTORY_FIELDS = {
+    "materials": ["price", "freight"],
+    "packaging": ["price"],
+    "parts": ["weight", "pressing", "turning", "loading", "unloading", "inspection", "fireScrap", "price"]
+}
+
 class Database:
     def __init__(self, globals: Globals, materials: dict[str, Material], mixtures: dict[str, Mixture], packaging: dict[str, Package], parts: dict[str, Part]) -> None:
         self.globals = globals
+        self.cache = Cache()
+        self.forgotten = 0
         self.materials = materials
         self.mixtures = mixtures
         self.packaging = packaging
         self.parts = parts
+        self.byId: dict[str, dict[int, Record]] = {"materials": {}, "mixtures": {}, "packaging": {}, "parts": {}}
+        self.nextId: dict[str, int] = {"materials": 1, "mixtures": 1, "packaging": 1, "parts": 1}
+        # built on first use, then kept up to date incrementally
+        self.indexed = False
+        self.materialUses = ReferenceIndex()
+        self.mixtureUses = ReferenceIndex()
+        self.packagingUses = ReferenceIndex()
+        # ids changed or deleted since the last save, per table
+        self.dirty: dict[str, set] = {"globals": set(), "materials": set(), "mixtures": set(), "packaging": set(), "parts": set()}
+        self.deleted: dict[str, set[int]] = {"materials": set(), "mixtures": set(), "packaging": set(), "parts": set()}
+        # logs every change once set (see journal.py)
+        self.journal = None
+        # tells the views about every change (see changes.py)
+        self.changes = ChangeBus()
+        # version -> table -> record name -> HISTORY_FIELDS values
+        self.history: dict[str, dict[str, dict[str, dict]]] = {}
+        self.globals.db = self
         for entry in self.materials:
-            self.materials[entry].db = self
+            self.attach("materials", self.materials[entry])
         for entry in self.mixtures:
-            self.mixtures[entry].db = self
+            self.attach("mixtures", self.mixtures[entry])
         for entry in self.packaging:
-            self.packaging[entry].db = self
+            self.attach("packaging", self.packaging[entry])
         for entry in self.parts:
-            self.parts[entry].db = self
+            self.attach("parts", self.parts[entry])
         self.toWrite: dict[str, list[str]] = {
             # "globals": self.globals.getGlobals(),
             "materials": list(self.materials.keys()),
@@ -516,117 +701,270 @@ class Database:
             "parts": list(self.parts.keys())
         }
     
-    def updatePart(self, entry, name):
+    def attach(self, kind, record: Record):
+        # references resolve before anyone hears of the record
+        with self.changes.batch():
+            ids = self.byId[kind]
+            if record.id == None:
+                record.id = self.nextId[kind]
+            assert(not record.id in ids)
+            self.nextId[kind] = max(self.nextId[kind], record.id + 1)
+            ids[record.id] = record
+            record.db = self
+            if isinstance(record, Record):
+                record.resolve()
+            self.reindex(record)
+            self.dirty[kind].add(record.id)
+            if not self.journal == None:
+                self.journal.add(kind, record)
+            self.changes.emit(kind, "added", record.id, record.name)
+    
+    # Fast path for records read back from a saved file: their references
+    # are already ids and they are not dirty.
+    def loadRecord(self, record: Record):
+        getattr(self, record.table)[record.name] = record
+        self.byId[record.table][record.id] = record
+        self.nextId[record.table] = max(self.nextId[record.table], record.id + 1)
+        record.__dict__["db"] = self
+        self.reindex(record)
+    
+    def changed(self, record: Record, fields):
+        for field in fields:
+            self.cache.invalidate((record, field))
+        if self.byId[record.table].get(record.id) is record:
+            self.dirty[record.table].add(record.id)
+            if not self.journal == None:
+                self.journal.setFields(record, fields)
+            self.changes.emit(record.table, "changed", record.id, record.name, fields)
+        for field in fields:
+            if field in record.refFields:
+                self.reindex(record)
+                break
+    
+    def buildIndex(self):
+        if not self.indexed:
+            self.indexed = True
+            for record in self.byId["mixtures"].values():
+                self.reindex(record)
+            for record in self.byId["parts"].values():
+                self.reindex(record)
+    
+    def reindex(self, record: Record):
+        if not self.indexed:
+            return
+        if isinstance(record, Mixture):
+            if self.byId["mixtures"].get(record.id) is record:
+                materials = self.byId["materials"]
+                self.materialUses.set(record, [(materials[ref], "material") for ref in record.materialIds if ref in materials])
+        elif isinstance(record, Part):
+            if self.byId["parts"].get(record.id) is record:
+                mixtures = self.byId["mixtures"]
+                packaging = self.byId["packaging"]
+                self.mixtureUses.set(record, [(mixtures[record.mixId], "mix")] if record.mixId in mixtures else [])
+                refs = []
+                for role, ids in (("box", [record.boxId]), ("pallet", [record.palletId]), ("pad", record.padIds or []), ("misc", record.miscIds)):
+                    refs.extend([(packaging[ref], role) for ref in ids if ref in packaging])
+                self.packagingUses.set(record, refs)
+    
+    def forget(self, kind, record: Record):
+        for field in vars(record):
+            self.cache.invalidate((record, field))
+        # values cached for the record can still be named in the
+        # dependency sets of what they read
+        self.forgotten += 1
+        if self.forgotten >= PRUNE_AFTER:
+            self.cache.prune()
+            self.forgotten = 0
+        self.materialUses.remove(record)
+        self.mixtureUses.remove(record)
+        self.packagingUses.remove(record)
+        del self.byId[kind][record.id]
+        self.dirty[kind].discard(record.id)
+        self.deleted[kind].add(record.id)
+        if not self.journal == None:
+            self.journal.delete(kind, record)
+        self.changes.emit(kind, "removed", record.id, record.name)
+    
+    def globalChanged(self, name):
+        self.cache.invalidate((self.globals, name))
+        self.dirty["globals"].add(name)
+        if not self.journal == None:
+            self.journal.setGlobal(name, getattr(self.globals, name))
+        self.changes.emit("globals", "changed", name, name, [name])
+    
+    def clearChanges(self):
+        for changes in self.dirty.values():
+            changes.clear()
+        for changes in self.deleted.values():
+            changes.clear()
+
+    # Hands the pending changes to a save and starts a new change set, so
+    # edits made while the save runs are kept for the next one.
+    def takeChanges(self):
+        dirty, deleted = self.dirty, self.deleted
+        self.dirty = {kind: set() for kind in dirty}
+        self.deleted = {kind: set() for kind in deleted}
+        return dirty, deleted
+
+    # Called once a save has written everything taken from the change set.
+    def changesSaved(self):
+        pass
+
+    # Puts back changes taken by a save that failed.
+    def restoreChanges(self, dirty, deleted):
+        self.dirty["globals"] |= dirty["globals"]
+        for kind in deleted:
+            self.dirty[kind] |= {id for id in dirty[kind] if id in self.byId[kind]}
+            self.deleted[kind] |= deleted[kind]
+
+    # name -> field of every record of a table.  LazyDatabase reads it from
+    # the file instead of reading every record.
+    def columnValues(self, table, field):
+        return {record.name: getattr(record, field) for record in self.byId[table].values()}
+
+    # Records referring to record, with the role of every reference.
+    def referrers(self, record: Record) -> dict[Record, list[str]]:
+        if isinstance(record, Material):
+            index = self.materialUses
+        elif isinstance(record, Mixture):
+            index = self.mixtureUses
+        elif isinstance(record, Package):
+            index = self.packagingUses
+        else:
+            return {}
+        self.buildIndex()
+        return index.roles(record)
+
+    # Records the versioned fields of every record as they are now.
+    # Versions are keyed by record name, which is what stays the same
+    # from one workbook to the next.
+    def recordVersion(self, version):
+        self.history[version] = {table: {record.name: {field: getattr(record, field) for field in fields} for record in self.byId[table].values()} for table, fields in HISTORY_FIELDS.items()}
+
+    def addHistoryRow(self, values):
+        version, table, name, field, value = values
+        self.history.setdefault(version, {}).setdefault(table, {}).setdefault(name, {})[field] = value
+
+    # (version, table, name, field, value) rows of the history table
+    def historyRows(self):
+        return [(version, table, name, field, value) for version, tables in self.history.items() for table, records in tables.items() for name, fields in records.items() for field, value in fields.items()]
+
+    # version -> field values of the named record, oldest version first.
+    def getHistory(self, table, name) -> dict[str, dict]:
+        return {version: tables[table][name] for version, tables in sorted(self.history.items()) if name in tables.get(table, {})}
+
+    # Detached copy of the globals and every record, or only of records and
+    # the records they refer to, for readers on other threads (see
+    # report_worker.py).  Nothing done to the copy reaches this database,
+    # its journal or its file.
+    def snapshot(self, records: list[Record] = None) -> "Database":
+        db = emptyDB()
+        for name in self.globals.getGlobals():
+            setattr(db.globals, name, getattr(self.globals, name))
+        if records == None:
+            records = [record for table in self.byId for record in self.byId[table].values()]
+        else:
+            wanted = {}
+            # in the order given, then what they refer to
+            pending = list(records)
+            for record in pending:
+                if not (record.table, record.id) in wanted:
+                    wanted[(record.table, record.id)] = record
+                    for field, kind in record.refFields.items():
+                        ids = getattr(record, field)
+                        for id in ids if isinstance(ids, list) else [ids]:
+                            if not id == None and id in self.byId[kind]:
+                                pending.append(self.byId[kind][id])
+            # tables in order, so references load before their referrers
+            records = sorted(wanted.values(), key = lambda record: list(self.byId).index(record.table))
+        for record in records:
+            copy = type(record).fromRow(record.getTuple())
+            for row in record.getChildRows() if not record.childTable == None else []:
+                copy.addChildRow(row)
+            db.loadRecord(copy)
+        db.clearChanges()
+        return db
+
+    # Names of the mixtures and parts whose values depend on the records of
+    # kind with the given ids, directly or through a mixture.
+    def dependents(self, kind, ids) -> dict[str, list[str]]:
+        records = [self.byId[kind][id] for id in ids if id in self.byId[kind]]
+        mixtures = []
+        if kind == "materials":
+            mixtures = list(dict.fromkeys(mixture for material in records for mixture in self.referrers(material)))
+            records = mixtures
+        elif not kind in ("mixtures", "packaging"):
+            records = []
+        parts = dict.fromkeys(part.name for record in records for part in self.referrers(record))
+        return {"mixtures": [mixture.name for mixture in mixtures], "parts": list(parts)}
+
+    def whereUsed(self, record: Record) -> dict[str, list[str]]:
+        return {referrer.name: roles for referrer, roles in self.referrers(record).items()}
+    
+    def rename(self, records: dict[str, Record], entry, name):
         if not name == entry:
-            parts = {name if key == entry else key:val for key, val in self.parts.items()}
-            self.parts = parts
-            self.parts[name].name = name
+            record = records.pop(entry)
+            records[name] = record
+            record.name = name
+    
+    def updatePart(self, entry, name):
+        self.rename(self.parts, entry, name)
     
     def addPart(self, part: Part):
         assert(not part.name in self.parts)
         self.parts[part.name] = part
-        part.db = self
+        self.attach("parts", part)
     
     def delPart(self, name):
         assert(name in self.parts)
+        self.forget("parts", self.parts[name])
         del self.parts[name]
     
     def updatePackaging(self, entry, name):
-        if not name == entry:
-            packaging = {name if key == entry else key:val for key, val in self.packaging.items()}
-            self.packaging = packaging
-            self.packaging[name].name = name
-            for pname in self.parts:
-                part = self.parts[pname]
-                if part.box == entry:
-                    part.box = name
-                if part.pallet == entry:
-                    part.pallet = name
-                for i in range(len(part.pad)):
-                    if part.pad[i] == entry:
-                        part.pad[i] = name
-                for i in range(len(part.misc)):
-                    if part.misc[i] == entry:
-                        part.misc[i] = name
+        self.rename(self.packaging, entry, name)
     
     def addPackaging(self, item: Package):
         assert(not item.name in self.packaging)
         self.packaging[item.name] = item
-        item.db = self
+        self.attach("packaging", item)
     
     def delPackaging(self, name):
         assert(name in self.packaging)
-        usedIn = []
-        for pname in self.parts:
-            used = False
-            part = self.parts[pname]
-            used = used or part.box == name
-            used = used or part.pallet == name
-            for i in range(len(part.pad)):
-                used = used or part.pad[i] == name
-            for i in range(len(part.misc)):
-                used = used or part.misc[i] == name
-            if used:
-                usedIn.append(pname)
+        usedIn = [part.name for part in self.referrers(self.packaging[name])]
         if len(usedIn) == 0:
+            self.forget("packaging", self.packaging[name])
             del self.packaging[name]
         return usedIn
     
     def updateMixture(self, entry, name):
-        if not name == entry:
-            mixtures = {name if key == entry else key:val for key, val in self.mixtures.items()}
-            self.mixtures = mixtures
-            self.mixtures[name].name = name
-            for pname in self.parts:
-                part = self.parts[pname]
-                if part.mix == entry:
-                    part.mix = name
+        self.rename(self.mixtures, entry, name)
     
     def addMixture(self, mixture: Mixture):
         assert(not mixture.name in self.mixtures)
         self.mixtures[mixture.name] = mixture
-        mixture.db = self
+        self.attach("mixtures", mixture)
 
     def delMixture(self, name):
         assert(name in self.mixtures)
-        usedIn = []
-        for pname in self.parts:
-            used = False
-            part = self.parts[pname]
-            used = used or part.mix == name
-            if used:
-                usedIn.append(pname)
+        usedIn = [part.name for part in self.referrers(self.mixtures[name])]
         if len(usedIn) == 0:
+            self.forget("mixtures", self.mixtures[name])
             del self.mixtures[name]
         return usedIn
     
     def updateMaterial(self, entry, name):
-        if not name == entry:
-            materials = {name if key == entry else key:val for key, val in self.materials.items()}
-            self.materials = materials
-            self.materials[name].name = name
-            for mname in self.mixtures:
-                mix = self.mixtures[mname]
-                for i in range(len(mix.materials)):
-                    if mix.materials[i] == entry:
-                        mix.materials[i] = name
+        self.rename(self.materials, entry, name)
     
     def addMaterial(self, material: Material):
         assert(not material.name in self.materials)
         self.materials[material.name] = material
-        material.db = self
+        self.attach("materials", material)
     
     def delMaterial(self, name):
         assert(name in self.materials)
-        usedIn = []
-        for mname in self.mixtures:
-            mix = self.mixtures[mname]
-            used = False
-            for i in range(len(mix.materials)):
-                used = used or mix.materials[i] == name
-            if used:
-                usedIn.append(mname)
+        usedIn = [mix.name for mix in self.referrers(self.materials[name])]
         if len(usedIn) == 0:
+            self.forget("materials", self.materials[name])
             del self.materials[name]
         return usedIn
     
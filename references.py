@@ -0,0 +1,31 @@
+# Reverse index of record references, kept up to date as records change.
+# Both sides are keyed by record object, so renames never touch the index.
+class ReferenceIndex:
+    def __init__(self) -> None:
+        self.uses: dict[object, dict[object, list[str]]] = {}
+        self.refs: dict[object, list[tuple[object, str]]] = {}
+
+    def set(self, referrer, refs: list[tuple[object, str]]):
+        self.remove(referrer)
+        if len(refs) > 0:
+            self.refs[referrer] = refs
+        for target, role in refs:
+            self.uses.setdefault(target, {}).setdefault(referrer, []).append(role)
+
+    def remove(self, referrer):
+        for target, role in self.refs.pop(referrer, []):
+            users = self.uses.get(target)
+            if not users == None:
+                users.pop(referrer, None)
+                if len(users) == 0:
+                    del self.uses[target]
+
+    def referrers(self, target) -> list:
+        return list(self.uses.get(target, {}).keys())
+
+    def roles(self, target) -> dict[object, list[str]]:
+        return {referrer: roles[:] for referrer, roles in self.uses.get(target, {}).items()}
+
+    def clear(self):
+        self.uses.clear()
+        self.refs.clear()
@@ -1,18 +1,42 @@
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
 from math import floor
+import hashlib
+import io
+import multiprocessing
+import os
+import re
+import zipfile
 
 from reportlab.lib.pagesizes import letter
 from reportlab.lib.units import inch
 from reportlab.pdfgen import canvas
 
 from records import Database
+from cost_table import CostTable, chunks
+from chemistry import MixtureAnalysis
 
+# mixtures per worker task of mixZip
+MIX_CHUNK = 25
+# part of every report digest; bump it when the layout of a report changes
+REPORT_VERSION = 1
+
+class ReportCancelled(Exception):
+    pass
+
+# progress, if given, is called with the number of every finished page;
+# cancelled, if given, is checked after every page and stops the report
+# before anything is written.
 class PDFReport:
-    def __init__(self, db: Database, path: str, margin: float = inch) -> None:
+    def __init__(self, db: Database, path: str, margin: float = inch, progress = None, cancelled = None) -> None:
         self.db = db
+        self.path = path
         self.pdf = canvas.Canvas(path, pagesize=letter)
         self.lineSpace = 1.3
         self.calculateMargins(margin)
         self.pageNum = 1
+        self.progress = progress
+        self.cancelled = cancelled
         self.setFont("Times-Roman", 12)
 
     def calculateMargins(self, margin: float):
@@ -27,6 +51,10 @@ class PDFReport:
     
     def nextPage(self):
         self.pdf.showPage()
+        if not self.progress == None:
+            self.progress(self.pageNum)
+        if not self.cancelled == None and self.cancelled():
+            raise ReportCancelled()
         self.pageNum += 1
         self.setupPage()
     
@@ -54,10 +82,7 @@ class PDFReport:
         self.drawText(text)
         self.setFont(*oldFont)
     
-    def drawTable(self, data: list[list[str]], headers: list[str] = None, widths: list[float] = None):
-        hasHeader = not headers == None
-        columns = len(widths) if not widths == None else len(headers) if hasHeader else len(data[0]) if len(data) > 0 else 1
-
+    def tableColumns(self, columns, widths: list[float] = None):
         if widths == None:
             widths = [(self.right - self.left) / columns for i in range(columns)]
 
@@ -69,13 +94,32 @@ class PDFReport:
         xVals = [startX]
         for width in widths:
             xVals.append(xVals[-1] + width)
-        
+        return xVals
+
+    def drawRow(self, xVals, drawY, row, bold = False):
         padding = self.fontSize / 3
-        rowHeight = self.fontSize + 1.5 * padding
+        if bold:
+            oldFont = (self.font, self.fontSize)
+            self.setFont("Times-Bold", self.fontSize)
+        for i in range(len(xVals) - 1):
+            self.pdf.drawString(xVals[i] + padding, drawY + padding, row[i])
+        if bold:
+            self.setFont(*oldFont)
+
+    def rowHeight(self):
+        return self.fontSize + 1.5 * (self.fontSize / 3)
+
+    # Draws as many rows of data as fit on the page; returns how many did.
+    def drawTable(self, data: list[list[str]], headers: list[str] = None, widths: list[float] = None):
+        hasHeader = not headers == None
+        columns = len(widths) if not widths == None else len(headers) if hasHeader else len(data[0]) if len(data) > 0 else 1
+        xVals = self.tableColumns(columns, widths)
+        
+        rowHeight = self.rowHeight()
         # includes header
         maxRows = floor((self.lastLine - self.bottom) / rowHeight)
         rows = min((1 if hasHeader else 0) + len(data), maxRows)
-        if rows == 0:
+        if rows <= 0:
             return 0
         
         yVals = [self.lastLine - i * rowHeight for i in range(rows + 1)]
@@ -83,23 +127,104 @@ class PDFReport:
         self.pdf.grid(xVals, yVals)
 
         if hasHeader:
-            oldFont = (self.font, self.fontSize)
-            self.setFont("Times-Bold", self.fontSize)
-            drawY = yVals[1]
-            for i in range(columns):
-                self.pdf.drawString(xVals[i] + padding, drawY + padding, headers[i])
-            self.setFont(*oldFont)
+            self.drawRow(xVals, yVals[1], headers, True)
         
         drawn = 0
         for row in range(2 if hasHeader else 1, len(yVals)):
-            drawY = yVals[row]
-            dataRow = data[row - (2 if hasHeader else 1)]
-            for i in range(columns):
-                self.pdf.drawString(xVals[i] + padding, drawY + padding, dataRow[i])
+            self.drawRow(xVals, yVals[row], data[row - (2 if hasHeader else 1)])
             drawn += 1
         self.lastLine = yVals[-1] - self.fontSize * self.lineSpace
         return drawn
+
+    # Draws every row an iterable yields, reading them one at a time.  When
+    # a page fills it is finished with nextPage, newPage (if given) draws the
+    # top of the next one, and the headers are repeated.  Returns the number
+    # of rows drawn.
+    def streamTable(self, rows, headers: list[str], widths: list[float] = None, newPage = None):
+        xVals = self.tableColumns(len(headers), widths)
+        rowHeight = self.rowHeight()
+        rows = iter(rows)
+        row = next(rows, None)
+
+        def startPage():
+            self.nextPage()
+            if not newPage == None:
+                newPage()
+
+        # the headers and the first row go on the same page
+        if floor((self.lastLine - self.bottom) / rowHeight) < (1 if row == None else 2):
+            startPage()
+        top = self.lastLine
+        self.drawRow(xVals, top - rowHeight, headers, True)
+        lines = 1
+        drawn = 0
+        while not row == None:
+            if top - (lines + 1) * rowHeight < self.bottom:
+                self.pdf.grid(xVals, [top - i * rowHeight for i in range(lines + 1)])
+                startPage()
+                top = self.lastLine
+                self.drawRow(xVals, top - rowHeight, headers, True)
+                lines = 1
+            self.drawRow(xVals, top - (lines + 1) * rowHeight, row)
+            lines += 1
+            drawn += 1
+            row = next(rows, None)
+        self.pdf.grid(xVals, [top - i * rowHeight for i in range(lines + 1)])
+        self.lastLine = top - lines * rowHeight - self.fontSize * self.lineSpace
+        return drawn
     
+    # Digest of everything method(*args) reads from the database, or None
+    # for reports that are not cached.
+    def digest(self, method, *args):
+        db = self.db
+        digest = hashlib.sha256(repr((REPORT_VERSION, method, args)).encode())
+
+        def add(record):
+            digest.update(repr(record.getTuple()).encode())
+            if not record.childTable == None:
+                digest.update(repr(record.getChildRows()).encode())
+
+        def addMixture(mix):
+            add(mix)
+            for id in mix.materialIds:
+                if id in db.byId["materials"]:
+                    add(db.byId["materials"][id])
+
+        if method in ("mixReport", "mixBook"):
+            names = [args[0]] if method == "mixReport" else args[0]
+            # a missing mixture makes no mixReport; a given analysis is not an input we can see
+            if (method == "mixReport" and not args[0] in db.mixtures) or len(args) > 1:
+                return None
+            for name in names:
+                if name in db.mixtures:
+                    addMixture(db.mixtures[name])
+            return digest.hexdigest()
+        if method == "salesReport":
+            mixIds = set()
+            for part in db.parts.values():
+                if isinstance(part.sales, int) and part.sales > 0:
+                    add(part)
+                    mixIds.add(part.mixId)
+            for id in sorted(mixIds, key = repr):
+                if id in db.byId["mixtures"]:
+                    addMixture(db.byId["mixtures"][id])
+            for item in db.packaging.values():
+                add(item)
+        elif not method == "globalsReport":
+            return None
+        digest.update(repr([getattr(db.globals, name) for name in db.globals.getGlobals()]).encode())
+        return digest.hexdigest()
+
+    # Makes the report, or copies it out of cache (a report_cache.ReportCache)
+    # when one was already made from the same inputs.
+    def run(self, method, *args, cache = None):
+        digest = None if cache == None else self.digest(method, *args)
+        if not digest == None and cache.get(digest, self.path):
+            return
+        getattr(self, method)(*args)
+        if not digest == None:
+            cache.put(digest, self.path)
+
     def globalsReport(self):
         globalKeys = self.db.globals.getGlobals()
         globalStrings = self.db.globals.getStrings()
@@ -112,69 +237,132 @@ class PDFReport:
         self.nextPage()
         self.pdf.save()
 
-    def mixReport(self, mixName):
-        if mixName in self.db.mixtures:
-            mix = self.db.mixtures[mixName]
-            self.setupPage()
-            self.drawTitle("TKG Production Report")
-            self.skipLines(2)
+    # One page per mixture; analysis must cover mixName.
+    def drawMixture(self, mixName, analysis: MixtureAnalysis):
+        self.drawMixturePage(mixturePage(self.db, mixName, analysis))
 
-            self.drawSection(f"{mixName} Mixture Composition")
-            headers = ["Material", "Weight"]
-            data = [[f"{mix.materials[i]}", f"{mix.weights[i]}"] for i in range(len(mix.materials))]
-            self.drawTable(data, headers)
-
-            self.drawTable([], ["Total", f"{mix.getBatchWeight()}"])
-
-            self.drawSection(f"{mixName} Chemical Analysis")
-            data = [
-                ("SiO2", f"{mix.getProp("SiO2"):.4f}%"),
-                ("Al2O3", f"{mix.getProp("Al2O3"):.4f}%"),
-                ("Fe2O3", f"{mix.getProp("Fe2O3"):.4f}%"),
-                ("TiO2", f"{mix.getProp("TiO2"):.4f}%"),
-                ("Li2O", f"{mix.getProp("Li2O"):.4f}%"),
-                ("P2O5", f"{mix.getProp("P2O5"):.4f}%"),
-                ("Na2O", f"{mix.getProp("Na2O"):.4f}%"),
-                ("CaO", f"{mix.getProp("CaO"):.4f}%"),
-                ("K2O", f"{mix.getProp("K2O"):.4f}%"),
-                ("MgO", f"{mix.getProp("MgO"):.4f}%")
-            ]
-            self.drawTable(data)
-
-            self.drawSection(f"{mixName} Sizing Analysis")
-            headers = ["+50", "-50+100", "-100+200", "-200+325", "-325"]
-            data = [[
-                f"{mix.getProp("Plus50", False):.1f}%",
-                f"{mix.getProp("Sub50Plus100", False):.1f}%",
-                f"{mix.getProp("Sub100Plus200", False):.1f}%",
-                f"{mix.getProp("Sub200Plus325", False):.1f}%",
-                f"{mix.getProp("Sub325", False):.1f}%"
-            ]]
-
-            self.drawTable(data, headers)
+    # Draws a page made by mixturePage, without the database.
+    def drawMixturePage(self, page):
+        mixName, components, batchWeight, chemistry, sizing = page
+        self.setupPage()
+        self.drawTitle("TKG Production Report")
+        self.skipLines(2)
 
-            self.nextPage()
+        self.drawSection(f"{mixName} Mixture Composition")
+        headers = ["Material", "Weight"]
+        self.drawTable(components, headers)
+
+        self.drawTable([], ["Total", batchWeight])
+
+        self.drawSection(f"{mixName} Chemical Analysis")
+        self.drawTable(chemistry)
+
+        self.drawSection(f"{mixName} Sizing Analysis")
+        headers = ["+50", "-50+100", "-100+200", "-200+325", "-325"]
+        self.drawTable([sizing], headers)
+
+        self.nextPage()
+
+    def mixReport(self, mixName):
+        if mixName in self.db.mixtures:
+            self.drawMixture(mixName, MixtureAnalysis(self.db, [mixName]))
             self.pdf.save()
 
+    # Every named mixture in one file, from one batched analysis.
+    def mixBook(self, mixNames, analysis: MixtureAnalysis = None):
+        mixNames = [name for name in mixNames if name in self.db.mixtures]
+        if analysis == None:
+            analysis = MixtureAnalysis(self.db, mixNames)
+        for mixName in mixNames:
+            self.drawMixture(mixName, analysis)
+        self.pdf.save()
+
     def salesReport(self):
-        parts = [self.db.parts[name] for name in self.db.parts.keys() if isinstance(self.db.parts[name].sales, int) and self.db.parts[name].sales > 0]
-        data = []
         total = 0
-        for part in parts:
-            data.append([f"{part.name}", f"${part.getManufacturingCost():.4f}", f"{part.sales}", f"${part.sales * part.getManufacturingCost():.2f}"])
-            total += part.sales * part.getManufacturingCost()
-        while len(data) > 0:
-            self.setupPage()
+
+        def rows():
+            nonlocal total
+            sold = (part for part in self.db.parts.values() if isinstance(part.sales, int) and part.sales > 0)
+            for parts in chunks(sold):
+                costs = CostTable(self.db, [part.name for part in parts])["manufacturingCost"].tolist()
+                for part, cost in zip(parts, costs):
+                    total += part.sales * cost
+                    yield [f"{part.name}", f"${cost:.4f}", f"{part.sales}", f"${part.sales * cost:.2f}"]
+
+        def header(section):
             self.drawTitle("TKG Production Report")
             self.skipLines(2)
+            self.drawSection(section)
 
-            self.drawSection("Cost Analysis Report" if len(data) == len(parts) else "Sales (cont.)")
-            headers = ["Part", "Manufacturing Cost", "Sales", "COGS"]
-            drawn = self.drawTable(data, headers)
-
-            if drawn == len(data):
-                self.drawTable([], ["Total", "---", "---", f"${total:.2f}"])
-            
-            data = data[drawn:]
+        data = rows()
+        first = next(data, None)
+        # with nothing sold there is no table, and no total, to draw
+        if not first == None:
+            self.setupPage()
+            header("Cost Analysis Report")
+            self.streamTable(chain([first], data), ["Part", "Manufacturing Cost", "Sales", "COGS"], newPage = lambda: header("Sales (cont.)"))
+            self.streamTable([], ["Total", "---", "---", f"${total:.2f}"], newPage = lambda: header("Sales (cont.)"))
             self.nextPage()
-        self.pdf.save()
\ No newline at end of file
+        self.pdf.save()
+
+def mixFileName(mixName):
+    return re.sub(r'[\\/:*?"<>|]', "_", str(mixName)) + ".pdf"
+
+# The text of a mixture's report page: (name, [material, weight] rows,
+# batch weight, [property, value] chemistry rows, sizing row).  It is all a
+# worker of mixZip needs to draw the page.
+def mixturePage(db: Database, mixName, analysis: MixtureAnalysis):
+    mix = db.mixtures[mixName]
+    components = [[f"{mix.materials[i]}", f"{mix.weights[i]}"] for i in range(len(mix.materials))]
+    chemistry = [(prop, analysis.format(mixName, prop, spec="{:.4f}%")) for prop in MixtureAnalysis.chemistry]
+    sizing = [analysis.format(mixName, prop, False, "{:.1f}%") for prop in MixtureAnalysis.sizing]
+    return (mixName, components, f"{mix.getBatchWeight()}", chemistry, sizing)
+
+# Runs in a worker process of mixZip.
+def renderMixtures(pages):
+    res = []
+    for page in pages:
+        buffer = io.BytesIO()
+        pdf = PDFReport(None, buffer)
+        pdf.drawMixturePage(page)
+        pdf.pdf.save()
+        res.append((page[0], buffer.getvalue()))
+    return res
+
+# One PDF per mixture, rendered MIX_CHUNK mixtures per task across worker
+# processes and collected into a zip at path.  progress and cancelled work
+# as for PDFReport, counting mixtures instead of pages.
+def mixZip(db: Database, path, mixNames, progress = None, cancelled = None, workers = None):
+    mixNames = [name for name in mixNames if name in db.mixtures]
+    analysis = MixtureAnalysis(db, mixNames)
+    done = 0
+    stopped = False
+    # not forked: this runs next to the GUI's threads
+    with ProcessPoolExecutor(workers, mp_context = multiprocessing.get_context("spawn")) as pool:
+        # only the text of each page goes to the workers, not the database
+        jobs = [pool.submit(renderMixtures, [mixturePage(db, name, analysis) for name in mixNames[i:i + MIX_CHUNK]]) for i in range(0, len(mixNames), MIX_CHUNK)]
+        try:
+            with zipfile.ZipFile(path + ".tmp", "w") as book:
+                for job in jobs:
+                    if not cancelled == None and cancelled():
+                        stopped = True
+                        for pending in jobs:
+                            pending.cancel()
+                        break
+                    for mixName, data in job.result():
+                        book.writestr(mixFileName(mixName), data)
+                    done += MIX_CHUNK
+                    if not progress == None:
+                        progress(min(done, len(mixNames)))
+        except Exception:
+            # a worker that crashed or a page that could not be sent leaves
+            # no half-written zip behind
+            for pending in jobs:
+                pending.cancel()
+            if os.path.exists(path + ".tmp"):
+                os.remove(path + ".tmp")
+            raise
+    if stopped:
+        os.remove(path + ".tmp")
+        raise ReportCancelled()
+    os.replace(path + ".tmp", path)
@@ -0,0 +1,60 @@
+import os
+import shutil
+
+CACHE_DIR = os.path.join(os.path.expanduser("~"), ".tkg_report_cache")
+CACHE_BYTES = 256 * 2**20
+CACHE_FILES = 1000
+
+# Finished reports kept on disk by the digest of their inputs (see
+# PDFReport.digest).  A file's modification time is its last use, and the
+# least recently used files are removed once the directory holds more than
+# maxFiles files or maxBytes bytes.
+class ReportCache:
+    def __init__(self, directory = CACHE_DIR, maxBytes = CACHE_BYTES, maxFiles = CACHE_FILES) -> None:
+        self.directory = directory
+        self.maxBytes = maxBytes
+        self.maxFiles = maxFiles
+
+    def entry(self, digest):
+        return os.path.join(self.directory, digest + ".pdf")
+
+    # Copies the cached report to path; False if there is none.
+    def get(self, digest, path):
+        entry = self.entry(digest)
+        try:
+            shutil.copyfile(entry, path)
+            os.utime(entry)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def put(self, digest, path):
+        entry = self.entry(digest)
+        try:
+            os.makedirs(self.directory, exist_ok = True)
+            shutil.copyfile(path, entry + ".tmp")
+            os.replace(entry + ".tmp", entry)
+        except OSError as e:
+            print(f"Could not cache {path}: {repr(e)}")
+            return
+        self.evict()
+
+    def evict(self):
+        entries = []
+        with os.scandir(self.directory) as files:
+            for file in files:
+                if file.name.endswith(".pdf"):
+                    stat = file.stat()
+                    entries.append((stat.st_mtime_ns, stat.st_size, file.path))
+        entries.sort()
+        total = sum(size for time, size, path in entries)
+        count = len(entries)
+        for time, size, path in entries:
+            if total <= self.maxBytes and count <= self.maxFiles:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            count -= 1
@@ -0,0 +1,138 @@
+from PySide6.QtCore import QObject, QThread, Signal
+from collections import deque
+
+from records import Database
+from report_cache import ReportCache
+
+# The records a report reads, or None when it is not known.  Only those
+# (and what they refer to) are copied for the worker, so queueing a report
+# about a few mixtures does not copy, or on a lazy database read, every
+# part.
+def reportRecords(db: Database, method, args):
+    name = getattr(method, "__name__", method)
+    if name == "globalsReport":
+        return []
+    if name in ("mixReport", "mixBook", "mixZip"):
+        names = [args[0]] if isinstance(args[0], str) else args[0]
+        return [db.mixtures[name] for name in names if name in db.mixtures]
+    if name == "salesReport":
+        return [part for part in db.parts.values() if isinstance(part.sales, int) and part.sales > 0]
+    return None
+
+# What the progress of a report counts.
+def reportUnit(method):
+    return "mixtures" if getattr(method, "__name__", method) == "mixZip" else "pages"
+
+# One PDFReport method call, or a call of a report function taking
+# (db, path, *args, progress, cancelled), made on a copy of what it reads
+# from the database taken when the report was queued.
+class ReportJob:
+    def __init__(self, title, path, db: Database, method, args) -> None:
+        self.title = title
+        self.path = path
+        self.db = db
+        self.method = method
+        self.args = args
+        self.cancelled = False
+
+class ReportWorker(QThread):
+    progress = Signal(int)
+    done = Signal(str)
+
+    def __init__(self, job: ReportJob, cache: ReportCache = None) -> None:
+        super().__init__()
+        self.job = job
+        self.cache = cache
+
+    def run(self):
+        # imported here so that reportlab loads with the first report, not the window
+        try:
+            from report import PDFReport, ReportCancelled
+        except ImportError as e:
+            print(f"Report error: {repr(e)}")
+            self.done.emit("failed")
+            return
+        cancelled = lambda: self.job.cancelled
+        try:
+            if callable(self.job.method):
+                self.job.method(self.job.db, self.job.path, *self.job.args, progress = self.progress.emit, cancelled = cancelled)
+            else:
+                pdf = PDFReport(self.job.db, self.job.path, progress = self.progress.emit, cancelled = cancelled)
+                pdf.run(self.job.method, *self.job.args, cache = self.cache)
+            result = "done"
+        except ReportCancelled:
+            result = "cancelled"
+        except Exception as e:
+            print(f"Report error: {repr(e)}")
+            result = "failed"
+        self.done.emit(result)
+
+# Runs queued reports one at a time on a ReportWorker thread, reusing
+# unchanged ones from cache.  changed
+# fires whenever status() changes; finished(path, result) once per report,
+# with result "done", "cancelled" or "failed".
+class ReportQueue(QObject):
+    changed = Signal()
+    finished = Signal(str, str)
+
+    def __init__(self, parent = None, cache: ReportCache = None) -> None:
+        super().__init__(parent)
+        self.cache = ReportCache() if cache == None else cache
+        self.pending: deque[ReportJob] = deque()
+        self.job: ReportJob = None
+        self.worker: ReportWorker = None
+        self.page = 0
+
+    def add(self, title, path, db: Database, method, *args):
+        self.pending.append(ReportJob(title, path, db.snapshot(reportRecords(db, method, args)), method, args))
+        self.startNext()
+        self.changed.emit()
+
+    def startNext(self):
+        if not self.worker == None or len(self.pending) == 0:
+            return
+        self.job = self.pending.popleft()
+        self.page = 0
+        self.worker = ReportWorker(self.job, self.cache)
+        self.worker.progress.connect(self.showPage)
+        self.worker.done.connect(self.jobDone)
+        self.worker.start()
+
+    def showPage(self, page):
+        self.page = page
+        self.changed.emit()
+
+    def jobDone(self, result):
+        self.worker.wait()
+        job = self.job
+        self.worker = None
+        self.job = None
+        self.finished.emit(job.path, result)
+        self.startNext()
+        self.changed.emit()
+
+    def busy(self):
+        return not self.job == None
+
+    def cancel(self):
+        if not self.job == None:
+            self.job.cancelled = True
+
+    def cancelAll(self):
+        self.pending.clear()
+        self.cancel()
+        self.changed.emit()
+
+    # stops everything before the window goes away
+    def stop(self):
+        self.cancelAll()
+        if not self.worker == None:
+            self.worker.wait()
+
+    def status(self):
+        if self.job == None:
+            return ""
+        res = f"{self.job.title}: {self.page} {reportUnit(self.job.method)}"
+        if len(self.pending) > 0:
+            res += f" ({len(self.pending)} more queued)"
+        return res
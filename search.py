@@ -0,0 +1,170 @@
+import re
+import numpy as np
+
+# "column < value" terms of a query, like "GM < 20%", "weight > 5 lbs" or
+# "price <= $2.50"
+COMPARISON = re.compile(r"([A-Za-z]\w*)\s*(<=|>=|<|>|=)\s*\$?\s*(-?(?:\d+(?:\.\d*)?|\.\d+))\s*(%|lbs?\b|\$)?", re.IGNORECASE)
+# records changed since the index was built before it is built again
+REBUILD_AFTER = 1000
+
+def trigrams(text):
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+# Words (matched as substrings, ignoring case) and (column, op, value,
+# percent) comparisons of a query.
+def parseQuery(text):
+    comparisons = [(match.group(1).lower(), match.group(2), float(match.group(3)), match.group(4) == "%") for match in COMPARISON.finditer(text)]
+    words = COMPARISON.sub(" ", text).lower().split()
+    return words, comparisons
+
+def compare(values, op, value):
+    with np.errstate(invalid="ignore"):
+        if op == "<":
+            return values < value
+        if op == "<=":
+            return values <= value
+        if op == ">":
+            return values > value
+        if op == ">=":
+            return values >= value
+        return values == value
+
+# Finds the records of a table that match a query.  Every word has to be a
+# substring of one of the record's terms (its name and the names it refers
+# to), looked up through a trigram index over the distinct terms; every
+# comparison is answered from the column's values sorted once.
+#
+# names() lists the records, terms(name) gives a record's terms and
+# numbers maps a column to (values(names) -> array, fraction), fraction
+# meaning the column holds fractions that queries give in percent.
+# Records reported through changed() or removed() are checked one by one
+# until there are enough of them to build the index again.
+class SearchIndex:
+    def __init__(self, names, terms, numbers: dict) -> None:
+        self.listNames = names
+        self.terms = terms
+        self.numbers = numbers
+        self.build()
+
+    def build(self):
+        self.names = list(self.listNames())
+        self.nameArray = np.array(self.names, dtype=object)
+        # name -> still there, for the records changed since the build
+        self.dirty: dict[str, bool] = {}
+        rowTerms = [[str(term).lower() for term in self.terms(name) if not term == None] for name in self.names]
+        vocab: dict[str, int] = {}
+        termIds = np.array([vocab.setdefault(term, len(vocab)) for terms in rowTerms for term in terms], dtype=np.int64)
+        termRows = np.repeat(np.arange(len(self.names)), [len(terms) for terms in rowTerms])
+        self.vocab = list(vocab)
+
+        # rows of every term, one after another
+        order = np.argsort(termIds, kind="stable")
+        self.termRows = termRows[order]
+        self.termStart = np.searchsorted(termIds[order], np.arange(len(self.vocab) + 1))
+
+        # terms of every trigram
+        grams = np.array([term[i:i + 3] for term in self.vocab for i in range(len(term) - 2)], dtype="U3")
+        gramTerms = np.repeat(np.arange(len(self.vocab)), [max(len(term) - 2, 0) for term in self.vocab])
+        keys, inverse = np.unique(grams, return_inverse=True)
+        width = max(len(self.vocab), 1)
+        pairs = np.sort(inverse.astype(np.int64) * width + gramTerms)
+        pairs = pairs[np.diff(pairs, prepend=-1) != 0]
+        starts = np.searchsorted(pairs // width, np.arange(len(keys) + 1))
+        ids = pairs % width
+        self.grams = {str(gram): ids[starts[i]:starts[i + 1]] for i, gram in enumerate(keys)}
+
+        self.valuesChanged()
+
+    # Drops the sorted columns, e.g. after a global changed every cost.
+    def valuesChanged(self):
+        self.sorted: dict[str, tuple[np.ndarray, np.ndarray, int]] = {}
+
+    def changed(self, names):
+        for name in names:
+            self.dirty[name] = True
+
+    def removed(self, names):
+        for name in names:
+            self.dirty[name] = False
+
+    def column(self, column):
+        if not column in self.numbers:
+            raise ValueError(f"Unknown column '{column}' (one of {", ".join(self.numbers)})")
+        if not column in self.sorted:
+            values = np.asarray(self.numbers[column][0](self.names), dtype=float)
+            order = np.argsort(values)
+            self.sorted[column] = (values[order], order, int(np.count_nonzero(~np.isnan(values))))
+        return self.sorted[column]
+
+    def matchingTerms(self, word):
+        if len(word) < 3:
+            return np.array([id for id, term in enumerate(self.vocab) if word in term], dtype=np.int64)
+        postings = sorted((self.grams.get(gram) for gram in trigrams(word)), key=lambda ids: 0 if ids is None else len(ids))
+        if postings[0] is None:
+            return np.zeros(0, dtype=np.int64)
+        ids = postings[0]
+        for other in postings[1:]:
+            ids = np.intersect1d(ids, other, assume_unique=True)
+        return np.array([id for id in ids.tolist() if word in self.vocab[id]], dtype=np.int64)
+
+    def wordMask(self, word):
+        ids = self.matchingTerms(word)
+        starts = self.termStart[ids]
+        lengths = self.termStart[ids + 1] - starts
+        offsets = np.repeat(starts - (np.cumsum(lengths) - lengths), lengths)
+        mask = np.zeros(len(self.names), dtype=bool)
+        mask[self.termRows[offsets + np.arange(lengths.sum())]] = True
+        return mask
+
+    def rangeMask(self, column, op, value):
+        values, order, count = self.column(column)
+        if op == "<":
+            rows = order[:np.searchsorted(values[:count], value, "left")]
+        elif op == "<=":
+            rows = order[:np.searchsorted(values[:count], value, "right")]
+        elif op == ">":
+            rows = order[np.searchsorted(values[:count], value, "right"):count]
+        elif op == ">=":
+            rows = order[np.searchsorted(values[:count], value, "left"):count]
+        else:
+            rows = order[np.searchsorted(values[:count], value, "left"):np.searchsorted(values[:count], value, "right")]
+        mask = np.zeros(len(self.names), dtype=bool)
+        mask[rows] = True
+        return mask
+
+    def matches(self, name, words, comparisons):
+        terms = [str(term).lower() for term in self.terms(name) if not term == None]
+        for word in words:
+            if not any(word in term for term in terms):
+                return False
+        for column, op, value in comparisons:
+            if not bool(compare(np.asarray(self.numbers[column][0]([name]), dtype=float), op, value)[0]):
+                return False
+        return True
+
+    # Names of the matching records in the order names() lists them, or
+    # None for a query with no terms.  Raises ValueError for a comparison
+    # on an unknown column.
+    def search(self, text) -> list[str]:
+        words, comparisons = parseQuery(text)
+        if len(words) == 0 and len(comparisons) == 0:
+            return None
+        if len(self.dirty) > REBUILD_AFTER:
+            self.build()
+        checks = []
+        for column, op, value, percent in comparisons:
+            self.column(column)
+            checks.append((column, op, value / 100 if percent and self.numbers[column][1] else value))
+
+        mask = np.ones(len(self.names), dtype=bool)
+        for word in words:
+            mask &= self.wordMask(word)
+        for column, op, value in checks:
+            mask &= self.rangeMask(column, op, value)
+        res = self.nameArray[mask].tolist()
+        if len(self.dirty) > 0:
+            # changed records are checked on their own, and may have moved
+            found = set(res).difference(self.dirty)
+            found.update(name for name, exists in self.dirty.items() if exists and self.matches(name, words, checks))
+            res = [name for name in self.listNames() if name in found]
+        return res
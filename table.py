@@ -1,28 +1,56 @@
-from PySide6.QtCore import QAbstractTableModel, QItemSelection, Qt
-from PySide6.QtWidgets import QTableView, QWidget
+from PySide6.QtCore import QAbstractTableModel, QEvent, QItemSelection, QModelIndex, Qt
+from PySide6.QtWidgets import QTableView, QWidget, QHBoxLayout, QLabel, QLineEdit
+from bisect import bisect_left
 
+# rows handed to the view per fetchMore
+FETCH_ROWS = 2000
+
+# [(first, last)] runs of consecutive numbers in sorted rows
+def blocks(rows):
+    res = []
+    for row in rows:
+        if len(res) > 0 and res[-1][1] == row - 1:
+            res[-1] = (res[-1][0], row)
+        else:
+            res.append((row, row))
+    return res
+
+# One row per record name, in the order of key(name).  Nothing is
+# formatted up front: data() asks cell(name, column) for the text of the
+# cells the view actually shows.  The view is given FETCH_ROWS rows at a
+# time through fetchMore.
 class DBTableModel(QAbstractTableModel):
-    def __init__(self, data, headers):
+    def __init__(self, names, headers, cell, key = None):
         super(DBTableModel, self).__init__()
-        self._data = data
+        self.names = list(names)
         self.headers = headers
+        self.cell = cell
+        self.key = key
+        self.loaded = min(len(self.names), FETCH_ROWS)
+        # name -> row, rebuilt on first use after rows move
+        self.positions = None
 
     def data(self, index, role):
         if role == Qt.DisplayRole:
-            # See below for the nested-list data structure.
-            # .row() indexes into the outer list,
-            # .column() indexes into the sub-list
-            return self._data[index.row()][index.column()]
-
-    def rowCount(self, index):
-        # The length of the outer list.
-        return len(self._data)
-
-    def columnCount(self, index):
-        # The following takes the first sub-list, and returns
-        # the length (only works if all rows are an equal length)
+            return self.cell(self.names[index.row()], index.column())
+
+    def rowCount(self, index = None):
+        # rows fetched so far, not every name
+        return self.loaded
+
+    def columnCount(self, index = None):
         return len(self.headers)
-    
+
+    def canFetchMore(self, parent):
+        return self.loaded < len(self.names)
+
+    def fetchMore(self, parent):
+        count = min(FETCH_ROWS, len(self.names) - self.loaded)
+        if count > 0:
+            self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + count - 1)
+            self.loaded += count
+            self.endInsertRows()
+
     def headerData(self, section, orientation, role):
         # section is the index of the column/row.
         if role == Qt.DisplayRole:
@@ -31,28 +59,288 @@ class DBTableModel(QAbstractTableModel):
 
             if orientation == Qt.Vertical:
                 return str(section)
-    
-    def setData(self, data):
+
+    def row(self, name):
+        if self.positions == None:
+            self.positions = {name: i for i, name in enumerate(self.names)}
+        return self.positions.get(name)
+
+    # Redraws the shown cells of the named rows.
+    def changedNames(self, names):
+        rows = sorted(row for row in (self.row(name) for name in names) if not row == None and row < self.loaded)
+        for first, last in blocks(rows):
+            self.dataChanged.emit(self.index(first, 0), self.index(last, len(self.headers) - 1))
+
+    def changedAll(self):
+        if self.loaded > 0:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.loaded - 1, len(self.headers) - 1))
+
+    # Adds a row where key puts it.  Rows past the fetched ones stay
+    # unfetched.
+    def insertName(self, name):
+        if not self.row(name) == None:
+            return
+        row = bisect_left(self.names, self.key(name), key = self.key)
+        shown = row < self.loaded or self.loaded == len(self.names)
+        if shown:
+            self.beginInsertRows(QModelIndex(), row, row)
+        self.names.insert(row, name)
+        self.positions = None
+        if shown:
+            self.loaded += 1
+            self.endInsertRows()
+
+    def removeName(self, name):
+        row = self.row(name)
+        if row == None:
+            return
+        shown = row < self.loaded
+        if shown:
+            self.beginRemoveRows(QModelIndex(), row, row)
+        del self.names[row]
+        self.positions = None
+        if shown:
+            self.loaded -= 1
+            self.endRemoveRows()
+
+    # Moves a row whose key changed to where it now belongs.
+    def placeName(self, name):
+        row = self.row(name)
+        if row == None:
+            return
+        key = self.key(name)
+        if (row == 0 or self.key(self.names[row - 1]) <= key) and (row == len(self.names) - 1 or key <= self.key(self.names[row + 1])):
+            return
+        rest = self.names[:row] + self.names[row + 1:]
+        to = bisect_left(rest, key, key = self.key)
+        if row < self.loaded and to < self.loaded:
+            self.beginMoveRows(QModelIndex(), row, row, QModelIndex(), to if to < row else to + 1)
+        elif row < self.loaded:
+            self.beginRemoveRows(QModelIndex(), row, row)
+        elif to < self.loaded:
+            self.beginInsertRows(QModelIndex(), to, to)
+        rest.insert(to, name)
+        self.names = rest
+        self.positions = None
+        if row < self.loaded and to < self.loaded:
+            self.endMoveRows()
+        elif row < self.loaded:
+            self.loaded -= 1
+            self.endRemoveRows()
+        elif to < self.loaded:
+            self.loaded += 1
+            self.endInsertRows()
+
+    # Follows an event (see changes.py) about the listed records, given the
+    # database collection they live in.  Returns the names whose cells need
+    # recomputing, or None when records were renamed and the list has to be
+    # rebuilt with setNames.
+    def follow(self, event, records):
+        if event.action == "removed":
+            for name in event.names:
+                self.removeName(name)
+            return []
+        if "name" in event.fields:
+            return None
+        names = [name for name in event.names if name in records]
+        for name in names:
+            if self.row(name) == None:
+                self.insertName(name)
+            else:
+                self.placeName(name)
+        return names
+
+    # Moves the model to names without a reset, so the view keeps its
+    # scroll position and selection: rows that went away are removed, new
+    # ones are appended, the rest are moved into the new order with a
+    # layout change, and every shown cell is asked for again.
+    def setNames(self, names):
+        positions = {name: i for i, name in enumerate(names)}
+        old = set(self.names)
+
+        gone = [i for i, name in enumerate(self.names) if not name in positions]
+        for first, last in reversed(blocks(gone)):
+            shown = min(last, self.loaded - 1)
+            if first <= shown:
+                self.beginRemoveRows(QModelIndex(), first, shown)
+            del self.names[first:last + 1]
+            if first <= shown:
+                self.loaded -= shown - first + 1
+                self.endRemoveRows()
+
+        added = [name for name in names if not name in old]
+        shown = 0
+        if self.loaded == len(self.names):
+            shown = len(added) if len(added) <= FETCH_ROWS else max(0, FETCH_ROWS - self.loaded)
+        if shown > 0:
+            self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + shown - 1)
+        self.names.extend(added)
+        if shown > 0:
+            self.loaded += shown
+            self.endInsertRows()
+
+        if not self.names == names:
+            # rows the view holds on to must still be fetched in the new order
+            needed = max([positions[self.names[index.row()]] + 1 for index in self.persistentIndexList()], default = 0)
+            if needed > self.loaded:
+                self.beginInsertRows(QModelIndex(), self.loaded, needed - 1)
+                self.loaded = needed
+                self.endInsertRows()
+            self.layoutAboutToBeChanged.emit()
+            persistent = self.persistentIndexList()
+            self.changePersistentIndexList(persistent, [self.index(positions[self.names[index.row()]], index.column()) for index in persistent])
+            self.names = list(names)
+            self.layoutChanged.emit()
+        self.positions = None
+
+        if self.loaded > 0:
+            self.dataChanged.emit(self.index(0, 0), self.index(self.loaded - 1, len(self.headers) - 1))
+
+# The rows of a DBTableModel that a search matched, with the same cells.
+# The view shows it in place of the full model while a search is on.
+class FilterProxyModel(DBTableModel):
+    def __init__(self, source: DBTableModel, matches):
+        super(FilterProxyModel, self).__init__([], source.headers, source.cell, source.key)
+        self.source = source
+        self.filter(matches)
+
+    # Shows the matches of a new query, in the order of the source.  Nothing
+    # of the last query's rows is worth keeping, so they are replaced in one
+    # reset.
+    def filter(self, matches):
         self.beginResetModel()
-        self._data = data
+        self.names = list(matches)
+        self.loaded = min(len(self.names), FETCH_ROWS)
+        self.positions = None
         self.endResetModel()
 
+    # Shows the matches of the same query after the database changed.
+    def refilter(self, matches):
+        self.setNames(matches)
+
 class DBTable(QTableView):
-    def __init__(self, data, headers) -> None:
+    def __init__(self, names, headers, cell, key = None) -> None:
         super().__init__()
         self.parentTab = None
-        self.dbModel = DBTableModel(data, headers)
-        self.setModel(self.dbModel)
+        self.dbModel = DBTableModel(names, headers, cell, key)
+        self.filterModel = None
+        self.selector = None
+        self.useModel(self.dbModel)
+
+    def useModel(self, model):
+        if self.model() is model:
+            return
+        self.setModel(model)
+        if not self.selector == None:
+            self.selector.deleteLater()
+            if not self.parentTab == None:
+                self.parentTab.setSelection([])
         self.selector = self.selectionModel()
         self.selector.selectionChanged.connect(self.onSelect)
-    
-    def setData(self, data):
-        self.dbModel.setData(data)
-    
+
+    def setData(self, names):
+        self.dbModel.setNames(names)
+
+    # Shows only the matching names, or every row for None.
+    def setFilter(self, matches):
+        if matches == None:
+            self.filterModel = None
+            self.useModel(self.dbModel)
+        elif self.filterModel == None:
+            self.filterModel = FilterProxyModel(self.dbModel, matches)
+            self.useModel(self.filterModel)
+        else:
+            self.filterModel.filter(matches)
+
     def onSelect(self, selected: QItemSelection, deselected):
         selection = []
         for ind in selected.indexes():
             row = ind.row()
-            selection.append(self.dbModel._data[row][0])
+            selection.append(self.model().names[row])
         if not self.parentTab == None:
-            self.parentTab.setSelection(list(dict.fromkeys(selection)))
\ No newline at end of file
+            self.parentTab.setSelection(list(dict.fromkeys(selection)))
+
+# Search box over a DBTable (see search.py for what a query can say).  The
+# index is built by makeIndex() when the box first gets focus, so typing
+# only queries it; the owning tab reports database changes through
+# changed(), valuesChanged() and reset().
+class SearchBar(QWidget):
+    def __init__(self, table: DBTable, makeIndex) -> None:
+        super().__init__()
+        self.table = table
+        self.makeIndex = makeIndex
+        self.index = None
+
+        self.edit = QLineEdit()
+        self.edit.setPlaceholderText("Search names, or filter columns: weight > 5 lbs, GM < 20%")
+        self.edit.setClearButtonEnabled(True)
+        self.edit.installEventFilter(self)
+        self.edit.textChanged.connect(self.search)
+        self.count = QLabel("")
+
+        layout = QHBoxLayout()
+        layout.setContentsMargins(0, 0, 0, 0)
+        layout.addWidget(self.edit)
+        layout.addWidget(self.count)
+        self.setLayout(layout)
+
+    def eventFilter(self, watched, event):
+        if event.type() == QEvent.FocusIn and self.index == None:
+            self.index = self.makeIndex()
+        return False
+
+    def matches(self):
+        if self.index == None:
+            self.index = self.makeIndex()
+        return self.index.search(self.edit.text())
+
+    def showCount(self):
+        if self.table.filterModel == None:
+            self.count.setText("")
+        else:
+            self.count.setText(f"{len(self.table.filterModel.names)} of {len(self.table.dbModel.names)}")
+
+    # A query naming an unknown column leaves the rows of the last one.
+    def search(self):
+        try:
+            matches = self.matches()
+        except ValueError as e:
+            self.count.setText(str(e))
+            return
+        self.table.setFilter(matches)
+        self.showCount()
+
+    # Runs the query again once the table model has followed a change.
+    def refilter(self):
+        if self.table.filterModel == None:
+            return
+        try:
+            matches = self.matches()
+        except ValueError:
+            return
+        if matches == None:
+            self.table.setFilter(None)
+        else:
+            self.table.filterModel.refilter(matches)
+        self.showCount()
+
+    # Records added or changed, and records removed.
+    def changed(self, names, removed = ()):
+        if self.index == None:
+            return
+        self.index.changed(names)
+        self.index.removed(removed)
+        self.refilter()
+
+    # Numbers of every record changed, their names did not.
+    def valuesChanged(self):
+        if self.index == None:
+            return
+        self.index.valuesChanged()
+        self.refilter()
+
+    def reset(self):
+        if self.index == None:
+            return
+        self.index = None
+        self.refilter()
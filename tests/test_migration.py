@@ -0,0 +1,68 @@
+import math
+import os
+import sqlite3
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from file_manager import FileManager, listToString, SCHEMA_VERSION
+from cost_table import CostTable
+
+class App:
+    pass
+
+# A file as version 0 wrote it, names and all.  The importer keeps
+# materials it does not know on their mixtures, so "Grog" has no row; the
+# part "Tile" names a mixture and a pad that are gone as well.
+def writeVersion0(path):
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE globals(name PRIMARY KEY, value)")
+    conn.execute("CREATE TABLE materials(name PRIMARY KEY, cost, freight, SiO2, Al2O3, Fe2O3, TiO2, Li2O, P2O5, Na2O, CaO, K2O, MgO, LOI, Plus50, Sub50Plus100, Sub100Plus200, Sub200Plus325, Sub325)")
+    conn.execute("CREATE TABLE mixtures(name PRIMARY KEY, materials, weights)")
+    conn.execute("CREATE TABLE packaging(name PRIMARY KEY, kind, cost)")
+    conn.execute("CREATE TABLE parts(name PRIMARY KEY, weight, mix, pressing, turning, loading, unloading, inspection, greenScrap, fireScrap, box, piecesPerBox, pallet, boxesPerPallet, pad, padsPerBox, misc, price, sales)")
+    conn.execute("INSERT INTO materials VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", ("Clay", 0.5, 0.1, *([1.0] * 16)))
+    conn.execute("INSERT INTO mixtures VALUES (?, ?, ?)", ("Mix", listToString(["Clay", "Grog"], str), listToString([60.0, 40.0], float)))
+    conn.execute("INSERT INTO mixtures VALUES (?, ?, ?)", ("Plain", listToString(["Clay"], str), listToString([1.0], float)))
+    for name, kind, cost in [("Box", "box", 1.0), ("Pallet", "pallet", 10.0), ("Pad", "pad", 0.1)]:
+        conn.execute("INSERT INTO packaging VALUES (?, ?, ?)", (name, kind, cost))
+    part = "INSERT INTO parts VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+    conn.execute(part, ("Brick", 2.0, "Mix", 100, 20, 0, 0, 0, 0, 0.02, "Box", 10, "Pallet", 20, listToString(["Pad"], str), listToString([1], int), "", 3.0, 100))
+    conn.execute(part, ("Tile", 1.0, "Gone", 100, 20, 0, 0, 0, 0, 0.02, "Box", 10, "Pallet", 20, listToString(["Pad", "Felt"], str), listToString([1, 2], int), "", 2.0, 50))
+    conn.execute(part, ("Block", 3.0, "Plain", 100, 20, 0, 0, 0, 0, 0.02, "Box", 10, "Pallet", 20, listToString(["Pad"], str), listToString([1], int), "", 4.0, 10))
+    conn.commit()
+    conn.close()
+
+def load(path):
+    app = App()
+    fm = FileManager(app)
+    assert fm.setFile(path)
+    fm.loadFile()
+    return app.db, fm
+
+def test_version0_dangling_references(tmp_path):
+    path = str(tmp_path / "old.db")
+    writeVersion0(path)
+    db, fm = load(path)
+    assert fm.dbFile.execute("PRAGMA user_version").fetchone()[0] == SCHEMA_VERSION
+
+    mix = db.mixtures["Mix"]
+    assert mix.materials == ["Clay", "Grog"]
+    assert mix.materialIds[0] == db.materials["Clay"].id and mix.materialIds[1] == "Grog"
+    tile = db.parts["Tile"]
+    assert tile.mix == "Gone" and tile.box == "Box"
+    assert tile.pad == ["Pad", "Felt"] and tile.padsPerBox == [1, 2]
+
+    costs = CostTable(db)
+    assert math.isnan(costs.get("Brick", "mixCost"))
+    assert math.isnan(costs.get("Tile", "mixCost"))
+    assert math.isnan(costs.get("Tile", "packagingCost"))
+    assert not math.isnan(costs.get("Brick", "packagingCost"))
+    assert not math.isnan(costs.get("Block", "totalCost"))
+    fm.close()
+
+    # the migrated file opens again with the names still there
+    db, fm = load(path)
+    assert db.mixtures["Mix"].materials == ["Clay", "Grog"]
+    assert db.parts["Tile"].pad == ["Pad", "Felt"]
+    fm.close()
@@ -1,5 +1,5 @@
 from PySide6.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QComboBox, QFrame
-import base64, os, sys
+import os, sys
 
 def getComboBox(items: list[str], item):
     box = QComboBox()
@@ -45,24 +45,6 @@ def checkInput(raw, type, range, errors, name = "input"):
         errors.append(f"Bug: {name} is unknown range '{range}'")
     return res
 
-def listToString(data, kind):
-    encodings = []
-    for val in data:
-        assert(isinstance(val, kind))
-        enc = base64.urlsafe_b64encode(str(val).encode("utf-8")).decode("utf-8")
-        encodings.append(enc)
-    return "#".join(encodings)
-
-def stringToList(string: str, kind):
-    data = []
-    if string == "":
-        return list()
-    encodings = string.split("#")
-    for enc in encodings:
-        val = kind(base64.urlsafe_b64decode(enc.encode("utf-8")).decode("utf-8"))
-        data.append(val)
-    return data
-
 def newHLine(width):
     hline = QFrame()
     hline.setFrameShape(QFrame.HLine)